@@ -0,0 +1,106 @@
+import time
+from collections import deque
+from typing import Optional
+
+from pygame.rect import Rect
+from pygame.surface import Surface
+
+
+class Animation:
+    """
+    Something that plays out over several frames.  Once it's added to a Timeline, the timeline calls
+    update and then paint on every frame until update returns False, and then calls finish.
+    """
+
+    # Whether input has to wait until this animation is done.  Moving balls do; lifting a selection doesn't.
+    blocksInput: bool = True
+
+    def __init__(self, duration: float):
+        self.duration = duration
+        self.startTime = 0.0
+        self.isFinished = False
+        self.followUp: Optional[Animation] = None
+
+    def then(self, animation: 'Animation') -> 'Animation':
+        """
+        Makes the given animation start as soon as this one finishes, and returns it so calls can be chained.
+        """
+        self.followUp = animation
+        return animation
+
+    def progress(self, now: float) -> float:
+        if self.duration <= 0:
+            return 1
+        return min(1, (now - self.startTime) / self.duration)
+
+    def begin(self, now: float) -> None:
+        self.startTime = now
+
+    def update(self, now: float) -> bool:
+        """
+        Advances the animation to the given time and returns False once it is over.
+        """
+        return self.progress(now) < 1
+
+    def paint(self, window: Surface) -> list[Rect]:
+        """
+        Draws the current frame over the tubes and returns the areas it drew on.
+        """
+        return []
+
+    def finish(self) -> None:
+        pass
+
+
+class Timeline:
+    """
+    The animations that are currently playing.  Any number can run at once; the game loop drives them by
+    calling update and paint once per frame.
+    """
+
+    def __init__(self):
+        self.__animations: deque[Animation] = deque()
+
+    def add(self, animation: Animation, now: Optional[float] = None) -> None:
+        animation.begin(time.time() if now is None else now)
+        self.__animations.append(animation)
+
+    def remove(self, animation: Animation) -> None:
+        """
+        Stops the animation where it is, without calling finish or starting its follow-up.
+        """
+        if animation in self.__animations:
+            self.__animations.remove(animation)
+
+    @property
+    def isAnimating(self) -> bool:
+        return len(self.__animations) > 0
+
+    @property
+    def blocksInput(self) -> bool:
+        return any(a.blocksInput for a in self.__animations)
+
+    def update(self, now: float) -> None:
+        for animation in list(self.__animations):
+            if not animation.update(now):
+                self.__end(animation, now)
+
+    def paint(self, window: Surface) -> list[Rect]:
+        areas: list[Rect] = []
+        for animation in self.__animations:
+            areas += animation.paint(window)
+        return areas
+
+    def finishAll(self) -> None:
+        """
+        Skips every animation, including follow-ups, straight to its end.
+        """
+        while self.__animations:
+            self.__end(self.__animations[0], time.time())
+
+    def __end(self, animation: Animation, now: float) -> None:
+        self.__animations.remove(animation)
+        animation.isFinished = True
+        animation.finish()
+        if animation.followUp is not None:
+            self.add(animation.followUp, now)
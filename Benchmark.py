@@ -0,0 +1,360 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Optional, Tuple
+
+# pygame greets the world on standard output when it's imported, which would get mixed in with the results
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import pygame
+from ballsort import initPygame
+from GameColors import GameColors
+from Solver import Solver
+from TubeSet import TubeSet
+from pygame.rect import Rect
+from pygame.surface import Surface
+
+
+class Benchmark:
+    """
+    Times the things that decide how responsive the game feels:  drawing a frame, making and undoing moves,
+    dealing a new game and waiting for a hint.  Each measurement is a dict with the benchmark's name, the
+    board size, the unit and the median, minimum, maximum and 90th and 99th percentiles over the repetitions,
+    so that runs can be saved as JSON and compared with compare().
+
+    The micro-benchmarks (move lookups, checking for a win, saving and loading, and solving) run on the
+    boards in a corpus file instead of freshly dealt ones, so that they measure the same positions from run
+    to run and version to version.  They also report calls per second and the most memory a call allocated.
+    """
+
+    # (tubes, colors, balls per tube), the first three match the game's new S/M/B buttons
+    sizes = {
+        'small': (8, 6, 4),
+        'medium': (12, 10, 5),
+        'big': (16, 13, 8),
+        'huge': (19, 16, 8),
+        # Too big to solve, so only drawing and dealing are measured
+        'stress': (300, 250, 6),
+    }
+    defaultSizes = ['small', 'medium', 'big', 'huge']
+    # The ones that time single calls on the corpus' boards
+    microBenchmarks = ['findMove', 'autoMove', 'isWin', 'serialize', 'loadGame', 'solve']
+
+    # Bumped whenever the corpus' boards change, since results for one corpus can't be compared with another's
+    corpusVersion = 2
+    defaultCorpusPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus.json')
+
+    def __init__(self, window: Surface, repeat: int = 20, seed: int = 1, corpus: Optional[dict[str,Any]] = None):
+        self.__window = window
+        self.repeat = repeat
+        self.seed = seed
+        self.__corpus = corpus
+
+    def __newTubeSet(self, size: str) -> TubeSet:
+        numTubes, numColors, ballsPerTube = Benchmark.sizes[size]
+        w, h = self.__window.get_size()
+        tubes = TubeSet(self.__window, Rect(0, 0, w, h))
+        tubes.newGame(numTubes, numColors, ballsPerTube, self.seed)
+        tubes.finishAnimations()
+        self.__window.fill(GameColors.WindowBackground)
+        tubes.draw()
+        return tubes
+
+    def __loadTubeSet(self, state: dict[str,Any]) -> TubeSet:
+        w, h = self.__window.get_size()
+        tubes = TubeSet(self.__window, Rect(0, 0, w, h))
+        tubes.loadGame(state)
+        tubes.finishAnimations()
+        self.__window.fill(GameColors.WindowBackground)
+        tubes.draw()
+        return tubes
+
+    @staticmethod
+    def __result(name: str, size: str, unit: str, samples: list[float], **extra: Any) -> dict[str,Any]:
+        percentiles = statistics.quantiles(samples, n=100, method='inclusive') if len(samples) > 1 else samples*99
+        return {
+            'name': name,
+            'size': size,
+            'unit': unit,
+            'median': statistics.median(samples),
+            'min': min(samples),
+            'max': max(samples),
+            'p90': percentiles[89],
+            'p99': percentiles[98],
+            'samples': len(samples),
+            **extra,
+        }
+
+    def __time(self, action: Callable[[], Any], setup: Optional[Callable[[], Any]] = None) -> list[float]:
+        samples: list[float] = []
+        for _ in range(self.repeat):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            action()
+            samples.append((time.perf_counter() - start)*1000)
+        return samples
+
+    def drawFrame(self, size: str) -> list[dict[str,Any]]:
+        """
+        Milliseconds to draw a frame when every tube has to be repainted and when nothing has changed.
+        """
+        tubes = self.__newTubeSet(size)
+        full = self.__time(tubes.draw, setup=tubes.invalidate)
+        idle = self.__time(tubes.draw)
+        return [Benchmark.__result('draw.full', size, 'ms', full), Benchmark.__result('draw.idle', size, 'ms', idle)]
+
+    def moveUndo(self, size: str) -> list[dict[str,Any]]:
+        """
+        Milliseconds per move to play the game's solution through to the end and then undo all of it,
+        including setting up (but not playing) the animations.
+        """
+        tubes = self.__newTubeSet(size)
+        solution = tubes.findSolution() or []
+        if not solution:
+            return []
+
+        # Undoing everything puts the tubes back where they started, ready for the next round.  (Reloading
+        # the game would replace the tubes that the solution refers to.)
+        def play() -> None:
+            for record in solution:
+                tubes.doMove(record.source)
+                tubes.doMove(record.target)
+            for _ in solution:
+                tubes.undo()
+            tubes.finishAnimations()
+        samples = self.__time(play)
+        perMove = [s / (2*len(solution)) for s in samples]
+        return [Benchmark.__result('move+undo', size, 'ms/move', perMove)]
+
+    def newGame(self, size: str) -> list[dict[str,Any]]:
+        """
+        Milliseconds for TubeSet.newGame to deal and prove solvable a new game, not counting the animation.
+        """
+        numTubes, numColors, ballsPerTube = Benchmark.sizes[size]
+        tubes = self.__newTubeSet(size)
+        seeds = iter(range(self.seed, self.seed + self.repeat))
+        samples = self.__time(lambda: tubes.newGame(numTubes, numColors, ballsPerTube, next(seeds)), setup=tubes.finishAnimations)
+        tubes.finishAnimations()
+        return [Benchmark.__result('newGame', size, 'ms', samples)]
+
+    def hintLatency(self, size: str) -> list[dict[str,Any]]:
+        """
+        Milliseconds from asking for a suggestion on a fresh position until it's selected, with the game loop
+        running in the meantime.
+        """
+        tubes = self.__newTubeSet(size)
+        start = tubes.serialize()
+
+        def waitForHint() -> None:
+            tubes.suggest()
+            while tubes.isHintPending:
+                tubes.update([])
+            tubes.update([])
+            # Nothing is reading the event queue; don't let the wake-ups pile up in it
+            pygame.event.clear(TubeSet.HintReadyEvent)
+        samples = self.__time(waitForHint, setup=lambda: tubes.loadGame(start))
+        tubes.cancelHint()
+        return [Benchmark.__result('hint', size, 'ms', samples)]
+
+    @staticmethod
+    def buildCorpus(window: Surface, seed: int = 1) -> dict[str,Any]:
+        """
+        Deals a board of every size and plays each one partway, returning both positions in the format of
+        TubeSet.serialize.  The same seed always gives the same corpus.
+        """
+        boards: list[dict[str,Any]] = []
+        w, h = window.get_size()
+        for size, (numTubes, numColors, ballsPerTube) in Benchmark.sizes.items():
+            tubes = TubeSet(window, Rect(0, 0, w, h))
+            tubes.newGame(numTubes, numColors, ballsPerTube, seed)
+            tubes.finishAnimations()
+            boards.append({'size': size, 'stage': 'start', 'state': tubes.serialize()})
+            # Half way through the solution if there's one to be had, otherwise a walk through random moves
+            solution = tubes.findSolution() if numTubes <= 40 else None
+            if solution:
+                for record in solution[:len(solution)//2]:
+                    tubes.doMove(record.source)
+                    tubes.doMove(record.target)
+                    tubes.finishAnimations()
+            else:
+                rng = random.Random(seed)
+                for _ in range(numTubes):
+                    sources = Benchmark.__sources(tubes)
+                    if not sources:
+                        break
+                    source = rng.choice(sources)
+                    target = tubes.tryGetAutoMove(source)
+                    if target is not None:
+                        tubes.doMove(source)
+                        tubes.doMove(target)
+                        tubes.finishAnimations()
+            tubes.setPendingMove(None)
+            boards.append({'size': size, 'stage': 'middle', 'state': tubes.serialize()})
+        return {'version': Benchmark.corpusVersion, 'seed': seed, 'boards': boards}
+
+    @staticmethod
+    def __sources(tubes: TubeSet) -> list[Any]:
+        # Every tube that has a move, in the order tryFindMove goes through them
+        sources: list[Any] = []
+        source = tubes.tryFindMove(None)
+        while source is not None and source not in sources:
+            sources.append(source)
+            source = tubes.tryFindMove(source)
+        return sources
+
+    def __timeCalls(self, action: Callable[[], Any], calls: int, unit: float) -> Tuple[list[float], float, float]:
+        """
+        Times each of `calls` calls to the action, returning the times (in seconds times `unit`), the calls
+        per second and the most memory, in KiB, that a call had allocated at once.
+        """
+        samples: list[float] = []
+        for _ in range(calls):
+            start = time.perf_counter()
+            action()
+            samples.append(time.perf_counter() - start)
+        opsPerSecond = calls / sum(samples) if sum(samples) > 0 else float('inf')
+
+        # Tracing memory slows everything down, so it's done on a separate call
+        wasTracing = tracemalloc.is_tracing()
+        if not wasTracing:
+            tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        action()
+        peak = tracemalloc.get_traced_memory()[1] - before
+        if not wasTracing:
+            tracemalloc.stop()
+        return [s*unit for s in samples], opsPerSecond, max(0, peak)/1024
+
+    def microBenchmark(self, name: str, size: str) -> list[dict[str,Any]]:
+        """
+        Times one of microBenchmarks on each of the corpus' boards of the given size.
+        """
+        results: list[dict[str,Any]] = []
+        for board in (self.__corpus or {}).get('boards', []):
+            if board['size'] != size:
+                continue
+            tubes = self.__loadTubeSet(board['state'])
+            calls = self.repeat*50
+            unit, unitName = 1e6, 'us'
+            action: Callable[[], Any]
+            if name == 'findMove':
+                found: list[Any] = [None]
+                def findMove() -> None:
+                    found[0] = tubes.tryFindMove(found[0])
+                action = findMove
+            elif name == 'autoMove':
+                sources = Benchmark.__sources(tubes)
+                if not sources:
+                    continue
+                counter = iter(range(1 << 62))
+                action = lambda: tubes.tryGetAutoMove(sources[next(counter) % len(sources)])
+            elif name == 'isWin':
+                action = lambda: tubes.isWin
+            elif name == 'serialize':
+                action = tubes.serialize
+            elif name == 'loadGame':
+                state = board['state']
+                action = lambda: tubes.loadGame(state)
+            else:
+                # The search that hints run, on the positions that are small enough for it
+                if tubes.numTotalTubes > 40:
+                    continue
+                solver = Solver(timeLimit=tubes.hintTimeLimit)
+                action = lambda: solver.solve(tubes.board.copy())
+                calls = self.repeat
+                unit, unitName = 1e3, 'ms'
+            samples, opsPerSecond, peakKiB = self.__timeCalls(action, calls, unit)
+            results.append(Benchmark.__result(name, f"{size}.{board['stage']}", unitName, samples,
+                                              opsPerSecond=opsPerSecond, peakKiB=peakKiB))
+        return results
+
+    def run(self, sizes: Optional[list[str]] = None, names: Optional[list[str]] = None) -> list[dict[str,Any]]:
+        benchmarks: dict[str, Callable[[str], list[dict[str,Any]]]] = {
+            'draw': self.drawFrame,
+            'move': self.moveUndo,
+            'newGame': self.newGame,
+            'hint': self.hintLatency,
+        }
+        for name in Benchmark.microBenchmarks:
+            benchmarks[name] = lambda size, name=name: self.microBenchmark(name, size)
+        results: list[dict[str,Any]] = []
+        for size in sizes or Benchmark.defaultSizes:
+            default = ['draw', 'newGame'] + Benchmark.microBenchmarks if size == 'stress' else list(benchmarks)
+            for name in names or default:
+                results += benchmarks[name](size)
+        return results
+
+    @staticmethod
+    def compare(baseline: list[dict[str,Any]], results: list[dict[str,Any]], tolerance: float) -> list[str]:
+        """
+        Returns a description of every result whose median is more than `tolerance` (a fraction) slower than
+        the same benchmark in the baseline.
+        """
+        before = {(r['name'], r['size']): r for r in baseline}
+        regressions: list[str] = []
+        for r in results:
+            b = before.get((r['name'], r['size']))
+            if b is not None and r['median'] > b['median']*(1 + tolerance):
+                regressions.append(f"{r['name']} ({r['size']}): {b['median']:.3f} -> {r['median']:.3f} {r['unit']}")
+        return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Measure ball sort performance and print the results as JSON.')
+    parser.add_argument('--size', action='append', choices=list(Benchmark.sizes), help='board size to measure, can be repeated (default: all but stress)')
+    parser.add_argument('--only', action='append', choices=['draw', 'move', 'newGame', 'hint'] + Benchmark.microBenchmarks, help='benchmark to run, can be repeated (default: all)')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--window', type=int, nargs=2, default=(800, 600), metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--output', help='write the results to this file instead of standard output')
+    parser.add_argument('--baseline', help='results of an earlier run to compare against; exits with status 1 on a regression')
+    parser.add_argument('--tolerance', type=float, default=.25, help='how much slower than the baseline is a regression (default: .25)')
+    parser.add_argument('--show', action='store_true', help='draw to a real window instead of running headless')
+    parser.add_argument('--corpus', default=Benchmark.defaultCorpusPath, help='boards for the micro-benchmarks (default: corpus.json)')
+    parser.add_argument('--build-corpus', action='store_true', help='deal the boards for the corpus, from --seed, and write them to --corpus instead of measuring anything')
+    args = parser.parse_args()
+
+    initPygame(headless=not args.show)
+    window = pygame.display.set_mode(args.window)
+    if args.build_corpus:
+        with open(args.corpus, 'w') as f:
+            json.dump(Benchmark.buildCorpus(window, args.seed), f, separators=(',', ':'))
+        return
+    corpus = None
+    if os.path.exists(args.corpus):
+        with open(args.corpus, 'r') as f:
+            corpus = json.load(f)
+    results = Benchmark(window, args.repeat, args.seed, corpus).run(args.size, args.only)
+    report = json.dumps({
+        'python': sys.version.split()[0],
+        'pygame': pygame.version.ver,
+        'corpus': corpus['version'] if corpus else None,
+        'results': results,
+    }, indent=1)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report)
+    else:
+        print(report)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get('corpus') != (corpus['version'] if corpus else None):
+            print('the baseline used a different corpus; not comparing the micro-benchmarks', file=sys.stderr)
+            results = [r for r in results if r['name'] not in Benchmark.microBenchmarks]
+        regressions = Benchmark.compare(baseline['results'], results, args.tolerance)
+        for r in regressions:
+            print(f'regression: {r}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
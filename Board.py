@@ -0,0 +1,311 @@
+import random
+from typing import Final, Iterable, Iterator, Optional, Tuple
+
+
+class Board:
+    """
+    The pygame-free state of a set of tubes.  Every tube is a fixed-size run of `depth` bytes in a single
+    bytearray, bottom slot first.  A slot holds 0 when it is empty and color+1 otherwise, so two boards with
+    the same balls in the same tubes always have identical bytes.
+
+    Boards also keep two 64-bit Zobrist hashes up to date as balls are pushed and popped:  zobristHash,
+    which identifies the exact position, and unorderedHash, which is the same for boards that only differ
+    in the order of their tubes.
+    """
+
+    __MASK: Final[int] = (1 << 64) - 1
+
+    # Each slot is a byte holding color+1, and each tube's height and top run are bytes too
+    maxColors: Final[int] = 255
+    maxDepth: Final[int] = 255
+
+    # Random keys shared by all boards, so that equal boards hash equally.  __slotKeys is indexed by
+    # slot*256 + cell value, __tubeKeys by tube number.  Both are extended on demand from a fixed seed.
+    __random = random.Random(0xba115047)
+    __slotKeys: list[int] = []
+    __tubeKeys: list[int] = []
+
+    def __init__(self, numTubes: int, depth: int):
+        if depth > Board.maxDepth:
+            raise ValueError(f'tubes can hold at most {Board.maxDepth} balls, not {depth}')
+        self.__numTubes = numTubes
+        self.__depth = depth
+        self.__cells = bytearray(numTubes*depth)
+        self.__heights = bytearray(numTubes)
+        # The number of same-colored balls at the top of each tube, kept up to date so peek is O(1)
+        self.__runs = bytearray(numTubes)
+        # Counts kept up to date so that numEmptyTubes and isWin are O(1)
+        self.__numEmpty = numTubes
+        self.__numComplete = numTubes
+        Board.__ensureKeys(numTubes, depth)
+        # The hash of each tube's contents, independent of where the tube is
+        self.__tubeHashes = [0]*numTubes
+        self.__hash = 0
+        self.__unorderedHash = 0
+        for tube in range(numTubes):
+            self.__hash ^= Board.__placeTube(tube, 0)
+            self.__unorderedHash = (self.__unorderedHash + Board.__mix(0)) & Board.__MASK
+
+    @staticmethod
+    def __ensureKeys(numTubes: int, depth: int) -> None:
+        while len(Board.__slotKeys) < depth*256:
+            Board.__slotKeys.append(Board.__random.getrandbits(64))
+        while len(Board.__tubeKeys) < numTubes:
+            Board.__tubeKeys.append(Board.__random.getrandbits(64))
+
+    @staticmethod
+    def __mix(h: int) -> int:
+        # The splitmix64 finalizer; it keeps sums of tube hashes from cancelling out the way XORs would.
+        h = ((h ^ (h >> 30)) * 0xbf58476d1ce4e5b9) & Board.__MASK
+        h = ((h ^ (h >> 27)) * 0x94d049bb133111eb) & Board.__MASK
+        return h ^ (h >> 31)
+
+    @staticmethod
+    def __placeTube(tube: int, tubeHash: int) -> int:
+        return Board.__mix(tubeHash ^ Board.__tubeKeys[tube])
+
+    def __rehashTube(self, tube: int, newTubeHash: int) -> None:
+        oldTubeHash = self.__tubeHashes[tube]
+        self.__tubeHashes[tube] = newTubeHash
+        self.__hash ^= Board.__placeTube(tube, oldTubeHash) ^ Board.__placeTube(tube, newTubeHash)
+        self.__unorderedHash = (self.__unorderedHash - Board.__mix(oldTubeHash) + Board.__mix(newTubeHash)) & Board.__MASK
+
+    @staticmethod
+    def fromTubes(tubes: Iterable[Iterable[int]], depth: int) -> 'Board':
+        """
+        Builds a board from per-tube lists of colors, bottom ball first (the format of TubeSet.serialize).
+        """
+        tubeList = [list(t) for t in tubes]
+        board = Board(len(tubeList), depth)
+        for i, colors in enumerate(tubeList):
+            for color in colors:
+                board.push(i, color, 1)
+        return board
+
+    def copy(self) -> 'Board':
+        other = Board.__new__(Board)
+        other.__numTubes = self.__numTubes
+        other.__depth = self.__depth
+        other.__cells = self.__cells[:]
+        other.__heights = self.__heights[:]
+        other.__runs = self.__runs[:]
+        other.__numEmpty = self.__numEmpty
+        other.__numComplete = self.__numComplete
+        other.__tubeHashes = self.__tubeHashes[:]
+        other.__hash = self.__hash
+        other.__unorderedHash = self.__unorderedHash
+        return other
+
+    @property
+    def numTubes(self) -> int:
+        return self.__numTubes
+
+    @property
+    def depth(self) -> int:
+        return self.__depth
+
+    @property
+    def key(self) -> bytes:
+        """
+        An immutable snapshot of the board, suitable as a dictionary key or for storage.
+        """
+        return bytes(self.__cells)
+
+    @property
+    def zobristHash(self) -> int:
+        return self.__hash
+
+    @property
+    def unorderedHash(self) -> int:
+        return self.__unorderedHash
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Board) and self.__depth == other.__depth and self.__cells == other.__cells
+
+    def __hash__(self) -> int:
+        return self.__hash
+
+    def height(self, tube: int) -> int:
+        return self.__heights[tube]
+
+    def emptySlots(self, tube: int) -> int:
+        return self.__depth - self.__heights[tube]
+
+    def isEmpty(self, tube: int) -> bool:
+        return self.__heights[tube] == 0
+
+    def topColor(self, tube: int) -> int:
+        """
+        The color of the top ball in the tube, or -1 if the tube is empty.
+        """
+        h = self.__heights[tube]
+        return self.__cells[tube*self.__depth + h - 1] - 1 if h else -1
+
+    def topCount(self, tube: int) -> int:
+        return self.__runs[tube]
+
+    def peek(self, tube: int) -> Tuple[int, int]:
+        """
+        Returns the color and number of the same-colored balls at the top of the tube.
+        """
+        return self.topColor(tube), self.__runs[tube]
+
+    def hasMoreThanOneColor(self, tube: int) -> bool:
+        return self.__runs[tube] < self.__heights[tube]
+
+    def isComplete(self, tube: int) -> bool:
+        h = self.__heights[tube]
+        return h == 0 or (h == self.__depth and self.__runs[tube] == h)
+
+    def canAdd(self, tube: int, color: int, count: int) -> bool:
+        h = self.__heights[tube]
+        if self.__depth - h < count: return False
+        return h == 0 or self.__cells[tube*self.__depth + h - 1] == color + 1
+
+    def canAddPartial(self, tube: int, color: int) -> bool:
+        h = self.__heights[tube]
+        if h == self.__depth: return False
+        return h == 0 or self.__cells[tube*self.__depth + h - 1] == color + 1
+
+    def __updateCounts(self, tube: int, oldHeight: int, wasComplete: bool) -> None:
+        h = self.__heights[tube]
+        self.__numEmpty += (h == 0) - (oldHeight == 0)
+        self.__numComplete += self.isComplete(tube) - wasComplete
+
+    def push(self, tube: int, color: int, count: int) -> None:
+        h = self.__heights[tube]
+        assert h + count <= self.__depth
+        if not 0 <= color < Board.maxColors:
+            raise ValueError(f'colors have to be between 0 and {Board.maxColors - 1}, not {color}')
+        wasComplete = self.isComplete(tube)
+        base = tube*self.__depth
+        value = color + 1
+        if h and self.__cells[base + h - 1] == value:
+            self.__runs[tube] += count
+        else:
+            self.__runs[tube] = count
+        self.__cells[base + h:base + h + count] = bytes((value,))*count
+        self.__heights[tube] = h + count
+        tubeHash = self.__tubeHashes[tube]
+        for slot in range(h, h + count):
+            tubeHash ^= Board.__slotKeys[slot*256 + value]
+        self.__rehashTube(tube, tubeHash)
+        self.__updateCounts(tube, h, wasComplete)
+
+    def pop(self, tube: int, count: int) -> int:
+        """
+        Removes `count` balls from the top of the tube, which must all be the same color, and returns that color.
+        """
+        run = self.__runs[tube]
+        assert 0 < count <= run
+        h = self.__heights[tube]
+        wasComplete = self.isComplete(tube)
+        base = tube*self.__depth
+        value = self.__cells[base + h - 1]
+        newHeight = h - count
+        self.__cells[base + newHeight:base + h] = bytes(count)
+        self.__heights[tube] = newHeight
+        tubeHash = self.__tubeHashes[tube]
+        for slot in range(newHeight, h):
+            tubeHash ^= Board.__slotKeys[slot*256 + value]
+        self.__rehashTube(tube, tubeHash)
+        if count < run:
+            self.__runs[tube] = run - count
+        else:
+            self.__runs[tube] = self.__countRun(base, newHeight)
+        self.__updateCounts(tube, h, wasComplete)
+        return value - 1
+
+    def __countRun(self, base: int, height: int) -> int:
+        if height == 0:
+            return 0
+        cells = self.__cells
+        value = cells[base + height - 1]
+        i = height - 1
+        while i > 0 and cells[base + i - 1] == value:
+            i -= 1
+        return height - i
+
+    def groups(self, tube: int) -> Iterator[Tuple[int, int]]:
+        """
+        Yields (color, count) for each run of same-colored balls in the tube, top run first.
+        """
+        cells = self.__cells
+        base = tube*self.__depth
+        i = self.__heights[tube]
+        while i > 0:
+            value = cells[base + i - 1]
+            j = i - 1
+            while j > 0 and cells[base + j - 1] == value:
+                j -= 1
+            yield value - 1, i - j
+            i = j
+
+    def tubeContents(self, tube: int) -> list[int]:
+        """
+        The colors in the tube, bottom ball first.
+        """
+        base = tube*self.__depth
+        return [v - 1 for v in self.__cells[base:base + self.__heights[tube]]]
+
+    def tubeHash(self, tube: int) -> int:
+        """
+        The Zobrist hash of just this tube's contents.
+        """
+        return self.__tubeHashes[tube]
+
+    def tubeKey(self, tube: int) -> bytes:
+        base = tube*self.__depth
+        return bytes(self.__cells[base:base + self.__depth])
+
+    @property
+    def numEmptyTubes(self) -> int:
+        return self.__numEmpty
+
+    @property
+    def numCompleteTubes(self) -> int:
+        """
+        The number of tubes that are either empty or full of a single color.
+        """
+        return self.__numComplete
+
+    @property
+    def isWin(self) -> bool:
+        return self.__numComplete == self.__numTubes
+
+    def moveCount(self, source: int, target: int) -> int:
+        """
+        The number of balls that would move from source to target, honoring the rule that a move fills as
+        much of the target as it can, or 0 if the move isn't allowed.
+        """
+        if source == target: return 0
+        hs = self.__heights[source]
+        if hs == 0: return 0
+        ht = self.__heights[target]
+        if ht == self.__depth: return 0
+        if ht and self.__cells[target*self.__depth + ht - 1] != self.__cells[source*self.__depth + hs - 1]:
+            return 0
+        return min(self.__runs[source], self.__depth - ht)
+
+    def move(self, source: int, target: int, count: Optional[int] = None) -> int:
+        """
+        Moves balls from source to target and returns how many moved.  If count is not given, it's computed
+        by moveCount.
+        """
+        if count is None:
+            count = self.moveCount(source, target)
+        color = self.pop(source, count)
+        self.push(target, color, count)
+        return count
+
+    def validMoves(self) -> Iterator[Tuple[int, int, int]]:
+        """
+        Yields every legal (source, target, count) move.
+        """
+        for source in range(self.__numTubes):
+            if self.__heights[source] == 0:
+                continue
+            for target in range(self.__numTubes):
+                count = self.moveCount(source, target)
+                if count:
+                    yield source, target, count
@@ -0,0 +1,118 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
+
+from Board import Board
+from Solver import Move, Solver
+
+# (Board.zobristHash of the position, whether it can still be won, undos needed to get back to one that can)
+# Either of the last two is None when the search gave up before it could tell.
+Analysis = Tuple[int, Optional[bool], Optional[int]]
+
+
+class DeadEndDetector:
+    """
+    Works out, on a background thread, whether the game can still be won from the current position, and if
+    not, how many undos it takes to get back to a position where it can.  Like HintWorker, only the latest
+    request matters; submitting another abandons the one before.
+
+    It remembers what it has learned about every position (by Board.unorderedHash, so the same balls in
+    different tubes count as one) and uses it to skip most searches:
+    - every position along a solution that was found can be won;
+    - a position reached by a move from one that can't be won can't be won either;
+    - a position that was already looked at needn't be looked at again, which is what makes walking back
+      through the undos cheap.
+    Only positions that are none of those are searched, and only within a time and state limit; a search
+    that doesn't finish doesn't decide anything.
+    """
+
+    # Forget everything once this many positions are known, rather than growing without limit
+    __maxKnown = 1 << 18
+
+    def __init__(self, onFinished: Optional[Callable[[], None]] = None, timeLimit: float = 1.0, maxStates: int = 100000):
+        self.__onFinished = onFinished
+        self.timeLimit = timeLimit
+        self.maxStates = maxStates
+        self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='DeadEndDetector')
+        self.__future: Optional[Future[Analysis]] = None
+        self.__cancelled = threading.Event()
+        # Board.unorderedHash -> whether the game can be won from there.  Only used on the worker thread.
+        self.__known: dict[int, bool] = {}
+
+    def submit(self, board: Board, undoMoves: list[Move]) -> None:
+        """
+        Starts looking at the board.  undoMoves are the moves that led to it, most recent first; they're how
+        it finds the way back if the board turns out to be a dead end.
+        """
+        self.cancel()
+        cancelled = threading.Event()
+        self.__cancelled = cancelled
+        self.__future = self.__executor.submit(self.__analyze, board.copy(), undoMoves, cancelled)
+        if self.__onFinished is not None:
+            onFinished = self.__onFinished
+            self.__future.add_done_callback(lambda _: None if cancelled.is_set() else onFinished())
+
+    def cancel(self) -> None:
+        if self.__future is not None:
+            self.__cancelled.set()
+            self.__future.cancel()
+            self.__future = None
+
+    def poll(self) -> Optional[Analysis]:
+        """
+        The analysis of the last board submitted, once it's done, after which it's forgotten.  None while
+        it's still going or if nothing was submitted.
+        """
+        if self.__future is None or not self.__future.done():
+            return None
+        future = self.__future
+        self.__future = None
+        return future.result()
+
+    def __analyze(self, board: Board, undoMoves: list[Move], cancelled: threading.Event) -> Analysis:
+        key = board.zobristHash
+        canWin = self.__canWin(board, undoMoves[0] if undoMoves else None, cancelled)
+        if canWin is not False:
+            return key, canWin, 0 if canWin else None
+
+        # Step back until there's a position that can be won
+        for undos, (source, target, count) in enumerate(undoMoves, start=1):
+            board.move(target, source, count)
+            previous = undoMoves[undos] if undos < len(undoMoves) else None
+            canWinThere = self.__canWin(board, previous, cancelled)
+            if canWinThere is None:
+                return key, False, None
+            if canWinThere:
+                return key, False, undos
+        return key, False, None
+
+    def __canWin(self, board: Board, lastMove: Optional[Move], cancelled: threading.Event) -> Optional[bool]:
+        known = self.__known.get(board.unorderedHash)
+        if known is not None:
+            return known
+        if lastMove is not None:
+            source, target, count = lastMove
+            before = board.copy()
+            before.move(target, source, count)
+            if self.__known.get(before.unorderedHash) is False:
+                self.__remember(board, False)
+                return False
+
+        solver = Solver(timeLimit=self.timeLimit, maxStates=self.maxStates)
+        solution = solver.solve(board, cancelled.is_set)
+        if solution is not None:
+            position = board.copy()
+            self.__remember(position, True)
+            for move in solution:
+                position.move(*move)
+                self.__remember(position, True)
+            return True
+        if solver.timedOut:
+            return None
+        self.__remember(board, False)
+        return False
+
+    def __remember(self, board: Board, canWin: bool) -> None:
+        if len(self.__known) >= DeadEndDetector.__maxKnown:
+            self.__known.clear()
+        self.__known[board.unorderedHash] = canWin
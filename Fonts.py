@@ -0,0 +1,24 @@
+import os
+
+import pygame
+from pygame.font import Font
+
+
+class Fonts:
+    """
+    The font all the game's own text is drawn in:  the one that comes with pygame, loaded by its path.
+    pygame.font.SysFont goes through every font installed on the system the first time it's called, which
+    can take longer than everything else it takes to get the game on the screen.  Each size is loaded once.
+    """
+
+    __path = os.path.join(os.path.dirname(os.path.abspath(pygame.__file__)), pygame.font.get_default_font())
+    __fonts: dict[int, Font] = {}
+
+    @staticmethod
+    def get(size: int) -> Font:
+        font = Fonts.__fonts.get(size)
+        if font is None:
+            # pygame.font has to have been initialized by now
+            font = Font(Fonts.__path if os.path.exists(Fonts.__path) else None, size)
+            Fonts.__fonts[size] = font
+        return font
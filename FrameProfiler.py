@@ -0,0 +1,99 @@
+import cProfile
+import json
+import time
+from collections import deque
+from typing import Optional, Tuple
+
+
+class FrameProfiler:
+    """
+    Times each phase of every frame, for the on-screen summary and for exporting to Chrome's trace viewer
+    (chrome://tracing, or https://ui.perfetto.dev).  A frame starts with startFrame, each lap call ends a
+    phase that started where the last one ended, and endFrame finishes it.  Time spent waiting, for events or
+    to keep under the frame rate cap, isn't part of any frame.
+
+    Whatever is being profiled holds an Optional[FrameProfiler] and checks it for None before each lap, so
+    there's nothing to pay when profiling is off.
+
+    It can also run cProfile on the side, for finding out what's slow within a phase.
+    """
+
+    def __init__(self, frameBudget: float, historyLength: int = 240, maxTraceEvents: int = 200000):
+        """
+        frameBudget is the most time, in seconds, a frame can take before it's counted as dropped.  The
+        frame time percentiles are over the last historyLength frames, and the trace keeps the last
+        maxTraceEvents phases and frames.
+        """
+        self.frameBudget = frameBudget
+        self.droppedFrames = 0
+        self.__frameTimes: deque[float] = deque(maxlen=historyLength)
+        self.__frameEnds: deque[float] = deque(maxlen=historyLength)
+        # (name, start, end), in seconds from time.perf_counter
+        self.__trace: deque[Tuple[str, float, float]] = deque(maxlen=maxTraceEvents)
+        self.__frameStart = self.__lapStart = time.perf_counter()
+        self.__profile: Optional[cProfile.Profile] = None
+
+    def startFrame(self) -> None:
+        self.__frameStart = self.__lapStart = time.perf_counter()
+
+    def lap(self, name: str) -> None:
+        now = time.perf_counter()
+        self.__trace.append((name, self.__lapStart, now))
+        self.__lapStart = now
+
+    def endFrame(self) -> None:
+        now = time.perf_counter()
+        self.__trace.append(('frame', self.__frameStart, now))
+        self.__frameTimes.append(now - self.__frameStart)
+        self.__frameEnds.append(now)
+        if now - self.__frameStart > self.frameBudget:
+            self.droppedFrames += 1
+
+    @property
+    def fps(self) -> float:
+        """
+        Frames finished in the last second.
+        """
+        since = time.perf_counter() - 1
+        return sum(1 for end in self.__frameEnds if end >= since)
+
+    def frameTime(self, percentile: float) -> float:
+        """
+        The given percentile (0 to 100) of the recent frames' times, in seconds.
+        """
+        if not self.__frameTimes:
+            return 0.0
+        times = sorted(self.__frameTimes)
+        return times[min(len(times) - 1, int(len(times)*percentile/100))]
+
+    @property
+    def summary(self) -> str:
+        return f'{self.fps:.0f} fps  p50 {self.frameTime(50)*1000:.1f} ms  p99 {self.frameTime(99)*1000:.1f} ms  ' \
+               f'dropped {self.droppedFrames}{"  cProfile on" if self.isCapturing else ""}'
+
+    @property
+    def isCapturing(self) -> bool:
+        return self.__profile is not None
+
+    def toggleCapture(self, path: str) -> bool:
+        """
+        Starts running cProfile, or if it's already running, stops it and writes what it collected to the
+        path, in the format pstats reads.  Returns True if it started.
+        """
+        if self.__profile is None:
+            self.__profile = cProfile.Profile()
+            self.__profile.enable()
+            return True
+        self.__profile.disable()
+        self.__profile.dump_stats(path)
+        self.__profile = None
+        return False
+
+    def writeTrace(self, path: str) -> None:
+        """
+        Writes the recorded frames and phases as Chrome trace events.
+        """
+        events = [{'name': name, 'ph': 'X', 'ts': start*1e6, 'dur': (end - start)*1e6, 'pid': 1, 'tid': 1}
+                  for name, start, end in self.__trace]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, separators=(',', ':'))
@@ -0,0 +1,61 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
+
+from Board import Board
+from Solver import Move, Solver
+
+
+class HintWorker:
+    """
+    Runs Solver searches on a background thread so the game loop keeps drawing and taking input while a
+    hint is being computed.  Only one request is live at a time; submitting a new one or calling cancel
+    abandons the old one, and a search that is already running notices within a few hundred states and
+    stops early.
+
+    onFinished, if given, is called from the worker thread whenever a search that wasn't cancelled ends,
+    which lets an idle game loop wake up and collect the result.
+    """
+
+    def __init__(self, onFinished: Optional[Callable[[], None]] = None):
+        self.__onFinished = onFinished
+        self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='HintWorker')
+        self.__future: Optional[Future[Optional[list[Move]]]] = None
+        self.__cancelled = threading.Event()
+        self.__requestKey = 0
+
+    def submit(self, board: Board, timeLimit: float) -> None:
+        self.cancel()
+        cancelled = threading.Event()
+        self.__cancelled = cancelled
+        self.__requestKey = board.zobristHash
+        self.__future = self.__executor.submit(HintWorker.__solve, board.copy(), timeLimit, cancelled)
+        if self.__onFinished is not None:
+            onFinished = self.__onFinished
+            self.__future.add_done_callback(lambda _: None if cancelled.is_set() else onFinished())
+
+    @staticmethod
+    def __solve(board: Board, timeLimit: float, cancelled: threading.Event) -> Optional[list[Move]]:
+        return Solver(timeLimit=timeLimit).solve(board, cancelled.is_set)
+
+    def cancel(self) -> None:
+        if self.__future is not None:
+            self.__cancelled.set()
+            self.__future.cancel()
+            self.__future = None
+
+    @property
+    def isBusy(self) -> bool:
+        return self.__future is not None
+
+    def poll(self) -> Optional[Tuple[int, Optional[list[Move]]]]:
+        """
+        If the current request has finished, returns the Board.zobristHash of the board it was made for
+        along with its solution (None if the search failed) and forgets about the request.  Returns None
+        while the search is still going or if there is no request.
+        """
+        if self.__future is None or not self.__future.done():
+            return None
+        future = self.__future
+        self.__future = None
+        return self.__requestKey, future.result()
@@ -0,0 +1,148 @@
+from array import array
+from typing import Optional
+
+from Solver import Move
+
+
+class History:
+    """
+    The moves made in a game, for undo and redo.  Moves are packed four bytes apiece into one array, with the
+    undo half before `position` and the redo half after it, so nothing is allocated per move.
+
+    Alongside each position (0 being the start of the game, n being after n moves) it keeps how many tubes
+    were empty and the nearest earlier position that had more of them.  That's where "undo to checkpoint"
+    goes, so finding it takes one lookup however far back it is.
+
+    If maxMoves is set, the oldest moves are forgotten once there are more than that many.
+    """
+
+    # Bits used for the source and target tube, the rest are the count
+    __TUBE_BITS = 12
+    __COUNT_BITS = 8
+    # The most tubes a game can have for its moves to fit
+    maxTubes = 1 << __TUBE_BITS
+
+    def __init__(self, maxMoves: Optional[int] = None):
+        self.maxMoves = maxMoves
+        self.reset(0)
+
+    def reset(self, emptyTubes: int) -> None:
+        """
+        Forgets every move and starts over from a position with the given number of empty tubes.
+        """
+        self.__moves = array('I')
+        # Per position, offset by self.__first
+        self.__emptyTubes = array('H', [emptyTubes])
+        self.__checkpoints = array('q', [-1])
+        # The position of the first move that hasn't been forgotten because of maxMoves
+        self.__first = 0
+        self.__position = 0
+
+    @property
+    def position(self) -> int:
+        return self.__position
+
+    @property
+    def canUndo(self) -> bool:
+        return self.__position > self.__first
+
+    @property
+    def canRedo(self) -> bool:
+        return self.__position < self.__first + len(self.__moves)
+
+    @staticmethod
+    def __pack(move: Move) -> int:
+        source, target, count = move
+        assert source < 1 << History.__TUBE_BITS and target < 1 << History.__TUBE_BITS and count < 1 << History.__COUNT_BITS
+        return (source << (History.__TUBE_BITS + History.__COUNT_BITS)) | (target << History.__COUNT_BITS) | count
+
+    @staticmethod
+    def __unpack(packed: int) -> Move:
+        tubeMask = (1 << History.__TUBE_BITS) - 1
+        return (packed >> (History.__TUBE_BITS + History.__COUNT_BITS),
+                (packed >> History.__COUNT_BITS) & tubeMask,
+                packed & ((1 << History.__COUNT_BITS) - 1))
+
+    def push(self, move: Move, emptyTubes: int) -> None:
+        """
+        Records a move, which leaves the given number of empty tubes, and throws away the moves to redo.
+        """
+        index = self.__position - self.__first
+        del self.__moves[index:]
+        del self.__emptyTubes[index+1:]
+        del self.__checkpoints[index+1:]
+
+        # Follow the chain of checkpoints back until one has more empty tubes than this position
+        checkpoint = self.__position
+        while checkpoint >= self.__first and self.__emptyTubes[checkpoint - self.__first] <= emptyTubes:
+            checkpoint = self.__checkpoints[checkpoint - self.__first]
+        self.__moves.append(History.__pack(move))
+        self.__emptyTubes.append(emptyTubes)
+        self.__checkpoints.append(checkpoint)
+        self.__position += 1
+
+        if self.maxMoves is not None and len(self.__moves) > self.maxMoves:
+            # Forget a good-sized batch at once so the arrays aren't shifted on every move
+            self.__forget(len(self.__moves) - self.maxMoves + self.maxMoves//4)
+
+    def __forget(self, numMoves: int) -> None:
+        numMoves = min(numMoves, self.__position - self.__first)
+        del self.__moves[:numMoves]
+        del self.__emptyTubes[:numMoves]
+        del self.__checkpoints[:numMoves]
+        self.__first += numMoves
+
+    def undo(self) -> Optional[Move]:
+        """
+        Steps back one move and returns it, or returns None if there's nothing to undo.
+        """
+        if not self.canUndo:
+            return None
+        self.__position -= 1
+        return History.__unpack(self.__moves[self.__position - self.__first])
+
+    def redo(self) -> Optional[Move]:
+        if not self.canRedo:
+            return None
+        self.__position += 1
+        return History.__unpack(self.__moves[self.__position - 1 - self.__first])
+
+    @property
+    def checkpoint(self) -> int:
+        """
+        The most recent position before this one that had more empty tubes, or the earliest one remembered
+        if there's no such position.
+        """
+        return max(self.__first, self.__checkpoints[self.__position - self.__first])
+
+    def rewind(self, position: int) -> list[Move]:
+        """
+        Steps back to the given position and returns the moves that were undone, most recent first.
+        """
+        position = max(position, self.__first)
+        undone = [History.__unpack(self.__moves[i - self.__first]) for i in range(self.__position - 1, position - 1, -1)]
+        self.__position = min(self.__position, position)
+        return undone
+
+    def recentMoves(self, count: int) -> list[Move]:
+        """
+        Up to `count` of the moves that can be undone, most recent first.
+        """
+        end = self.__position - self.__first
+        return [History.__unpack(self.__moves[i]) for i in range(end - 1, max(end - count, 0) - 1, -1)]
+
+    def undoMoves(self, limit: Optional[int] = None) -> list[Move]:
+        """
+        The moves that can be undone, oldest first; only the `limit` most recent ones, if it's given.
+        """
+        end = self.__position - self.__first
+        start = 0 if limit is None else max(0, end - limit)
+        return [History.__unpack(m) for m in self.__moves[start:end]]
+
+    def redoMoves(self, limit: Optional[int] = None) -> list[Move]:
+        """
+        The moves that can be redone, next one first; only the next `limit` of them, if it's given.
+        """
+        start = self.__position - self.__first
+        end = len(self.__moves) if limit is None else min(len(self.__moves), start + limit)
+        return [History.__unpack(m) for m in self.__moves[start:end]]
@@ -0,0 +1,156 @@
+import json
+import os
+import random
+import struct
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable, Optional, Tuple
+
+# A journal record is (operation, source tube, target tube, number of balls)
+Record = Tuple[int, int, int, int]
+
+
+class Journal:
+    """
+    Keeps the game's state on disk as it's played, so that a crash loses nothing.  Every move, undo and redo is
+    appended to a binary journal file as a fixed-size record, and every so often a snapshot of the whole state
+    is written, from a background thread, as compact JSON next to it.  The snapshot notes which journal it
+    goes with and how many of its records it already includes, so recovering is a matter of loading the
+    snapshot and replaying whatever was appended after it.
+
+    What goes in a snapshot is up to capture; the game keeps them small by only saving the recent part of the
+    undo history, so a long game doesn't make each one take longer.
+
+    Appends are flushed to the operating system right away, which is enough to survive the game crashing; the
+    snapshots are also synced to the disk itself, and replace the old one atomically.
+
+    Each new game's journal goes in the other of two files, so the snapshot on disk always has its journal
+    intact, even while the new game's first snapshot is still being written.
+    """
+
+    MOVE = 1
+    UNDO = 2
+    REDO = 3
+
+    __MAGIC = b'BSJ1'
+    # The magic number and the id of the journal, which the snapshots refer to
+    __header = struct.Struct('<4sQ')
+    __record = struct.Struct('<BHHB')
+
+    def __init__(self, snapshotPath: str, capture: Callable[[], dict[str,Any]], snapshotInterval: int = 64):
+        """
+        capture is called on the game's thread whenever a snapshot is due and has to return the state to save.
+        """
+        self.__snapshotPath = snapshotPath
+        base = os.path.splitext(snapshotPath)[0]
+        self.__journalPaths = (base + '.journal', base + '.journal2')
+        # Which of self.__journalPaths the current game's journal is in
+        self.__journalIndex = 0
+        self.__capture = capture
+        self.snapshotInterval = snapshotInterval
+        self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='Journal')
+        self.__lastSnapshot: Optional[Future[None]] = None
+        # The snapshot the current journal starts from
+        self.__baseSnapshot: Optional[Future[None]] = None
+        self.__file: Optional[BinaryIO] = None
+        self.__journalId = 0
+        self.__numRecords = 0
+        self.__numRecordsInSnapshot = 0
+
+    def recover(self) -> Optional[Tuple[dict[str,Any], list[Record]]]:
+        """
+        Returns the last snapshot along with the journal records that were appended after it was taken, or
+        None if there's no snapshot.  A record that was only partly written when the game went down is dropped.
+        """
+        try:
+            with open(self.__snapshotPath, 'r') as f:
+                state: dict[str,Any] = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        info = state.pop('journal', None)
+        if info is None:
+            return state, []
+        for index, path in enumerate(self.__journalPaths):
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except OSError:
+                continue
+            if len(data) < Journal.__header.size:
+                continue
+            magic, journalId = Journal.__header.unpack_from(data)
+            if magic == Journal.__MAGIC and journalId == info['id']:
+                # The next game's journal mustn't overwrite this one
+                self.__journalIndex = index
+                break
+        else:
+            return state, []
+        numRecords = (len(data) - Journal.__header.size) // Journal.__record.size
+        records: list[Record] = []
+        for i in range(info['records'], numRecords):
+            records.append(Journal.__record.unpack_from(data, Journal.__header.size + i*Journal.__record.size))
+        return state, records
+
+    def startGame(self) -> None:
+        """
+        Starts a fresh journal with a snapshot of the current state as its base.  The snapshot is written in the
+        background like any other; until it's on the disk, the previous snapshot and journal are still there to
+        recover from.
+        """
+        self.__closeFile()
+        # The file about to be reused holds the journal from two games ago, which is only safe to lose once the
+        # previous game's snapshot has replaced the one that refers to it.  That's almost always long done.
+        if self.__baseSnapshot is not None:
+            self.__baseSnapshot.result()
+        self.__journalIndex = 1 - self.__journalIndex
+        self.__journalId = random.getrandbits(63)
+        self.__numRecords = 0
+        self.__file = open(self.__journalPaths[self.__journalIndex], 'wb')
+        self.__file.write(Journal.__header.pack(Journal.__MAGIC, self.__journalId))
+        self.__file.flush()
+        self.__baseSnapshot = self.snapshot()
+
+    def append(self, operation: int, source: int = 0, target: int = 0, count: int = 0) -> None:
+        if self.__file is None:
+            return
+        self.__file.write(Journal.__record.pack(operation, source, target, count))
+        self.__file.flush()
+        self.__numRecords += 1
+        if self.__numRecords - self.__numRecordsInSnapshot >= self.snapshotInterval:
+            self.snapshot()
+
+    def snapshot(self) -> 'Future[None]':
+        """
+        Captures the state now and writes it out in the background.  Snapshots are written in the order
+        they're taken.
+        """
+        state = self.__capture()
+        state['journal'] = {'id': self.__journalId, 'records': self.__numRecords}
+        self.__numRecordsInSnapshot = self.__numRecords
+        self.__lastSnapshot = self.__executor.submit(Journal.__write, self.__snapshotPath, state)
+        return self.__lastSnapshot
+
+    @staticmethod
+    def __write(path: str, state: dict[str,Any]) -> None:
+        temporaryPath = path + '.tmp'
+        with open(temporaryPath, 'w') as f:
+            json.dump(state, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporaryPath, path)
+
+    def close(self) -> None:
+        """
+        Takes a final snapshot and waits for everything to be written.
+        """
+        if self.__file is not None:
+            self.snapshot()
+        if self.__lastSnapshot is not None:
+            self.__lastSnapshot.result()
+        self.__closeFile()
+        self.__executor.shutdown()
+
+    def __closeFile(self) -> None:
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
@@ -0,0 +1,189 @@
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from typing import Any, Iterable, Optional, Tuple
+
+from Board import Board
+from Solver import Solver
+
+
+class Puzzle:
+    """
+    A deal that has been proven solvable, along with how hard it is.  `balls` lists the colors in the order
+    TubeSet.newGame fills the tubes:  the first ballsPerTube entries go into the first tube, bottom first,
+    and so on.  Tubes past numColors start out empty.
+    """
+    seed: int
+    numTubes: int
+    numColors: int
+    ballsPerTube: int
+    balls: list[int]
+    solutionLength: int
+    branching: float
+    deadEndDensity: float
+    score: float
+    difficulty: int
+
+    def toBoard(self) -> Board:
+        return PuzzleGenerator.dealToBoard(self.balls, self.numTubes, self.numColors, self.ballsPerTube)
+
+    def serialize(self) -> dict[str,Any]:
+        return dict(self.__dict__)
+
+    @staticmethod
+    def parse(d: dict[str,Any]) -> 'Puzzle':
+        p = Puzzle()
+        p.__dict__.update(d)
+        return p
+
+
+class PuzzleGenerator:
+    """
+    Produces seeded deals, uses Solver to prove each one can be won, and rates its difficulty from 1 (easy)
+    to 5 (hard).  The same seed always yields the same deal.
+    """
+
+    # Score thresholds between the difficulty levels, picked so that the standard game sizes produce a
+    # spread of ratings rather than all landing in one bucket.
+    __DIFFICULTY_THRESHOLDS = (4.2, 4.7, 5.2, 5.8)
+
+    def __init__(self, timeLimit: float = 2.0):
+        self.timeLimit = timeLimit
+
+    @staticmethod
+    def deal(numColors: int, ballsPerTube: int, seed: int) -> list[int]:
+        rng = random.Random(seed)
+        td = numColors*ballsPerTube
+        a = [i % numColors for i in range(td)]
+        for i in range(td):
+            swapWith = rng.randint(i, td-1)
+            if swapWith != i:
+                a[i], a[swapWith] = a[swapWith], a[i]
+        return a
+
+    @staticmethod
+    def dealToBoard(balls: list[int], numTubes: int, numColors: int, ballsPerTube: int) -> Board:
+        board = Board(numTubes, ballsPerTube)
+        for i in range(numColors):
+            for j in range(ballsPerTube):
+                board.push(i, balls[i*ballsPerTube + j], 1)
+        return board
+
+    @staticmethod
+    def rate(score: float) -> int:
+        difficulty = 1
+        for threshold in PuzzleGenerator.__DIFFICULTY_THRESHOLDS:
+            if score >= threshold:
+                difficulty += 1
+        return difficulty
+
+    def tryGenerate(self, numTubes: int, numColors: int, ballsPerTube: int, seed: int,
+                    timeLimit: Optional[float] = None) -> Optional[Puzzle]:
+        """
+        Deals the puzzle for the given seed and returns it if it can be shown to be solvable within the time
+        limit (self.timeLimit unless another is given), otherwise None.
+        """
+        balls = PuzzleGenerator.deal(numColors, ballsPerTube, seed)
+        board = PuzzleGenerator.dealToBoard(balls, numTubes, numColors, ballsPerTube)
+        solver = Solver(timeLimit=self.timeLimit if timeLimit is None else timeLimit)
+        solution = solver.solve(board)
+        if not solution:
+            return None
+
+        # How many choices the player has along the way
+        totalMoves = 0
+        for move in solution:
+            totalMoves += len(Solver.usefulMoves(board))
+            board.move(*move)
+
+        p = Puzzle()
+        p.seed = seed
+        p.numTubes = numTubes
+        p.numColors = numColors
+        p.ballsPerTube = ballsPerTube
+        p.balls = balls
+        p.solutionLength = len(solution)
+        p.branching = totalMoves / len(solution)
+        p.deadEndDensity = solver.deadEnds / solver.statesExplored
+        # Moves needed per ball, how much searching it took to find them, and how many wrong turns
+        # there were to fall into along the way.
+        p.score = 4*len(solution)/len(balls) \
+            + math.log2(solver.statesExplored / len(solution) + 1) \
+            + 10*p.deadEndDensity
+        p.difficulty = PuzzleGenerator.rate(p.score)
+        return p
+
+    def generate(self, numTubes: int, numColors: int, ballsPerTube: int, seed: int,
+                 minDifficulty: int = 1, maxDifficulty: int = 5, maxAttempts: int = 100,
+                 totalTimeLimit: Optional[float] = None) -> Optional[Puzzle]:
+        """
+        Returns the first solvable puzzle in the given difficulty range, trying seeds derived from the given
+        one.  Returns None if none was found within maxAttempts deals, or within totalTimeLimit seconds for
+        all of them together, if it's given.  Each deal still gets no more than self.timeLimit.
+        """
+        deadline = None if totalTimeLimit is None else time.time() + totalTimeLimit
+        rng = random.Random(seed)
+        candidate = seed
+        for _ in range(maxAttempts):
+            timeLimit = self.timeLimit
+            if deadline is not None:
+                timeLimit = min(timeLimit, deadline - time.time())
+                if timeLimit <= 0:
+                    break
+            p = self.tryGenerate(numTubes, numColors, ballsPerTube, candidate, timeLimit)
+            if p is not None and minDifficulty <= p.difficulty <= maxDifficulty:
+                return p
+            candidate = rng.getrandbits(32)
+        return None
+
+    def generateBatch(self, numTubes: int, numColors: int, ballsPerTube: int, seeds: Iterable[int],
+                      workers: Optional[int] = None) -> list[Puzzle]:
+        """
+        Runs tryGenerate for every seed across a pool of processes (one per CPU by default) and returns the
+        puzzles that proved solvable, in seed order.
+        """
+        seedList = list(seeds)
+        workers = workers or os.cpu_count() or 1
+        args = [(self.timeLimit, numTubes, numColors, ballsPerTube, s) for s in seedList]
+        if workers == 1:
+            results = map(PuzzleGenerator._generateOne, args)
+            return [p for p in results if p is not None]
+        # Imported here, since the game itself never needs it and it pulls in multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunkSize = max(1, len(args) // (workers*8))
+            return [p for p in executor.map(PuzzleGenerator._generateOne, args, chunksize=chunkSize) if p is not None]
+
+    @staticmethod
+    def _generateOne(args: Tuple[float, int, int, int, int]) -> Optional[Puzzle]:
+        # Process pool entry point; it has to be reachable by name from the worker processes.
+        timeLimit, numTubes, numColors, ballsPerTube, seed = args
+        return PuzzleGenerator(timeLimit).tryGenerate(numTubes, numColors, ballsPerTube, seed)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Generate solvable ball sort puzzles as JSON lines.')
+    parser.add_argument('--tubes', type=int, default=12)
+    parser.add_argument('--colors', type=int, default=10)
+    parser.add_argument('--depth', type=int, default=5)
+    parser.add_argument('--count', type=int, default=100)
+    parser.add_argument('--first-seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--time-limit', type=float, default=2.0)
+    args = parser.parse_args()
+
+    startTime = time.time()
+    generator = PuzzleGenerator(args.time_limit)
+    puzzles = generator.generateBatch(args.tubes, args.colors, args.depth,
+                                      range(args.first_seed, args.first_seed + args.count), args.workers)
+    for p in puzzles:
+        print(json.dumps(p.serialize()))
+    print(f'{len(puzzles)} of {args.count} deals solvable in {time.time() - startTime:.1f}s', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+import argparse
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+from typing import Iterable, Optional, Tuple
+
+from PuzzleGenerator import Puzzle
+
+# (tubes, colors, balls per tube, difficulty)
+SectionKey = Tuple[int, int, int, int]
+
+
+class PuzzleLibrary:
+    """
+    A file of puzzles that have already been proven solvable, so a new game can be started without waiting
+    for PuzzleGenerator.  The file is memory-mapped rather than read, and only the small table at the start
+    of it is looked at when it's opened, so it can hold millions of puzzles without slowing anything down.
+
+    The puzzles are grouped into a section for each size and difficulty, and every puzzle in a section is a
+    record of the same length:  its seed, the length of its solution and then one byte per ball, in the
+    order of Puzzle.balls.  Finding the n-th puzzle of a section is just arithmetic.  The branching, dead end
+    density and score that PuzzleGenerator works out aren't kept.
+    """
+
+    __MAGIC = b'BSL1'
+    # The magic number and the number of sections
+    __header = struct.Struct('<4sI')
+    # Tubes, colors, balls per tube, difficulty, record size, number of records and where they start
+    __section = struct.Struct('<HHBBHIQ')
+    # Seed and solution length; the balls follow
+    __record = struct.Struct('<QH')
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self.__data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, numSections = PuzzleLibrary.__header.unpack_from(self.__data)
+        if magic != PuzzleLibrary.__MAGIC:
+            self.__data.close()
+            raise ValueError(f'{path} is not a puzzle library')
+        # key -> (offset of the first record, number of records, record size)
+        self.__sections: dict[SectionKey, Tuple[int, int, int]] = {}
+        for i in range(numSections):
+            numTubes, numColors, ballsPerTube, difficulty, recordSize, count, offset = \
+                PuzzleLibrary.__section.unpack_from(self.__data, PuzzleLibrary.__header.size + i*PuzzleLibrary.__section.size)
+            self.__sections[(numTubes, numColors, ballsPerTube, difficulty)] = (offset, count, recordSize)
+
+    @staticmethod
+    def open(path: str) -> Optional['PuzzleLibrary']:
+        """
+        Opens the library, or returns None if there isn't one at the path or it can't be read.
+        """
+        try:
+            return PuzzleLibrary(path)
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def close(self) -> None:
+        self.__data.close()
+
+    def count(self, numTubes: int, numColors: int, ballsPerTube: int, difficulty: Optional[int] = None) -> int:
+        """
+        How many puzzles of this size, and of this difficulty if one is given, there are.
+        """
+        if difficulty is not None:
+            section = self.__sections.get((numTubes, numColors, ballsPerTube, difficulty))
+            return 0 if section is None else section[1]
+        return sum(self.count(numTubes, numColors, ballsPerTube, d) for d in range(1, 6))
+
+    def get(self, numTubes: int, numColors: int, ballsPerTube: int, difficulty: int, index: int) -> Puzzle:
+        offset, count, recordSize = self.__sections[(numTubes, numColors, ballsPerTube, difficulty)]
+        if not 0 <= index < count:
+            raise IndexError(index)
+        start = offset + index*recordSize
+        seed, solutionLength = PuzzleLibrary.__record.unpack_from(self.__data, start)
+        ballsStart = start + PuzzleLibrary.__record.size
+        p = Puzzle()
+        p.seed = seed
+        p.numTubes = numTubes
+        p.numColors = numColors
+        p.ballsPerTube = ballsPerTube
+        p.balls = list(self.__data[ballsStart:ballsStart + numColors*ballsPerTube])
+        p.solutionLength = solutionLength
+        p.difficulty = difficulty
+        return p
+
+    def pick(self, numTubes: int, numColors: int, ballsPerTube: int, difficulty: Optional[int] = None,
+             rng: Optional[random.Random] = None) -> Optional[Puzzle]:
+        """
+        A puzzle of this size, and difficulty if one is given, chosen at random; None if there are none.
+        """
+        difficulties = [difficulty] if difficulty is not None else list(range(1, 6))
+        counts = [self.count(numTubes, numColors, ballsPerTube, d) for d in difficulties]
+        total = sum(counts)
+        if total == 0:
+            return None
+        index = (rng or random).randrange(total)
+        for d, count in zip(difficulties, counts):
+            if index < count:
+                return self.get(numTubes, numColors, ballsPerTube, d, index)
+            index -= count
+        return None
+
+    @staticmethod
+    def write(path: str, puzzles: Iterable[Puzzle]) -> int:
+        """
+        Writes the puzzles out as a library, replacing whatever was at the path, and returns how many there
+        were.
+        """
+        sections: dict[SectionKey, list[bytes]] = {}
+        for p in puzzles:
+            key = (p.numTubes, p.numColors, p.ballsPerTube, p.difficulty)
+            sections.setdefault(key, []).append(PuzzleLibrary.__record.pack(p.seed, p.solutionLength) + bytes(p.balls))
+
+        offset = PuzzleLibrary.__header.size + len(sections)*PuzzleLibrary.__section.size
+        temporaryPath = path + '.tmp'
+        with open(temporaryPath, 'wb') as f:
+            f.write(PuzzleLibrary.__header.pack(PuzzleLibrary.__MAGIC, len(sections)))
+            for key, records in sections.items():
+                recordSize = PuzzleLibrary.__record.size + key[1]*key[2]
+                f.write(PuzzleLibrary.__section.pack(*key, recordSize, len(records), offset))
+                offset += recordSize*len(records)
+            for records in sections.values():
+                f.writelines(records)
+        os.replace(temporaryPath, path)
+        return sum(len(records) for records in sections.values())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Build a puzzle library from the JSON lines written by PuzzleGenerator.py.')
+    parser.add_argument('output')
+    parser.add_argument('inputs', nargs='*', help='files of puzzles, one JSON object per line (default: standard input)')
+    args = parser.parse_args()
+
+    def readPuzzles() -> Iterable[Puzzle]:
+        for path in args.inputs or ['-']:
+            with (open(path, 'r') if path != '-' else sys.stdin) as f:
+                for line in f:
+                    if line.strip():
+                        yield Puzzle.parse(json.loads(line))
+    count = PuzzleLibrary.write(args.output, readPuzzles())
+    print(f'{count} puzzles written to {args.output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
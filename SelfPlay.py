@@ -0,0 +1,227 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Iterable, Optional, Tuple
+
+# pygame greets the world on standard output when it's imported, which would get mixed in with the results
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+from Board import Board
+from Journal import Journal
+from PuzzleGenerator import PuzzleGenerator
+from Solver import Move
+from TubeSet import TubeSet
+from pygame.rect import Rect
+from pygame.surface import Surface
+
+# (won, or None if it couldn't be told; moves made; seconds taken; difficulty, if the policy rates it)
+GameResult = Tuple[Optional[bool], int, float, Optional[int]]
+# The moves a player would make from a position, best first.  It mustn't change the board.
+Policy = Callable[[Board], Iterable[Move]]
+
+
+def heuristicMoves(board: Board) -> Iterable[Move]:
+    """
+    The moves the game itself picks:  the sources in the order tryFindMove suggests them, each with the target
+    tryGetAutoMove picks for it.
+    """
+    tubes = SelfPlay.tubesFor(board)
+    first = source = tubes.tryFindMove(None)
+    while source is not None:
+        target = tubes.tryGetAutoMove(source)
+        if target is not None:
+            count = board.moveCount(source.index, target.index)
+            if count > 0:
+                yield source.index, target.index, count
+        source = tubes.tryFindMove(source)
+        if source is first:
+            break
+
+
+def randomMoves(board: Board) -> Iterable[Move]:
+    """
+    Every legal move, in an order shuffled by the position, so the same deal is always played the same way.
+    """
+    moves = list(board.validMoves())
+    random.Random(board.zobristHash).shuffle(moves)
+    return moves
+
+
+class SelfPlay:
+    """
+    Plays lots of seeded deals without a window, across a pool of processes, to find out how often the game
+    sizes can be won and how hard they are.  Each game is played by one of the policies, which are looked up
+    by name and can be added to:
+    - 'heuristic' plays the moves the game itself picks with tryFindMove and tryGetAutoMove, on a TubeSet;
+    - 'random' plays any legal move.
+    A game makes the first move its policy gives that doesn't go back to a position it's already been in,
+    and is lost when there's no such move.  The policies are handed to the worker processes, so they have to
+    be functions defined at the top level of a module.
+
+    'search' isn't a policy:  it has Solver look for a complete solution, and rates the deal like
+    PuzzleGenerator does.
+
+    The deals are the raw ones from PuzzleGenerator.deal, before anything checks that they can be won.
+    """
+
+    # The sizes of the new game buttons: (tubes, colors, balls per tube)
+    presets = {
+        'small': (8, 6, 4),
+        'medium': (12, 10, 5),
+        'big': (16, 13, 8),
+    }
+    policies: dict[str, Policy] = {
+        'heuristic': heuristicMoves,
+        'random': randomMoves,
+    }
+    search = 'search'
+
+    # Each worker process plays all its 'heuristic' games on the same TubeSet
+    __tubes: Optional[TubeSet] = None
+
+    def __init__(self, maxMoves: int = 1000, timeLimit: float = 2.0, workers: Optional[int] = None):
+        """
+        Games that go on for more than maxMoves are lost.  timeLimit is how long the 'search' policy gets
+        per deal, in seconds.  workers is the number of processes, one per CPU by default.
+        """
+        self.maxMoves = maxMoves
+        self.timeLimit = timeLimit
+        self.workers = workers
+
+    def run(self, presets: Iterable[str], policies: Iterable[str], seeds: Iterable[int]) -> list[dict[str,Any]]:
+        """
+        Plays every seed's deal of every preset with every policy and returns a summary of each combination.
+        The policies are named by their keys in SelfPlay.policies, or SelfPlay.search.
+        """
+        seedList = list(seeds)
+        combinations = [(preset, policy) for preset in presets for policy in policies]
+        args = [(SelfPlay.policies.get(policy), *SelfPlay.presets[preset], seed, self.maxMoves, self.timeLimit)
+                for preset, policy in combinations for seed in seedList]
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(SelfPlay._playOne, args, chunksize=max(1, len(args) // (4*(os.cpu_count() or 1)))))
+        report: list[dict[str,Any]] = []
+        for i, (preset, policy) in enumerate(combinations):
+            report.append(SelfPlay.summarize(preset, policy, results[i*len(seedList):(i + 1)*len(seedList)]))
+        return report
+
+    @staticmethod
+    def summarize(preset: str, policy: str, results: list[GameResult]) -> dict[str,Any]:
+        wins = [r for r in results if r[0]]
+        decided = [r for r in results if r[0] is not None]
+        seconds = sorted(r[2] for r in results)
+        difficulties = [r[3] for r in wins if r[3] is not None]
+        return {
+            'preset': preset,
+            'policy': policy,
+            'games': len(results),
+            'wins': len(wins),
+            # Of the games where it could be told, which only matters for 'search'
+            'winRate': len(wins) / len(decided) if decided else None,
+            'undecided': len(results) - len(decided),
+            'movesPerWin': {
+                'mean': statistics.mean(r[1] for r in wins),
+                'median': statistics.median(r[1] for r in wins),
+                'max': max(r[1] for r in wins),
+            } if wins else None,
+            'secondsPerGame': {
+                'mean': statistics.mean(seconds),
+                'median': statistics.median(seconds),
+                'p99': seconds[min(len(seconds) - 1, int(len(seconds)*.99))],
+            } if seconds else None,
+            'difficulty': {d: difficulties.count(d) for d in range(1, 6)} if difficulties else None,
+        }
+
+    @staticmethod
+    def _playOne(args: Tuple[Optional[Policy], int, int, int, int, int, float]) -> GameResult:
+        # Process pool entry point; it has to be reachable by name from the worker processes.  Without a
+        # policy, the deal is searched.
+        policy, numTubes, numColors, ballsPerTube, seed, maxMoves, timeLimit = args
+        start = time.perf_counter()
+        if policy is None:
+            puzzle = PuzzleGenerator(timeLimit).tryGenerate(numTubes, numColors, ballsPerTube, seed)
+            if puzzle is None:
+                # Not found in time; that doesn't say it can't be done
+                return None, 0, time.perf_counter() - start, None
+            return True, puzzle.solutionLength, time.perf_counter() - start, puzzle.difficulty
+        balls = PuzzleGenerator.deal(numColors, ballsPerTube, seed)
+        won, moves = SelfPlay.play(policy, PuzzleGenerator.dealToBoard(balls, numTubes, numColors, ballsPerTube), maxMoves)
+        return won, moves, time.perf_counter() - start, None
+
+    @staticmethod
+    def play(policy: Policy, board: Board, maxMoves: int) -> Tuple[bool, int]:
+        """
+        Plays the board with the policy and returns whether it was won and how many moves it took.
+        """
+        seen = {board.unorderedHash}
+        moves = 0
+        while not board.isWin and moves < maxMoves:
+            for source, target, _ in policy(board):
+                if board.moveCount(source, target) == 0:
+                    continue
+                after = board.copy()
+                after.move(source, target)
+                if after.unorderedHash not in seen:
+                    break
+            else:
+                return False, moves
+            board = after
+            seen.add(board.unorderedHash)
+            moves += 1
+        return board.isWin, moves
+
+    @staticmethod
+    def tubesFor(board: Board) -> TubeSet:
+        """
+        This process's TubeSet, holding the board.  In a game that's usually one move on from the last board
+        it was asked for, which is a lot quicker to make than loading the board all over again.
+        """
+        if SelfPlay.__tubes is None:
+            # Drawn to an off-screen surface that nothing ever looks at
+            SelfPlay.__tubes = TubeSet(Surface((800, 600)), Rect(0, 0, 800, 600))
+        tubes = SelfPlay.__tubes
+        current = tubes.board
+        if current.numTubes == board.numTubes and current.depth == board.depth and current != board:
+            changed = [i for i in range(board.numTubes) if current.tubeHash(i) != board.tubeHash(i)]
+            if len(changed) == 2:
+                source, target = changed if current.height(changed[0]) > board.height(changed[0]) else reversed(changed)
+                count = current.moveCount(source, target)
+                after = current.copy()
+                if count > 0 and after.move(source, target) and after == board:
+                    tubes.replay([(Journal.MOVE, source, target, count)])
+        if tubes.board != board:
+            tubes.loadGame({'balls': [board.tubeContents(i) for i in range(board.numTubes)],
+                            'ballsPerTube': board.depth, 'undoStack': [], 'redoStack': []})
+        return tubes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Play seeded deals with different policies and print statistics as JSON.')
+    parser.add_argument('--preset', action='append', choices=list(SelfPlay.presets), help='game size, can be repeated (default: all)')
+    parser.add_argument('--policy', action='append', choices=list(SelfPlay.policies) + [SelfPlay.search], help='how to play, can be repeated (default: all)')
+    parser.add_argument('--games', type=int, default=1000, help='deals per preset')
+    parser.add_argument('--first-seed', type=int, default=0)
+    parser.add_argument('--max-moves', type=int, default=1000)
+    parser.add_argument('--time-limit', type=float, default=2.0, help="seconds the 'search' policy gets per deal")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', help='write the report to this file instead of standard output')
+    args = parser.parse_args()
+
+    startTime = time.time()
+    simulator = SelfPlay(args.max_moves, args.time_limit, args.workers)
+    report = simulator.run(args.preset or list(SelfPlay.presets), args.policy or list(SelfPlay.policies) + [SelfPlay.search],
+                           range(args.first_seed, args.first_seed + args.games))
+    text = json.dumps({'games': args.games, 'firstSeed': args.first_seed, 'results': report}, indent=1)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+    print(f'played in {time.time() - startTime:.1f}s', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Tuple
+
+# pygame greets the world on standard output when it's imported, which would get mixed in with the results
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import pygame
+from ballsort import initPygame
+from GameColors import GameColors
+from SessionRecorder import SessionRecorder
+from TubeSet import TubeSet
+from pygame.event import Event
+from pygame.rect import Rect
+from pygame.surface import Surface
+
+
+class SessionPlayer:
+    """
+    Plays back a session recorded by SessionRecorder through a TubeSet.  By default it goes as fast as it can,
+    skipping every animation to its end before the next entry and only drawing once it's through, which makes
+    a recording usable as a regression test or as load.  In real time, each entry waits for the moment it was recorded at and the
+    animations play out in between, as they did for the player, for profiling.
+
+    Hints are never searched for while playing back; the solution recorded for each one is used instead, so
+    the session goes the same way however fast the machine is.
+    """
+
+    def __init__(self, window: Surface, session: dict[str,Any]):
+        self.__window = window
+        self.__session = session
+        self.tubes = TubeSet(window, Rect(*session['rect']))
+        self.tubes.loadGame(session['state'])
+        self.tubes.finishAnimations()
+        self.__window.fill(GameColors.WindowBackground)
+        self.tubes.draw()
+
+    @staticmethod
+    def load(path: str) -> dict[str,Any]:
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    @staticmethod
+    def windowSize(session: dict[str,Any]) -> Tuple[int, int]:
+        """
+        How big the window has to be to hold the tubes wherever they were during the session.
+        """
+        rects = [Rect(*session['rect'])] + [Rect(*data) for _, kind, data in session['entries'] if kind == SessionRecorder.REPOSITION]
+        return max(r.right for r in rects), max(r.bottom for r in rects)
+
+    def play(self, realTime: bool = False, maxFps: int = 60) -> None:
+        """
+        Plays every entry.  When it isn't in real time, nothing is drawn until the end.
+        """
+        clock = pygame.time.Clock()
+        start = time.time()
+        for at, kind, data in self.__session['entries']:
+            if realTime:
+                # Input is only recorded once it's handled, so anything still held up by an animation has to be
+                # handled before the next entry, just as it is when the animations are skipped.  Otherwise a
+                # hint or a new game could jump ahead of the input that came before it.
+                while time.time() < start + at or self.tubes.hasPendingInput:
+                    self.__playFrame(clock, maxFps)
+            else:
+                self.tubes.finishAnimations()
+            self.__apply(kind, data, realTime)
+            # Any search that was started is dropped; its result is in the recording
+            self.tubes.cancelHint()
+        if realTime:
+            while self.tubes.isAnimating or self.tubes.hasPendingInput:
+                self.__playFrame(clock, maxFps)
+        self.tubes.finishAnimations()
+        if not realTime:
+            self.__window.fill(GameColors.WindowBackground)
+            self.tubes.invalidate()
+            self.tubes.draw()
+
+    def __playFrame(self, clock: pygame.time.Clock, maxFps: int) -> None:
+        pygame.display.update(self.tubes.update([])) # type: ignore
+        # Held up input can start a search too
+        self.tubes.cancelHint()
+        clock.tick(maxFps)
+
+    def __apply(self, kind: str, data: Any, realTime: bool) -> None:
+        if kind == SessionRecorder.EVENT:
+            # JSON turned the tuples, like the mouse position, into lists
+            attributes = {name: tuple(value) if isinstance(value, list) else value for name, value in data.items() if name != 'type'}
+            self.tubes.update([Event(data['type'], attributes)], draw=realTime)
+        elif kind == SessionRecorder.ACTION:
+            self.tubes.post(getattr(self.tubes, data))
+            self.tubes.update([], draw=realTime)
+        elif kind == SessionRecorder.HINT:
+            self.tubes.useHint(None if data is None else [(s, t, c) for s, t, c in data])
+        elif kind == SessionRecorder.NEW_GAME:
+            if realTime:
+                # Dealt again, to see the animations, but the seed only gives the same deal if it's proven
+                # solvable in time again
+                balls = sum(len(tube) for tube in data['balls'])
+                self.tubes.newGame(len(data['balls']), balls // data['ballsPerTube'], data['ballsPerTube'], data['seed'])
+                if self.tubes.serialize()['balls'] == data['balls']:
+                    return
+            self.tubes.loadGame(data)
+        elif kind == SessionRecorder.REPOSITION:
+            self.__window.fill(GameColors.WindowBackground)
+            self.tubes.invalidate()
+            self.tubes.reposition(Rect(*data))
+
+    @property
+    def matches(self) -> bool:
+        """
+        True if the game ended up where it did when it was recorded, or if the recording doesn't say.
+        """
+        final = self.__session.get('final')
+        return final is None or self.tubes.serialize() == final
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Play back a recorded ball sort session and print how long it took as JSON.')
+    parser.add_argument('session', help='a session recorded with ballsort.py --record')
+    parser.add_argument('--real-time', action='store_true', help='wait between entries as long as the player did, and play the animations')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--show', action='store_true', help='draw to a real window instead of running headless')
+    args = parser.parse_args()
+
+    initPygame(headless=not args.show)
+    session = SessionPlayer.load(args.session)
+    window = pygame.display.set_mode(SessionPlayer.windowSize(session))
+    samples: list[float] = []
+    matches = True
+    for _ in range(args.repeat):
+        player = SessionPlayer(window, session)
+        start = time.perf_counter()
+        player.play(args.real_time)
+        samples.append(time.perf_counter() - start)
+        matches = matches and player.matches
+    entries = len(session['entries'])
+    print(json.dumps({
+        'entries': entries,
+        'seconds': min(samples),
+        'entriesPerSecond': entries / min(samples) if min(samples) > 0 else None,
+        'matches': matches,
+    }, indent=1))
+    if not matches:
+        print('the session ended somewhere other than where it was recorded', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
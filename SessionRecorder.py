@@ -0,0 +1,77 @@
+import json
+import time
+from typing import Any, Optional, Tuple
+from pygame.event import Event
+from pygame.rect import Rect
+
+from Solver import Move
+
+# (seconds since the recording started, kind, data)
+Entry = Tuple[float, str, Any]
+
+
+class SessionRecorder:
+    """
+    Records a session so that it can be played back exactly by SessionPlayer.  It starts from the game's
+    state and where the tubes were on the screen, and then notes, with the time it happened, each input
+    event and button press as it's handled, every new game that's dealt, and every move of the tubes.
+
+    The few things that depend on timing rather than input are recorded by their outcome instead:  the
+    solution a hint found, rather than that a search was started, and the deal of a new game, since what
+    gets dealt depends on how quickly a deal can be proven solvable.
+    """
+
+    EVENT = 'event'
+    ACTION = 'action'
+    HINT = 'hint'
+    NEW_GAME = 'newGame'
+    REPOSITION = 'reposition'
+
+    def __init__(self, state: dict[str,Any], rect: Rect):
+        self.__start = time.time()
+        self.__state = state
+        self.__rect = list(rect)
+        self.__entries: list[Entry] = []
+
+    @property
+    def entries(self) -> list[Entry]:
+        return self.__entries
+
+    def __record(self, kind: str, data: Any) -> None:
+        self.__entries.append((time.time() - self.__start, kind, data))
+
+    def event(self, event: Event) -> None:
+        # Only what can be written out; the rest (like the window it happened in) doesn't matter for playing back
+        attributes = {name: value for name, value in event.dict.items() if isinstance(value, (int, float, str, tuple))}
+        self.__record(SessionRecorder.EVENT, {'type': event.type, **attributes})
+
+    def action(self, name: str) -> None:
+        """
+        A call to the TubeSet method with this name, such as a button press.
+        """
+        self.__record(SessionRecorder.ACTION, name)
+
+    def hint(self, solution: Optional[list[Move]]) -> None:
+        self.__record(SessionRecorder.HINT, None if solution is None else [list(m) for m in solution])
+
+    def newGame(self, state: dict[str,Any]) -> None:
+        self.__record(SessionRecorder.NEW_GAME, state)
+
+    def reposition(self, rect: Rect) -> None:
+        self.__record(SessionRecorder.REPOSITION, list(rect))
+
+    def session(self, finalState: Optional[dict[str,Any]] = None) -> dict[str,Any]:
+        """
+        The recording, ready to be written as JSON.  finalState, if given, is kept so the player can check
+        that it ended up in the same place.
+        """
+        return {
+            'state': self.__state,
+            'rect': self.__rect,
+            'entries': [list(e) for e in self.__entries],
+            'final': finalState,
+        }
+
+    def save(self, path: str, finalState: Optional[dict[str,Any]] = None) -> None:
+        with open(path, 'w') as f:
+            json.dump(self.session(finalState), f, separators=(',', ':'))
@@ -0,0 +1,170 @@
+import heapq
+import time
+from typing import Callable, Iterable, Optional, Tuple
+
+from Board import Board
+
+# A move is (source tube, target tube, number of balls)
+Move = Tuple[int, int, int]
+
+
+class Solver:
+    """
+    Best-first search for a short, complete solution to a board.  With weight=1 this is A* with an admissible
+    heuristic, but since a state is never expanded twice, even then the solution isn't guaranteed to be the
+    shortest one.  Larger weights trade solution length for speed, which is what makes the big boards answer
+    within a fraction of a second.  States are recorded in a transposition table keyed on Board.unorderedHash,
+    so positions that only differ by which tube holds what are searched only once.
+    """
+
+    def __init__(self, timeLimit: float = 2.0, weight: float = 3.0, maxStates: Optional[int] = None):
+        self.timeLimit = timeLimit
+        self.weight = weight
+        self.maxStates = maxStates
+        # Set by solve: how many states were expanded, how many of those had no useful moves at all, and
+        # whether the search was cut short.  If solve returns None and timedOut is False, the board is
+        # proven unsolvable.
+        self.statesExplored = 0
+        self.deadEnds = 0
+        self.timedOut = False
+
+    @staticmethod
+    def heuristic(board: Board) -> int:
+        """
+        A lower bound on the number of moves left.  Every run of balls sitting on top of a different color
+        has to be moved at least once, and each color that is at the bottom of more than one tube needs at
+        least one move per extra tube to get consolidated.  A single move can only take away one of those
+        obligations, from the source tube, so the bound never overestimates.
+        """
+        h = 0
+        bottoms: dict[int, int] = {}
+        for tube in range(board.numTubes):
+            if board.isEmpty(tube):
+                continue
+            contents = board.tubeContents(tube)
+            bottom = contents[0]
+            if bottom in bottoms:
+                h += 1
+            else:
+                bottoms[bottom] = 1
+            previous = bottom
+            for color in contents:
+                if color != previous:
+                    h += 1
+                    previous = color
+        return h
+
+    @staticmethod
+    def usefulMoves(board: Board) -> list[Move]:
+        """
+        All the legal moves, less those that can never be part of a shortest solution:  moving balls out of
+        a finished tube, moving a whole single-colored tube into an empty one, and picking between several
+        empty tubes (they're interchangeable, so only the first one is tried).
+        """
+        moves: list[Move] = []
+        firstEmpty = -1
+        for tube in range(board.numTubes):
+            if board.isEmpty(tube):
+                firstEmpty = tube
+                break
+        for source in range(board.numTubes):
+            if board.isEmpty(source):
+                continue
+            isSingleColor = not board.hasMoreThanOneColor(source)
+            if isSingleColor and board.height(source) == board.depth:
+                continue
+            for target in range(board.numTubes):
+                if board.isEmpty(target) and (target != firstEmpty or isSingleColor):
+                    continue
+                count = board.moveCount(source, target)
+                if count:
+                    moves.append((source, target, count))
+        return moves
+
+    @staticmethod
+    def rankMoves(board: Board, moves: Iterable[Move]) -> list[Move]:
+        """
+        The moves, best first, judged by what each one does without searching any further:  finishing a
+        tube beats stacking onto the same color, which beats uncovering another color or emptying a tube,
+        and leaving part of a run behind counts against a move.  Moves that are judged the same keep the
+        order they were given in.
+        """
+        def score(move: Move) -> int:
+            source, target, count = move
+            value = 0
+            if not board.isEmpty(target):
+                value += 4
+                if board.height(target) + count == board.depth and not board.hasMoreThanOneColor(target):
+                    value += 8
+            if count < board.topCount(source):
+                value -= 3
+            elif board.height(source) > count:
+                value += 2
+            else:
+                value += 1
+            return value
+        return sorted(moves, key=score, reverse=True)
+
+    def solve(self, board: Board, isCancelled: Optional[Callable[[], bool]] = None) -> Optional[list[Move]]:
+        """
+        Returns a short sequence of moves, not necessarily the shortest, that takes the given board to a win
+        (an empty list if it's already won) or None if no solution was found.  The board is not modified.
+        """
+        deadline = time.time() + self.timeLimit
+        self.statesExplored = 0
+        self.deadEnds = 0
+        self.timedOut = False
+
+        startKey = board.unorderedHash
+        # key -> (moves to get here, key of the prior state, move from the prior state)
+        visited: dict[int, Tuple[int, Optional[int], Optional[Move]]] = {startKey: (0, None, None)}
+        closed: set[int] = set()
+        counter = 0
+        startH = Solver.heuristic(board)
+        frontier: list[Tuple[float, int, int, int, int, Board]] = [(self.weight*startH, startH, counter, 0, startKey, board.copy())]
+
+        while frontier:
+            _, h, _, g, key, current = heapq.heappop(frontier)
+            if key in closed or visited[key][0] < g:
+                continue
+            if h == 0 and current.isWin:
+                return Solver.__reconstruct(visited, key)
+            closed.add(key)
+
+            self.statesExplored += 1
+            # Checked on every expansion, since on big boards a single one can take milliseconds
+            if time.time() > deadline or (isCancelled is not None and isCancelled()):
+                self.timedOut = True
+                return None
+            if self.maxStates is not None and self.statesExplored >= self.maxStates:
+                self.timedOut = True
+                return None
+
+            moves = Solver.usefulMoves(current)
+            if not moves:
+                self.deadEnds += 1
+            for move in moves:
+                child = current.copy()
+                child.move(*move)
+                childKey = child.unorderedHash
+                if childKey in closed:
+                    continue
+                prior = visited.get(childKey)
+                if prior is not None and prior[0] <= g + 1:
+                    continue
+                visited[childKey] = (g + 1, key, move)
+                childH = Solver.heuristic(child)
+                counter += 1
+                heapq.heappush(frontier, (g + 1 + self.weight*childH, childH, counter, g + 1, childKey, child))
+        return None
+
+    @staticmethod
+    def __reconstruct(visited: dict[int, Tuple[int, Optional[int], Optional[Move]]], key: int) -> list[Move]:
+        moves: list[Move] = []
+        _, parent, move = visited[key]
+        while parent is not None:
+            assert move is not None
+            moves.append(move)
+            _, parent, move = visited[parent]
+        moves.reverse()
+        return moves
@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Tuple
+import pygame
+from pygame.surface import Surface
+
+# (radius, color, highlighted)
+SpriteKey = Tuple[float, int, bool]
+
+
+class SpriteAtlas:
+    """
+    The rendered ball images, for any number of sizes at once.  Images are kept up to `capacity` of them,
+    and the ones that haven't been used for the longest are dropped to make room.  Once there's a window,
+    images are converted to its pixel format so they don't have to be converted on every blit.
+
+    warm renders the images for a size on a background thread, so that by the time the tubes are drawn at
+    that size (during and after a resize or zoom, say) they're ready.  Anything asked for before then is rendered on the
+    spot, as it would be without warming.
+    """
+
+    def __init__(self, render: Callable[[float, int, bool], Surface], capacity: int = 2048):
+        """
+        render draws the image for a (radius, color, highlighted) key.  It's called from both the game's
+        thread and the warming thread, so it mustn't touch anything shared.
+        """
+        self.__render = render
+        self.capacity = capacity
+        self.__sprites: OrderedDict[SpriteKey, Surface] = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='SpriteAtlas')
+        # Bumped by every call to warm, so a warm-up that's been overtaken by another one stops early
+        self.__warmGeneration = 0
+
+    def __len__(self) -> int:
+        return len(self.__sprites)
+
+    def get(self, radius: float, color: int, highlighted: bool) -> Surface:
+        key = (radius, color, highlighted)
+        with self.__lock:
+            sprite = self.__sprites.get(key)
+            if sprite is not None:
+                self.__sprites.move_to_end(key)
+                return sprite
+        sprite = self.__create(key)
+        self.__store(key, sprite)
+        return sprite
+
+    def __create(self, key: SpriteKey) -> Surface:
+        sprite = self.__render(*key)
+        if pygame.display.get_surface() is not None:
+            sprite = sprite.convert_alpha()
+        return sprite
+
+    def __store(self, key: SpriteKey, sprite: Surface) -> None:
+        with self.__lock:
+            self.__sprites[key] = sprite
+            self.__sprites.move_to_end(key)
+            while len(self.__sprites) > self.capacity:
+                self.__sprites.popitem(last=False)
+
+    def warm(self, radius: float, colors: Iterable[int]) -> None:
+        """
+        Starts rendering, in the background, the plain and highlighted images of the colors at this radius.
+        Does nothing when there's no window to show them in (headless, or in a worker process that only
+        draws off-screen), since then there's no frame for them to be ready for.
+        """
+        if not SpriteAtlas.__hasWindow():
+            return
+        self.__warmGeneration += 1
+        self.__executor.submit(self.__warm, self.__warmGeneration, radius, list(colors))
+
+    @staticmethod
+    def __hasWindow() -> bool:
+        return pygame.display.get_init() and pygame.display.get_surface() is not None and pygame.display.get_driver() != 'dummy'
+
+    def __warm(self, generation: int, radius: float, colors: list[int]) -> None:
+        for color in colors:
+            for highlighted in (False, True):
+                if generation != self.__warmGeneration:
+                    return
+                key = (radius, color, highlighted)
+                with self.__lock:
+                    if key in self.__sprites:
+                        continue
+                self.__store(key, self.__create(key))
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__sprites.clear()
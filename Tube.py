@@ -1,10 +1,13 @@
-from typing import Final, Optional, Tuple, Union
+import math
+from typing import Any, Final, Optional, Tuple, Union
 import pygame
 from BallGroup import BallGroup
+from Board import Board
+from Fonts import Fonts
 from GameColors import GameColors
 from pygame.surface import Surface
 from pygame.rect import Rect
-from pygame.font import Font, SysFont
+from SpriteAtlas import SpriteAtlas
 
 
 class Tube:
@@ -13,11 +16,8 @@ class Tube:
     # This is horizontal and vertical, but it is a fraction of the total width of the rectangle.
     __SPACE_BETWEEN_BALLS: Final[float] = .1
 
-    __cachedBallImages: list[Surface] = []
-    __cachedBallImagesHighlighted: list[Surface] = []
-    __cachedBallImagesRadius: float = -1
-
-    __hintFont: Optional[Font] = None
+    # Created on first use
+    __ballImages: Optional[SpriteAtlas] = None
 
     
     __ballColors = (
@@ -39,76 +39,119 @@ class Tube:
         (169, 169, 169), # dark gray
     )
 
-    def __init__(self, window: Surface, rect: Rect, hintKey: str, numBalls: int):
-        if not Tube.__hintFont:
-            Tube.__hintFont = SysFont('arial', 16)
-        self.__emptySlots: int = numBalls
-        self.__ballGroups: list[BallGroup] = list()
+    @staticmethod
+    def getBallColor(color: int) -> Tuple[int,int,int]:
+        """
+        The hand-picked colors come first; past those, hues are spread out by the golden ratio so that each new
+        one lands far from the others, with the brightness varied from round to round.
+        """
+        if color < len(Tube.__ballColors):
+            return Tube.__ballColors[color]
+        generated = color - len(Tube.__ballColors)
+        c = pygame.Color(0)
+        c.hsva = ((generated*0.618033988749895 % 1)*360, 100 - 25*(generated//7 % 3), 100 - 20*(generated//3 % 3), 100)
+        return c.r, c.g, c.b
+
+    @staticmethod
+    def __drawBallShape(surface: Surface, color: int, radius: float) -> None:
+        x = radius
+        y = radius
+        rgb = Tube.getBallColor(color)
+        # Five shapes for the hand-picked colors; the generated ones can also be hexagons, stars and rings, to
+        # keep similar hues apart.
+        shape = color % 5 if color < len(Tube.__ballColors) else color % 8
+        if shape == 0:
+            pygame.draw.circle(surface, rgb, [x,y], radius)
+        elif shape == 1:
+            pygame.draw.rect(surface, rgb, Rect(x-radius,y-radius,2*radius,2*radius))
+        elif shape == 2:
+            pygame.draw.polygon(surface, rgb,
+                [(x,y-radius), 
+                (x-radius,y),
+                (x,y+radius),
+                (x+radius,y)])
+        elif shape == 3:
+            pygame.draw.polygon(surface, rgb,
+                [(x,y-radius), 
+                (x-radius,y+radius),
+                (x+radius,y+radius)])
+        elif shape == 4:
+            pygame.draw.polygon(surface, rgb,
+                [(x-radius,y-radius),
+                (x+radius,y-radius),
+                (x,y+radius)])
+        elif shape == 5:
+            pygame.draw.polygon(surface, rgb,
+                [(x + radius*math.cos(a*math.pi/3), y + radius*math.sin(a*math.pi/3)) for a in range(6)])
+        elif shape == 6:
+            pygame.draw.polygon(surface, rgb,
+                [(x + (radius if a % 2 == 0 else radius*.45)*math.sin(a*math.pi/5), y - (radius if a % 2 == 0 else radius*.45)*math.cos(a*math.pi/5)) for a in range(10)])
+        else:
+            pygame.draw.circle(surface, rgb, [x,y], radius, width=max(1, int(radius*.45)))
+
+    def __init__(self, window: Surface, rect: Rect, hintKey: str, board: Board, index: int):
         self.rect: Rect = rect
         self.__window: Surface = window
-        self.__numBalls: int = numBalls
+        self.__board: Board = board
+        self.__index: int = index
+        self.__numBalls: int = board.depth
         self.__hintKey = hintKey
+        # How many of the top balls not to draw, because an animation is drawing them instead
+        self.hiddenBalls: int = 0
+        # What the tube looked like the last time it was drawn, or None if what's on the screen isn't known
+        self.__drawnState: Optional[Tuple[Any, ...]] = None
+        # The background, balls and hint label pre-rendered at self.rect's size, and the state it shows
+        self.__composite: Optional[Surface] = None
+        self.__compositeState: Optional[Tuple[Any, ...]] = None
+
+    @property
+    def index(self) -> int:
+        return self.__index
 
     def peek(self) -> BallGroup:
-        return self.__ballGroups[0]
+        color, count = self.__board.peek(self.__index)
+        return BallGroup(color, count)
 
     def serialize(self) -> list[int]:
-        batch: list[int] = []
-        for g in self.__ballGroups:
-            for _ in range(g.count):
-                batch.insert(0, g.color)
-        return batch
+        return self.__board.tubeContents(self.__index)
+
+    @property
+    def ballCount(self) -> int:
+        return self.__board.height(self.__index)
 
     @property
     def emptySlots(self) -> int:
-        return self.__emptySlots
+        return self.__board.emptySlots(self.__index)
 
     def pop(self, numBalls: Optional[int]) -> BallGroup:
-        if numBalls is None or self.__ballGroups[0].count == numBalls:
-            r = self.__ballGroups.pop(0)
-            self.__emptySlots += r.count
-        else:
-            assert self.__ballGroups[0].count >= numBalls
-            self.__ballGroups[0].count -= numBalls
-            r = BallGroup(self.__ballGroups[0].color, numBalls)
-            self.__emptySlots += numBalls
-        return r
+        if numBalls is None:
+            numBalls = self.__board.topCount(self.__index)
+        color = self.__board.pop(self.__index, numBalls)
+        return BallGroup(color, numBalls)
 
     def removeBalls(self, count: int) -> None:
-        if self.__ballGroups[0].count == count:
-            self.__ballGroups.pop(0)
-        else:
-            self.__ballGroups[0].count -= count
-        self.__emptySlots += count
+        self.__board.pop(self.__index, count)
 
     @property
     def isEmpty(self) -> bool:
-        return not any(self.__ballGroups)
+        return self.__board.isEmpty(self.__index)
     
     @property
     def hasMoreThanOneColor(self) -> bool:
-        return len(self.__ballGroups) > 1
+        return self.__board.hasMoreThanOneColor(self.__index)
 
     @property
     def isComplete(self) -> bool:
-        return self.__emptySlots == self.__numBalls or (len(self.__ballGroups) == 1 and self.__emptySlots == 0)
+        return self.__board.isComplete(self.__index)
 
     def canAddBallGroup(self, group: BallGroup) -> bool:
-        if self.__emptySlots < group.count: return False
-        if len(self.__ballGroups) == 0: return True
-        return self.__ballGroups[0].color == group.color
+        return self.__board.canAdd(self.__index, group.color, group.count)
 
     def canAddBallGroupPartial(self, group: BallGroup) -> bool:
-        if self.__emptySlots == 0: return False
-        if len(self.__ballGroups) == 0: return True
-        return self.__ballGroups[0].color == group.color
+        return self.__board.canAddPartial(self.__index, group.color)
 
     def push(self, group: BallGroup) -> None:
-        if len(self.__ballGroups) > 0 and self.__ballGroups[0].color == group.color:
-            self.__ballGroups[0].count += group.count
-        else:
-            self.__ballGroups.insert(0, group)
-        self.__emptySlots -= group.count
+        self.__board.push(self.__index, group.color, group.count)
 
     @staticmethod
     def getMaxUsableSize(size: Tuple[float,float], numBalls: int) -> Tuple[float,float]:
@@ -130,6 +173,13 @@ class Tube:
         widthIfHeightIsTheDecider = width * height / heightIfWidthIsTheDecider
         return widthIfHeightIsTheDecider, height
 
+    @staticmethod
+    def getBallRadius(width: int) -> float:
+        """
+        The radius of the balls in a tube that's this wide.
+        """
+        return width*(1 - Tube.__SPACE_BETWEEN_BALLS - Tube.__HORIZONTAL_SPACE_BETWEEN_TUBES)/2
+
     def getBallPosition(self, ballPosition: float) -> Rect:
         """
         Gets the rectangle where a ball should be drawn to given the current dimensions.  Note that ballPosition
@@ -139,7 +189,7 @@ class Tube:
         """
         spaceBetweenBalls = self.rect.width*Tube.__SPACE_BETWEEN_BALLS
         horizontalSpaceBetweenTubes = self.rect.width*Tube.__HORIZONTAL_SPACE_BETWEEN_TUBES
-        radius = (self.rect.width - spaceBetweenBalls - horizontalSpaceBetweenTubes)/2
+        radius = Tube.getBallRadius(self.rect.width)
         left = self.rect.left + (spaceBetweenBalls + horizontalSpaceBetweenTubes)/2
         # Counting up from the bottom is less perilous
         top = self.rect.bottom + .5*spaceBetweenBalls - (self.__numBalls - ballPosition)*(radius*2+spaceBetweenBalls)
@@ -152,64 +202,86 @@ class Tube:
 
     def setPosition(self, newPosition: Rect) -> None:
         self.rect = newPosition
+        self.invalidate()
 
-    def getBallImage(self, color: int, isHighlighted: bool) -> Surface:
-        radius = self.getBallPosition(0).width/2
-        if radius != Tube.__cachedBallImagesRadius:
-            Tube.__cachedBallImages = []
-            Tube.__cachedBallImagesHighlighted = []
-
-        assert(len(Tube.__cachedBallImages) == len(Tube.__cachedBallImagesHighlighted))
-        for i in range(len(Tube.__cachedBallImages), color+1):
-            x = radius
-            y = radius
-            ballImage = Surface((2*radius,2*radius), pygame.SRCALPHA)
-            if i % 5 == 0:
-                pygame.draw.circle(ballImage, Tube.__ballColors[i], [x,y], radius)
-            elif i % 5 == 1:
-                pygame.draw.rect(ballImage, Tube.__ballColors[i], Rect(x-radius,y-radius,2*radius,2*radius))
-            elif i % 5 == 2:
-                pygame.draw.polygon(ballImage, Tube.__ballColors[i],
-                    [(x,y-radius), 
-                    (x-radius,y),
-                    (x,y+radius),
-                    (x+radius,y)])
-            elif i % 5 == 3:
-                pygame.draw.polygon(ballImage, Tube.__ballColors[i],
-                    [(x,y-radius), 
-                    (x-radius,y+radius),
-                    (x+radius,y+radius)])
-            elif i % 5 == 4:
-                pygame.draw.polygon(ballImage, Tube.__ballColors[i],
-                    [(x-radius,y-radius),
-                    (x+radius,y-radius),
-                    (x,y+radius)])
-            Tube.__cachedBallImages.append(ballImage)
-            ballImageHighlighted = Surface(ballImage.get_size(), pygame.SRCALPHA)
-            ballImageHighlighted.blit(ballImage, (0,0))
-            pygame.draw.circle(ballImageHighlighted, (0,0,0), (radius, radius), radius*.2)
-            Tube.__cachedBallImagesHighlighted.append(ballImageHighlighted)
+    def invalidate(self) -> None:
+        """
+        Forgets what was last drawn, so the next redraw can't be skipped.  Needed when something else has
+        painted over the tube.
+        """
+        self.__drawnState = None
 
+    def __getDrawState(self, canAddHighlight: bool, lift: float, highlightedColor: Union[int,None]) -> Tuple[Any, ...]:
+        # The highlighted color only matters if it's in this tube
+        if highlightedColor is not None and not any(color == highlightedColor for color, _ in self.__board.groups(self.__index)):
+            highlightedColor = None
+        return (self.__board.tubeHash(self.__index), canAddHighlight, lift, highlightedColor, self.hiddenBalls, tuple(self.rect))
+
+    def isDrawnAs(self, canAddHighlight: bool, lift: float, highlightedColor: Union[int,None]) -> bool:
+        """
+        True if drawing the tube with these arguments would leave the screen unchanged.
+        """
+        return self.__drawnState == self.__getDrawState(canAddHighlight, lift, highlightedColor)
+
+    @staticmethod
+    def __renderBall(radius: float, color: int, isHighlighted: bool) -> Surface:
+        ballImage = Surface((2*radius,2*radius), pygame.SRCALPHA)
+        Tube.__drawBallShape(ballImage, color, radius)
         if isHighlighted:
-            return Tube.__cachedBallImagesHighlighted[color]
-        else:
-            return Tube.__cachedBallImages[color]
+            pygame.draw.circle(ballImage, (0,0,0), (radius, radius), radius*.2)
+        return ballImage
+
+    @staticmethod
+    def __getBallImages() -> SpriteAtlas:
+        if Tube.__ballImages is None:
+            Tube.__ballImages = SpriteAtlas(Tube.__renderBall)
+        return Tube.__ballImages
+
+    @staticmethod
+    def warmBallImages(width: int, numColors: int) -> None:
+        """
+        Starts rendering the balls for tubes of this width in the background, ahead of them being drawn.
+        """
+        Tube.__getBallImages().warm(Tube.getBallRadius(width), range(numColors))
+
+    def getBallImage(self, color: int, isHighlighted: bool) -> Surface:
+        return Tube.__getBallImages().get(Tube.getBallRadius(self.rect.width), color, isHighlighted)
+
+    def draw(self, canAddHighlight: bool, lift: float, highlightedColor: Union[int,None]) -> None:
+        state = self.__getDrawState(canAddHighlight, lift, highlightedColor)
+        # The composite doesn't depend on where the tube is, only its size, so it survives scrolling
+        compositeState = state[:-1] + (self.rect.size,)
+        if self.__composite is None or compositeState != self.__compositeState:
+            self.__composite = self.__renderComposite(canAddHighlight, lift, highlightedColor)
+            self.__compositeState = compositeState
+        self.__window.blit(self.__composite, self.rect)
+        self.__drawnState = state
 
-    def draw(self, canAddHighlight: bool, isSourceHighlight: bool, highlightedColor: Union[int,None]) -> None:
+    def __renderComposite(self, canAddHighlight: bool, lift: float, highlightedColor: Union[int,None]) -> Surface:
+        composite = Surface(self.rect.size)
+        composite.fill(GameColors.WindowBackground)
+        # Everything below is positioned in window coordinates, so shift it to the composite's
+        offset = (-self.rect.left, -self.rect.top)
         backgroundColor = GameColors.ValidTargetTubeBackground if canAddHighlight else GameColors.TubeBackground
         hintColor = GameColors.KeyboardHintCanMoveTo if canAddHighlight else GameColors.KeyboardHintNormal
-        pygame.draw.rect(self.__window, backgroundColor, self.getTubeRectangle())
+        pygame.draw.rect(composite, backgroundColor, self.getTubeRectangle().move(offset))
 
-        ballNumber = self.__emptySlots
-        for group in self.__ballGroups:
-            image = self.getBallImage(group.color, group.color == highlightedColor)
-            for _ in range(group.count):
-                self.__window.blit(image, self.getBallPosition(ballNumber - (.5 if isSourceHighlight and group is self.__ballGroups[0] else 0)))
+        ballNumber = self.emptySlots
+        isTopGroup = True
+        for color, count in self.__board.groups(self.__index):
+            image = self.getBallImage(color, color == highlightedColor)
+            for _ in range(count):
+                if ballNumber >= self.emptySlots + self.hiddenBalls:
+                    composite.blit(image, self.getBallPosition(ballNumber - (.5*lift if isTopGroup else 0)).move(offset))
                 ballNumber += 1
+            isTopGroup = False
 
-        assert(Tube.__hintFont is not None)
-        hintImage = Tube.__hintFont.render(self.__hintKey, True, hintColor)
+        # Only the first few tubes have keyboard shortcuts
+        if not self.__hintKey:
+            return composite
+        hintImage = Fonts.get(16).render(self.__hintKey, True, hintColor)
         hintImageRect = hintImage.get_rect()
-        hintPositionAsBall = self.getBallPosition(-1 - (.5 if isSourceHighlight else 0))
+        hintPositionAsBall = self.getBallPosition(-1 - .5*lift)
         hintLeft: float = hintPositionAsBall.left + (hintPositionAsBall.width - hintImageRect.width)/2
-        self.__window.blit(hintImage, (hintLeft, hintPositionAsBall.top))
+        composite.blit(hintImage, (hintLeft + offset[0], hintPositionAsBall.top + offset[1]))
+        return composite
@@ -0,0 +1,297 @@
+import math
+from typing import Callable, Optional, Sequence, Tuple
+
+from Animation import Animation
+from BallGroup import BallGroup
+from Tube import Tube
+import numpy
+from pygame.rect import Rect
+from pygame.surface import Surface
+
+
+def interpolate(waypoints: Sequence[Tuple[float, float]]) -> Callable[[float], Tuple[float,float]]:
+    totalLength = -1.0
+    lengths: list[float] = list()
+    lastWaypoint = (0.0,0.0)
+    for pair in waypoints:
+        if totalLength < 0:
+            lastWaypoint = pair
+            totalLength = 0
+        else:
+            dx = pair[0] - lastWaypoint[0]
+            dy = pair[1] - lastWaypoint[1]
+            length = math.sqrt(dx*dx+dy*dy)
+            totalLength += length
+            lastWaypoint = pair
+            lengths.append(length)
+    def interpolation(progress: float) -> Tuple[float,float]:
+        index = 0
+        totalLengthSoFar = 0.0
+        while totalLengthSoFar < progress * totalLength:
+            totalLengthSoFar += lengths[index]
+            index += 1
+        if index == 0:
+            return waypoints[0]
+        # index is the next waypoint - we're between waypoints[index-1] and waypoints[index]
+        priorWaypointDistance = 0.0
+        for i in range(index-1): priorWaypointDistance += lengths[i]
+        progressBetweenPoints = (totalLength*progress - priorWaypointDistance)/lengths[index-1]
+        x = waypoints[index-1][0] + (waypoints[index][0] - waypoints[index-1][0])*progressBetweenPoints
+        y = waypoints[index-1][1] + (waypoints[index][1] - waypoints[index-1][1])*progressBetweenPoints
+        return x,y
+    return interpolation
+
+
+class SelectionAnimation(Animation):
+    """
+    Raises or lowers the top group of balls in a tube as it is selected or deselected.  It doesn't paint
+    anything itself; TubeSet draws the tube at the current `lift`.
+    """
+    blocksInput = False
+
+    def __init__(self, tube: Tube, fromLift: float, toLift: float):
+        super().__init__(.1)
+        self.tube = tube
+        self.__fromLift = fromLift
+        self.__toLift = toLift
+        self.lift = fromLift
+
+    def update(self, now: float) -> bool:
+        progress = self.progress(now)
+        self.lift = self.__fromLift + (self.__toLift - self.__fromLift)*progress
+        return progress < 1
+
+
+class MoveAnimation(Animation):
+    """
+    Flies balls from the top of one tube to another.  It has to be created after the balls have been taken
+    out of the source tube and before they are put into the target, and it keeps them hidden in the target
+    until they land.
+    """
+
+    def __init__(self, source: Tube, target: Tube, moving: BallGroup, sourceIsSelected: bool):
+        super().__init__(.25)
+        self.__target = target
+        self.__count = moving.count
+        self.__ballImage = source.getBallImage(moving.color, isHighlighted=False)
+        self.__interpolatorFunctions: list[Callable[[float], Tuple[float,float]]] = []
+        self.__positions: list[Tuple[float,float]] = []
+
+        topOfSourceTube: Tuple[float,float] = source.getBallPosition(-1).topleft
+        topOfTargetTube: Tuple[float,float] = target.getBallPosition(-1).topleft
+        for i in range(moving.count):
+            start: Tuple[float,float] = source.getBallPosition(source.emptySlots - moving.count + i - (.5 if sourceIsSelected else 0)).topleft
+            end: Tuple[float,float] = target.getBallPosition(target.emptySlots - 1 - i).topleft
+            self.__interpolatorFunctions.append(interpolate([start,topOfSourceTube,topOfTargetTube,end]))
+
+    def begin(self, now: float) -> None:
+        super().begin(now)
+        self.__target.hiddenBalls += self.__count
+
+    def update(self, now: float) -> bool:
+        progress = self.progress(now)
+        self.__positions = [f(progress) for f in self.__interpolatorFunctions]
+        return progress < 1
+
+    def paint(self, window: Surface) -> list[Rect]:
+        areas: list[Rect] = []
+        for topLeft in self.__positions:
+            areas.append(window.blit(self.__ballImage, topLeft))
+        return areas
+
+    def finish(self) -> None:
+        self.__target.hiddenBalls -= self.__count
+
+
+class RearrangeAnimation(Animation):
+    """
+    Flies balls straight from where they were to where they are now, for when the tubes jump over several
+    moves at once.  Balls at the bottom of a tube that didn't change stay put; the rest each go to a slot
+    that gained a ball of the same color.  `before` lists the old contents of each tube, bottom first, and
+    the tubes have to already hold the new ones.
+    """
+
+    def __init__(self, tubes: list[Tube], before: list[list[int]]):
+        super().__init__(.4)
+        self.__arrivals: list[Tuple[Tube, int]] = []
+        self.__flights: list[Tuple[Surface, Callable[[float], Tuple[float,float]]]] = []
+        self.__positions: list[Tuple[Surface, Tuple[float,float]]] = []
+
+        # color -> the (tube, slot) pairs that lost a ball of that color, slots counting down from the top
+        departures: dict[int, list[Tuple[Tube, int]]] = {}
+        arrivals: list[Tuple[Tube, int, int]] = []
+        for tube, old in zip(tubes, before):
+            new = tube.serialize()
+            unchanged = 0
+            while unchanged < min(len(old), len(new)) and old[unchanged] == new[unchanged]:
+                unchanged += 1
+            depth = tube.emptySlots + tube.ballCount
+            for i in range(unchanged, len(old)):
+                departures.setdefault(old[i], []).append((tube, depth - 1 - i))
+            for i in range(unchanged, len(new)):
+                arrivals.append((tube, depth - 1 - i, new[i]))
+            if len(new) > unchanged:
+                self.__arrivals.append((tube, len(new) - unchanged))
+
+        for target, slot, color in arrivals:
+            source, sourceSlot = departures[color].pop()
+            waypoints = [source.getBallPosition(sourceSlot).topleft, source.getBallPosition(-1).topleft,
+                         target.getBallPosition(-1).topleft, target.getBallPosition(slot).topleft]
+            self.__flights.append((target.getBallImage(color, isHighlighted=False), interpolate(waypoints)))
+
+    def begin(self, now: float) -> None:
+        super().begin(now)
+        for tube, count in self.__arrivals:
+            tube.hiddenBalls += count
+
+    def update(self, now: float) -> bool:
+        progress = self.progress(now)
+        self.__positions = [(image, f(progress)) for image, f in self.__flights]
+        return progress < 1
+
+    def paint(self, window: Surface) -> list[Rect]:
+        return [window.blit(image, topLeft) for image, topLeft in self.__positions]
+
+    def finish(self) -> None:
+        for tube, count in self.__arrivals:
+            tube.hiddenBalls -= count
+
+
+class NewGameAnimation(Animation):
+    """
+    Flies every ball in from the edges of the window into its place in the freshly-dealt tubes.  The balls
+    have to already be in the tubes; they're kept hidden until the animation is over.  The flight plan for
+    all the balls is kept in arrays so that each frame is worked out in one go rather than ball by ball.
+    """
+
+    def __init__(self, window: Surface, tubes: list[Tube], numBallsPerTube: int, balls: list[int]):
+        super().__init__(0)
+        self.__tubes = tubes
+        self.__background: Optional[Surface] = None
+        self.__now = 0.0
+        self.__isDone = False
+
+        numBalls = len(balls)
+        rng = numpy.random.default_rng()
+        screenWidth, screenHeight = window.get_size()
+        ballWidth, ballHeight = tubes[0].getBallImage(0,False).get_size()
+        ballImages = [tubes[0].getBallImage(color, isHighlighted=False) for color in range(max(balls, default=-1)+1)]
+        self.__images = [ballImages[color] for color in balls]
+
+        # Ball i goes into tube i // numBallsPerTube, filling it from the bottom
+        tube = numpy.arange(numBalls) // numBallsPerTube
+        depth = numBallsPerTube - 1 - numpy.arange(numBalls) % numBallsPerTube
+        usedTubes = tubes[:(numBalls + numBallsPerTube - 1) // numBallsPerTube]
+        tubeTops = numpy.array([t.getBallPosition(-1).topleft for t in usedTubes], dtype=float).reshape(-1, 2)
+        slotHeight = tubes[0].getBallPosition(1).top - tubes[0].getBallPosition(0).top
+
+        # What we want to animate is a condition where the balls arrive at the top of the tube
+        # sequentially and thus don't overlap as they go down.  Times are relative to the start.
+        timeSpentInTube = .5
+        self.__verticalSpeedInTube = (numBallsPerTube*slotHeight) / timeSpentInTube
+        tubeArrivalTime = rng.integers(0, 20, size=len(usedTubes)) / 10
+        self.__arrivalTime = .25 + ((1 + numBallsPerTube - depth)/numBallsPerTube)*timeSpentInTube + tubeArrivalTime[tube]
+
+        # Each ball starts just outside a random edge:  left, right, top or bottom
+        edge = rng.integers(0, 4, size=numBalls)
+        alongX = rng.integers(-ballWidth, screenWidth + 1, size=numBalls)
+        alongY = rng.integers(-ballHeight, screenHeight + 1, size=numBalls)
+        self.__start = numpy.empty((numBalls, 2))
+        self.__start[:,0] = numpy.select([edge == 0, edge == 1], [-ballWidth, screenWidth], alongX)
+        self.__start[:,1] = numpy.select([edge == 2, edge == 3], [-ballHeight, screenHeight], alongY)
+        self.__topOfTube = tubeTops[tube]
+        self.__finalY = self.__topOfTube[:,1] + (depth + 1)*slotHeight
+
+    def begin(self, now: float) -> None:
+        super().begin(now)
+        self.__now = now
+        for tube in self.__tubes:
+            tube.hiddenBalls += tube.ballCount
+
+    def update(self, now: float) -> bool:
+        self.__now = now
+        return not self.__isDone
+
+    def __positionsAt(self, elapsed: float) -> numpy.ndarray:
+        transitPercentage = numpy.minimum(elapsed / self.__arrivalTime, 1)[:,None]
+        positions = self.__start + (self.__topOfTube - self.__start)*transitPercentage
+        inTube = elapsed > self.__arrivalTime
+        fallen = self.__topOfTube[:,1] + self.__verticalSpeedInTube*(elapsed - self.__arrivalTime)
+        positions[:,1] = numpy.where(inTube, numpy.minimum(fallen, self.__finalY), positions[:,1])
+        return positions
+
+    def paint(self, window: Surface) -> list[Rect]:
+        # The first frame is painted over the empty tubes, so that becomes the background for the rest.
+        if self.__background is None:
+            self.__background = window.copy()
+        window.blit(self.__background, (0,0))
+        elapsed = self.__now - self.startTime
+        positions = self.__positionsAt(elapsed)
+        self.__isDone = bool(numpy.all(positions[:,1] >= self.__finalY))
+        window.blits(list(zip(self.__images, positions.tolist())), doreturn=False)
+        return [window.get_rect()]
+
+    def finish(self) -> None:
+        for tube in self.__tubes:
+            tube.hiddenBalls -= tube.ballCount
+
+
+class EraseGameAnimation(Animation):
+    """
+    Jiggles the balls of the game that's being replaced and then flings them off the window.  `background`
+    is the window as it looks with the old tubes emptied out, and `balls` lists their old contents, top
+    slot first, with -1 for the empty slots.  Like NewGameAnimation, every ball is moved at once using arrays.
+    """
+
+    # How much faster a ball flies off than it jiggles
+    __ESCAPE_MULTIPLIER = 12
+
+    def __init__(self, background: Surface, tubes: list[Tube], numBallsPerTube: int, balls: list[int]):
+        super().__init__(0)
+        self.__background = background
+        self.__now = 0.0
+        self.__isDone = False
+        rng = numpy.random.default_rng()
+        screenWidth, screenHeight = background.get_size()
+        ballWidth, ballHeight = tubes[0].getBallImage(0,False).get_size()
+        ballImages = [tubes[0].getBallImage(color, isHighlighted=False) for color in range(max(balls, default=-1)+1)]
+
+        # Slot i is tube i // numBallsPerTube, i % numBallsPerTube balls down from the top
+        slots = numpy.array(balls, dtype=numpy.intp).reshape(-1)
+        occupied = numpy.flatnonzero(slots >= 0)
+        self.__images = [ballImages[color] for color in slots[occupied]]
+        slotHeight = tubes[0].getBallPosition(1).top - tubes[0].getBallPosition(0).top
+        tubeTops = numpy.array([t.getBallPosition(0).topleft for t in tubes], dtype=float).reshape(-1, 2)
+        self.__start = tubeTops[occupied // numBallsPerTube]
+        self.__start[:,1] += (occupied % numBallsPerTube)*slotHeight
+
+        numBalls = len(occupied)
+        direction = rng.integers(0, 2, size=(numBalls, 2))*2 - 1
+        self.__delta = numpy.array([ballWidth, ballHeight]) * rng.integers(50, 100, size=(numBalls, 2))/100 * direction
+        self.__jiggleDuration = .75 * rng.integers(50, 100, size=numBalls)/100
+        self.__lowerBound = numpy.array([-ballWidth, -ballHeight])
+        self.__upperBound = numpy.array([screenWidth, screenHeight])
+
+    def begin(self, now: float) -> None:
+        super().begin(now)
+        self.__now = now
+
+    def update(self, now: float) -> bool:
+        self.__now = now
+        return not self.__isDone
+
+    def __positionsAt(self, elapsed: float) -> numpy.ndarray:
+        jiggling = elapsed <= self.__jiggleDuration
+        amplitude = numpy.where(jiggling,
+                                numpy.sin(math.pi*6*elapsed/self.__jiggleDuration)*elapsed/self.__jiggleDuration,
+                                (elapsed - self.__jiggleDuration)*EraseGameAnimation.__ESCAPE_MULTIPLIER)
+        return self.__start + self.__delta*amplitude[:,None]
+
+    def paint(self, window: Surface) -> list[Rect]:
+        window.blit(self.__background, (0,0))
+        positions = self.__positionsAt(self.__now - self.startTime)
+        onScreen = numpy.flatnonzero(numpy.all((positions >= self.__lowerBound) & (positions <= self.__upperBound), axis=1))
+        self.__isDone = len(onScreen) == 0
+        images = self.__images
+        window.blits([(images[i], position) for i, position in zip(onScreen.tolist(), positions[onScreen].tolist())], doreturn=False)
+        return [window.get_rect()]
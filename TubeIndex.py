@@ -0,0 +1,60 @@
+from typing import Optional
+
+from Board import Board
+
+
+class TubeIndex:
+    """
+    Which tubes have each color on top, and which tubes are empty, for looking up the places a group of
+    balls can go without checking every tube.  It has to be told about every tube whose contents change,
+    through update, or about all of them at once through rebuild.
+    """
+
+    def __init__(self, board: Board):
+        self.rebuild(board)
+
+    def rebuild(self, board: Board) -> None:
+        self.__board = board
+        # color -> the tubes with that color on top
+        self.__byTopColor: dict[int, set[int]] = {}
+        self.__topColors: list[int] = [-1]*board.numTubes
+        self.__empty: set[int] = set()
+        for tube in range(board.numTubes):
+            self.__add(tube)
+
+    def __add(self, tube: int) -> None:
+        color = self.__board.topColor(tube)
+        self.__topColors[tube] = color
+        if color < 0:
+            self.__empty.add(tube)
+        else:
+            self.__byTopColor.setdefault(color, set()).add(tube)
+
+    def update(self, tube: int) -> None:
+        old = self.__topColors[tube]
+        if old < 0:
+            self.__empty.discard(tube)
+        else:
+            self.__byTopColor[old].discard(tube)
+        self.__add(tube)
+
+    def tubesWithTopColor(self, color: int) -> set[int]:
+        """
+        The tubes whose top ball is the given color.  The set belongs to the index and must not be changed.
+        """
+        return self.__byTopColor.get(color, set())
+
+    @property
+    def emptyTubes(self) -> set[int]:
+        return self.__empty
+
+    @property
+    def firstEmptyTube(self) -> Optional[int]:
+        return min(self.__empty) if self.__empty else None
+
+    def targetsFor(self, color: int, count: int) -> list[int]:
+        """
+        The non-empty tubes that can take all of a group of `count` balls of the given color, in order.
+        """
+        board = self.__board
+        return sorted(t for t in self.tubesWithTopColor(color) if board.emptySlots(t) >= count)
@@ -1,19 +1,35 @@
-import math
-from random import randint, randrange
+from collections import deque
+from random import getrandbits
 import time
-from typing import Any, Callable, Iterable, Optional, Tuple
+from typing import Any, Callable, Iterable, Optional, Tuple, Union
 
 import pygame
+from Animation import Timeline
 from BallGroup import BallGroup
+from Board import Board
+from DeadEndDetector import Analysis, DeadEndDetector
+from FrameProfiler import FrameProfiler
 from GameColors import GameColors
+from HintWorker import HintWorker
+from History import History
+from Journal import Journal, Record
 from MoveRecord import MoveRecord
+from PuzzleGenerator import Puzzle, PuzzleGenerator
+from SessionRecorder import SessionRecorder
+from Solver import Move, Solver
 from Tube import Tube
+from TubeIndex import TubeIndex
+from TubeAnimations import EraseGameAnimation, MoveAnimation, NewGameAnimation, RearrangeAnimation, SelectionAnimation
 from pygame.surface import Surface
 from pygame.rect import Rect
 from pygame.event import Event
 
 
 class TubeSet:
+    # Posted to the event queue when a suggestion computed in the background is ready to be shown
+    HintReadyEvent = pygame.event.custom_type()
+    # Posted when the background check of whether the game can still be won has an answer
+    AnalysisReadyEvent = pygame.event.custom_type()
 
     __keyboardHintCharacters = (
         '1', '2', '3', '4', '5',
@@ -29,91 +45,344 @@ class TubeSet:
         pygame.K_z, pygame.K_x, pygame.K_c, pygame.K_v, pygame.K_b
     )
 
-    def __init__(self, window: Surface, rect: Rect):
+    # Deals with more tubes than this are not proven solvable first, nor checked for dead ends as they're
+    # played; the search would take too long
+    __maxTubesToProve = 40
+    # How far back to look for a position that can still be won, in undos
+    __maxUndosToAnalyze = 64
+    # Positions whose ranked moves are remembered before they're all forgotten
+    __maxRankedPositions = 256
+    # How far in the view can be zoomed, relative to the size at which every tube fits
+    __maxZoom = 8.0
+    # (width, height, tubes, balls per tube) -> what __getTubeLayout returns for it
+    __layouts: dict[Tuple[int, int, int, int], Tuple[float, float, int]] = {}
+
+    def __init__(self, window: Surface, rect: Rect, maxHistory: Optional[int] = None):
+        """
+        maxHistory is how many moves can be undone, at most; None means there's no limit.
+        """
         self.__window = window
         self.__rect = rect
+        self.__board = Board(0, 0)
+        # Kept up to date with every change to the board, so looking for moves doesn't mean checking every tube
+        self.__index = TubeIndex(self.__board)
         self.__tubes: list[Tube] = []
-        self.__undoStack: list[MoveRecord] = []
-        self.__redoStack: list[MoveRecord] = []
+        self.__history = History(maxHistory)
         self.__pendingMove: Optional[Tube] = None
-
-    def newGame(self, numTubes: int, numColors: int, ballsPerTubes: int) -> None:
+        # The move suggest picked, and the Board.zobristHash of the position it was picked in
+        self.__suggestion: Optional[Tuple[int, MoveRecord]] = None
+        # Board.zobristHash -> rankedMoves there
+        self.__rankedMoves: dict[int, list[MoveRecord]] = {}
+        # Board.zobristHash of the positions where the search for a solution has already run out of time
+        self.__unsolvedPositions: set[int] = set()
+        # The longest the suggest button is allowed to search for a solution, in seconds
+        self.hintTimeLimit: float = 2.0
+        self.__solution: list[Move] = []
+        # Board.zobristHash of each position along self.__solution -> index of the next move to make
+        self.__solutionPositions: dict[int, int] = {}
+        self.__hintWorker = HintWorker(TubeSet.__postHintReady)
+        self.__deadEnds = DeadEndDetector(TubeSet.__postAnalysisReady)
+        # Board.zobristHash of the last position handed to self.__deadEnds, and what it found, once it has
+        self.__analyzedPosition: Optional[int] = None
+        self.__analysis: Optional[Analysis] = None
+        self.__timeline = Timeline()
+        # The animations raising or lowering the selected balls in each tube
+        self.__liftAnimations: dict[Tube, SelectionAnimation] = {}
+        # The areas the animations painted over in the last frame, which have to be restored in the next one
+        self.__overlayAreas: list[Rect] = []
+        self.__inputQueue: deque[Union[Event, Callable[[], None]]] = deque()
+        self.__seed: Optional[int] = None
+        # The tubes are laid out in a grid of cells, which can be bigger than self.__rect when zoomed in, in
+        # which case self.__rect is a window on it that can be scrolled around.  Only the tubes in view get
+        # positioned and drawn.
+        self.__depth = 0
+        self.__zoom = 1.0
+        self.__scroll = (0.0, 0.0)
+        self.__cellSize = (0.0, 0.0)
+        self.__columns = 1
+        # Bumped whenever the cells move; each tube is repositioned when it's next needed
+        self.__layoutGeneration = 0
+        self.__placedGeneration: list[int] = []
+        self.__viewChanged = True
+        # The cell width and number of colors the ball images were last warmed for
+        self.__warmed = (0, 0)
+        # If set, every move, undo and redo is recorded in it, and each new game starts a new journal
+        self.journal: Optional[Journal] = None
+        # If set, all the input is recorded in it, along with anything else needed to play the session back
+        self.recorder: Optional[SessionRecorder] = None
+        # If set, update times its animating, input handling and drawing as phases of the current frame
+        self.profiler: Optional[FrameProfiler] = None
+
+    def newGame(self, numTubes: int, numColors: int, ballsPerTubes: int, seed: Optional[int] = None) -> None:
+        """
+        Deals a new game that has been proven to be solvable, if that can be done within hintTimeLimit, and
+        otherwise one that hasn't.  The same seed produces the same deal as long as it's proven in time.
+        """
+        eraseAnimation = self.__eraseGame()
+        if seed is None:
+            seed = getrandbits(32)
+        puzzle = None
+        if numTubes <= TubeSet.__maxTubesToProve:
+            # This holds up the game, so all the attempts together get no longer than a hint does
+            puzzle = PuzzleGenerator(self.hintTimeLimit).generate(numTubes, numColors, ballsPerTubes, seed,
+                                                                  totalTimeLimit=self.hintTimeLimit)
+        if puzzle is None:
+            # Couldn't prove any of the candidate deals solvable in time; deal one anyway.
+            a = PuzzleGenerator.deal(numColors, ballsPerTubes, seed)
+        else:
+            a = puzzle.balls
+            seed = puzzle.seed
+        self.__deal(numTubes, numColors, ballsPerTubes, a, seed, eraseAnimation)
+
+    def playPuzzle(self, puzzle: Puzzle) -> None:
+        """
+        Starts a new game with a puzzle that's already known to be solvable, like one from a PuzzleLibrary.
+        """
+        self.__deal(puzzle.numTubes, puzzle.numColors, puzzle.ballsPerTube, puzzle.balls, puzzle.seed, self.__eraseGame())
+
+    def __eraseGame(self) -> Optional[EraseGameAnimation]:
+        # Empties the tubes, returning the animation of their balls going away
+        self.__timeline.finishAll()
+        # The emptied tubes are drawn as the erase animation's background, so nothing can be selected or
+        # highlighted as a target in them
+        self.__pendingMove = None
+        self.__suggestion = None
+        self.__liftAnimations = {}
         a: list[int] = []
         for t in self.__tubes:
             a += [-1 for _ in range(t.emptySlots)]
             while not t.isEmpty:
                 g = t.pop(None)
                 a += [g.color for _ in range(g.count)]
-        self.animateEraseGame(a)
-
+        self.__index.rebuild(self.__board)
+        eraseAnimation = None
+        if self.__tubes:
+            self.__window.fill(GameColors.WindowBackground, self.__rect)
+            self.invalidate()
+            self.__drawTubes()
+            self.__placeAll()
+            eraseAnimation = EraseGameAnimation(self.__window.copy(), self.__tubes, self.numBallsPerTube, a)
+        return eraseAnimation
+
+    def __deal(self, numTubes: int, numColors: int, ballsPerTubes: int, a: list[int], seed: int,
+               eraseAnimation: Optional[EraseGameAnimation]) -> None:
         self.__createEmptyGame(numTubes, ballsPerTubes)
-        a = [0]*numColors*ballsPerTubes
-        td = numColors*ballsPerTubes
-        for i in range(td):
-            a[i] = i % numColors
-        for i in range(td):
-            swapWith = randint(i,td-1)
-            if swapWith != i:
-                h = a[i]
-                a[i] = a[swapWith]
-                a[swapWith] = h
-        self.animateNewGame(a)
+        self.__seed = seed
         for i in range(numColors):
             for j in range(ballsPerTubes):
                 self.__tubes[i].push(BallGroup(color=a[i*ballsPerTubes+j], count=1))
+        self.__index.rebuild(self.__board)
+        self.__history.reset(self.numEmptyTubes)
+        self.__placeAll()
+        newGameAnimation = NewGameAnimation(self.__window, self.__tubes, ballsPerTubes, a)
+        if eraseAnimation is None:
+            self.__timeline.add(newGameAnimation)
+        else:
+            eraseAnimation.then(newGameAnimation)
+            self.__timeline.add(eraseAnimation)
+        if self.journal is not None:
+            self.journal.startGame()
+        if self.recorder is not None:
+            self.recorder.newGame(self.serialize())
 
     def loadGame(self, d: dict[str,Any]) -> None:
         ballsPerTube = d['ballsPerTube']
         batches: list[list[int]] = d['balls']
+        self.__seed = d.get('seed')
         self.__createEmptyGame(len(batches), ballsPerTube)
         for i in range(len(batches)):
             for color in batches[i]:
                 self.__tubes[i].push(BallGroup(color=color, count=1))
-        self.__undoStack = [self.__parseMoveRecord(r) for r in d['undoStack']]
-        self.__redoStack = [self.__parseMoveRecord(r) for r in d['redoStack']]
-    
-    
-    def __serializeMoveRecord(self, r: MoveRecord) -> dict[str,Any]:
-        d: dict[str,Any] = dict()
-        d['source'] = self.__tubes.index(r.source)
-        d['target'] = self.__tubes.index(r.target)
-        d['count'] = r.count
-        return d
+        self.__index.rebuild(self.__board)
+        undoMoves = [TubeSet.__parseMove(r) for r in d['undoStack']]
+        redoMoves = [TubeSet.__parseMove(r) for r in reversed(d['redoStack'])]
+
+        # Work out how many tubes were empty at each point in the history by winding the board back to the
+        # start and then playing it all forward again.
+        board = self.__board.copy()
+        for source, target, count in reversed(undoMoves):
+            board.move(target, source, count)
+        self.__history.reset(board.numEmptyTubes)
+        for move in undoMoves + redoMoves:
+            board.move(*move)
+            self.__history.push(move, board.numEmptyTubes)
+        self.__history.rewind(self.__history.position - len(redoMoves))
 
-    def __parseMoveRecord(self, r: Any) -> MoveRecord:
-        return MoveRecord(self.__tubes[r['source']], self.__tubes[r['target']], r['count'])
+    @staticmethod
+    def __serializeMove(move: Move) -> list[int]:
+        # [source, target, count]; long histories add up, so this is kept terse
+        return list(move)
+
+    @staticmethod
+    def __parseMove(r: Any) -> Move:
+        if isinstance(r, dict):
+            # Saved by older versions
+            return r['source'], r['target'], r['count']
+        source, target, count = r
+        return source, target, count
 
     def __createEmptyGame(self, numTubes: int, ballsPerTube: int) -> None:
-        self.__undoStack = []
-        self.__redoStack = []
+        self.__history.reset(numTubes)
         self.__pendingMove = None
+        self.__suggestion = None
+        self.__rankedMoves = {}
+        self.__unsolvedPositions = set()
+        self.__timeline.finishAll()
+        self.__liftAnimations = {}
+        self.__hintWorker.cancel()
+        self.cancelAnalysis()
+        self.__analysis = None
+        self.__solution = []
+        self.__solutionPositions = {}
         self.__depth = ballsPerTube
+        self.__board = Board(numTubes, ballsPerTube)
+        self.__index.rebuild(self.__board)
         self.__tubes = []
-        i = 0
-        for tubeRect in TubeSet.__getTubeLayout(self.__rect, numTubes, ballsPerTube):
-            self.__tubes.append(Tube(self.__window, tubeRect, TubeSet.__keyboardHintCharacters[i], ballsPerTube))
-            i += 1
+        for i in range(numTubes):
+            hintKey = TubeSet.__keyboardHintCharacters[i] if i < len(TubeSet.__keyboardHintCharacters) else ''
+            self.__tubes.append(Tube(self.__window, Rect(0, 0, 0, 0), hintKey, self.__board, i))
+        self.__placedGeneration = [-1]*numTubes
+        self.__zoom = 1.0
+        self.__scroll = (0.0, 0.0)
+        self.__relayout()
     
-    def serialize(self) -> dict[str,Any]:
+    def serialize(self, maxHistory: Optional[int] = None) -> dict[str,Any]:
+        """
+        The game, in the form loadGame takes.  If maxHistory is given, only that many of the most recent
+        moves to undo, and of the next moves to redo, are kept.
+        """
         d: dict[str,Any] = dict()
         batches: list[list[int]] = []
         for t in self.__tubes:
             batches.append(t.serialize())
         d['balls'] = batches
         d['ballsPerTube'] = self.numBallsPerTube
-        d['undoStack'] = [self.__serializeMoveRecord(s) for s in self.__undoStack]
-        d['redoStack'] = [self.__serializeMoveRecord(s) for s in self.__redoStack]
+        d['seed'] = self.__seed
+        d['undoStack'] = [TubeSet.__serializeMove(m) for m in self.__history.undoMoves(maxHistory)]
+        d['redoStack'] = [TubeSet.__serializeMove(m) for m in reversed(self.__history.redoMoves(maxHistory))]
         return d
     
     def reposition(self, rect: Rect) -> None:
-        i = 0
-        for l in TubeSet.__getTubeLayout(rect, len(self.__tubes), self.__depth):
-            self.__tubes[i].rect = l
-            i += 1
         self.__rect = rect
+        self.__relayout()
+        if self.recorder is not None:
+            self.recorder.reposition(rect)
+
+    def __relayout(self) -> None:
+        width, height, self.__columns = TubeSet.__getTubeLayout(self.__rect, len(self.__tubes), self.__depth)
+        self.__cellSize = (width*self.__zoom, height*self.__zoom)
+        self.__setScroll(self.__scroll)
+        # Get the balls for the new size ready while the tubes are still being moved into place
+        self.__warmBallImages(Rect(0, 0, *self.__cellSize).width)
+
+    def warmBallImages(self, rect: Rect) -> None:
+        """
+        Starts rendering the balls at the size they'll be drawn once the tubes are repositioned to rect, so
+        that they're ready by the time the window has settled on its new size.
+        """
+        width, height, _ = TubeSet.__getTubeLayout(rect, len(self.__tubes), self.__depth)
+        self.__warmBallImages(Rect(0, 0, width*self.__zoom, height*self.__zoom).width)
+
+    def __warmBallImages(self, cellWidth: int) -> None:
+        # Resizing asks for the same size over and over; only the first time starts anything
+        if self.__depth == 0:
+            return
+        numColors = sum(self.__board.height(t) for t in range(self.__board.numTubes)) // self.__depth
+        if (cellWidth, numColors) == self.__warmed:
+            return
+        self.__warmed = (cellWidth, numColors)
+        Tube.warmBallImages(cellWidth, numColors)
+
+    def __setScroll(self, scroll: Tuple[float, float]) -> None:
+        rows = (len(self.__tubes) + self.__columns - 1) // self.__columns
+        maxX = max(0.0, self.__columns*self.__cellSize[0] - self.__rect.width)
+        maxY = max(0.0, rows*self.__cellSize[1] - self.__rect.height)
+        self.__scroll = (min(max(scroll[0], 0.0), maxX), min(max(scroll[1], 0.0), maxY))
+        self.__layoutGeneration += 1
+        self.__viewChanged = True
+
+    def scrollBy(self, dx: float, dy: float) -> None:
+        self.__setScroll((self.__scroll[0] + dx, self.__scroll[1] + dy))
+
+    @property
+    def zoom(self) -> float:
+        """
+        How much bigger the tubes are drawn than the size at which they all fit.
+        """
+        return self.__zoom
+
+    def setZoom(self, zoom: float, around: Optional[Tuple[int, int]] = None) -> None:
+        """
+        Zooms the view, keeping whatever is under the `around` point (the middle, by default) in place.
+        """
+        zoom = min(max(zoom, 1.0), TubeSet.__maxZoom)
+        if around is None:
+            around = self.__rect.center
+        x = around[0] - self.__rect.left
+        y = around[1] - self.__rect.top
+        ratio = zoom / self.__zoom
+        self.__zoom = zoom
+        self.__scroll = ((self.__scroll[0] + x)*ratio - x, (self.__scroll[1] + y)*ratio - y)
+        self.__relayout()
+
+    def __getCellRect(self, index: int) -> Rect:
+        width, height = self.__cellSize
+        row = index // self.__columns
+        column = index % self.__columns
+        return Rect(width*column + self.__rect.left - self.__scroll[0], height*row + self.__rect.top - self.__scroll[1], width, height)
+
+    def __place(self, tube: Tube) -> None:
+        if self.__placedGeneration[tube.index] != self.__layoutGeneration:
+            tube.setPosition(self.__getCellRect(tube.index))
+            self.__placedGeneration[tube.index] = self.__layoutGeneration
+
+    def __placeAll(self) -> None:
+        # For animations that need to know where every tube is, including the ones out of view
+        for tube in self.__tubes:
+            self.__place(tube)
+
+    def __visibleTubes(self) -> Iterable[Tube]:
+        width, height = self.__cellSize
+        if not self.__tubes or width <= 0 or height <= 0:
+            return
+        firstColumn = int(self.__scroll[0] // width)
+        lastColumn = min(self.__columns - 1, int((self.__scroll[0] + self.__rect.width) // width))
+        firstRow = int(self.__scroll[1] // height)
+        lastRow = int((self.__scroll[1] + self.__rect.height) // height)
+        for row in range(firstRow, lastRow + 1):
+            for column in range(firstColumn, lastColumn + 1):
+                index = row*self.__columns + column
+                if index >= len(self.__tubes):
+                    return
+                tube = self.__tubes[index]
+                self.__place(tube)
+                yield tube
 
     @staticmethod
-    def __getTubeLayout(rect: Rect, numTubes: int, numBalls: int) -> Iterable[Rect]:
+    def __postHintReady() -> None:
+        pygame.event.post(Event(TubeSet.HintReadyEvent))
+
+    @staticmethod
+    def __postAnalysisReady() -> None:
+        pygame.event.post(Event(TubeSet.AnalysisReadyEvent))
+
+    @staticmethod
+    def __getTubeLayout(rect: Rect, numTubes: int, numBalls: int) -> Tuple[float, float, int]:
+        """
+        Returns the width and height of each tube's cell and the number of columns that makes the tubes as
+        big as possible while still fitting in the rectangle.  Only the rectangle's size matters, and the
+        answer for each size is remembered, since the window tends to go back and forth between a few.
+        """
+        key = (rect.width, rect.height, numTubes, numBalls)
+        layout = TubeSet.__layouts.get(key)
+        if layout is None:
+            if len(TubeSet.__layouts) >= 256:
+                TubeSet.__layouts.clear()
+            layout = TubeSet.__layouts[key] = TubeSet.__findTubeLayout(rect, numTubes, numBalls)
+        return layout
+
+    @staticmethod
+    def __findTubeLayout(rect: Rect, numTubes: int, numBalls: int) -> Tuple[float, float, int]:
         # Hard-coding to a two-row.  Better if we adjusted it based on the layout
         rows:int = 0
         width = 0
@@ -129,10 +398,7 @@ class TubeSet:
                 break
 
         # It'd be better if the extra space was distributed between rows and columns
-        for i in range(numTubes):
-            row = i // columns
-            column = i % columns
-            yield Rect(width*column + rect.left, height*row + rect.top, width, height)
+        return width, height, max(1, columns)
 
     def isTubeKeyboardShortcut(self, keyboardId: int) -> bool:
         return keyboardId in TubeSet.__tubeKeys and TubeSet.__tubeKeys.index(keyboardId) < len(self.__tubes)
@@ -140,360 +406,319 @@ class TubeSet:
     def getTubeForKeyStroke(self, keyboardId: int) -> Tube:
         return self.__tubes[TubeSet.__tubeKeys.index(keyboardId)]
 
-    def draw(self) -> None:
+    def draw(self) -> list[Rect]:
+        """
+        Paints the next frame and returns the areas of the window that changed.  That's the areas animations
+        drew on in the last frame, the tubes that look different than they did the last time they were
+        drawn, and wherever the animations drew this time.
+        """
+        updated = self.__overlayAreas
+        if self.__viewChanged:
+            # Scrolled, zoomed or resized:  everything in view has moved
+            self.__window.fill(GameColors.WindowBackground, self.__rect)
+            updated = updated + [self.__rect]
+            self.__viewChanged = False
+        for area in self.__overlayAreas:
+            self.__window.fill(GameColors.WindowBackground, area)
+            for tube in self.__visibleTubes():
+                if tube.rect.colliderect(area):
+                    tube.invalidate()
+        updated = updated + self.__drawTubes()
+        self.__overlayAreas = self.__timeline.paint(self.__window)
+        return updated + self.__overlayAreas
+
+    def __drawTubes(self) -> list[Rect]:
+        updated: list[Rect] = []
+        pendingGroup = self.__pendingMove.peek() if self.__pendingMove else None
+        # The tubes the selected balls can go to
+        targets: set[int] = set()
+        suggestion = self.__getSuggestion()
+        if suggestion is not None:
+            targets = {suggestion.target.index}
+        elif self.__pendingMove is not None and pendingGroup is not None:
+            targets = set(self.__index.targetsFor(pendingGroup.color, pendingGroup.count)) | self.__index.emptyTubes
+            targets.discard(self.__pendingMove.index)
+        # Tubes at the edge of the view are cut off rather than drawn over whatever is next to it
+        previousClip = self.__window.get_clip()
+        self.__window.set_clip(self.__rect)
+        for tube in self.__visibleTubes():
+            canAddHighlight = tube.index in targets
+            lift = self.__liftOf(tube)
+            highlightedColor = pendingGroup.color if pendingGroup else None
+            if not tube.isDrawnAs(canAddHighlight, lift, highlightedColor):
+                tube.draw(canAddHighlight, lift, highlightedColor)
+                updated.append(tube.rect.clip(self.__rect))
+        self.__window.set_clip(previousClip)
+        return updated
+
+    def invalidate(self) -> None:
+        """
+        Makes the next draw repaint every tube, for when the window has been painted over.
+        """
         for tube in self.__tubes:
-            tube.draw(
-                canAddHighlight=self.__pendingMove is not None and self.__pendingMove is not tube and tube.canAddBallGroup(self.__pendingMove.peek()),
-                isSourceHighlight=self.__pendingMove is tube,
-                highlightedColor=self.__pendingMove.peek().color if self.__pendingMove else None)
+            tube.invalidate()
     
     def tryGetAutoMove(self, source: Tube) -> Optional[Tube]:
-        emptyValidMove = None
-        for t in self.__tubes:
-            if source is t: continue
-            if t.isEmpty:
-                if emptyValidMove is None:
-                    emptyValidMove = t
-            elif t.canAddBallGroup(source.peek()):
-                return t
-        return emptyValidMove
-    
-    def __getAllValidMoves(self) -> Iterable[Tube]:
-        # First list out all the moves that don't target empty tubes
-        hasAnyEmptyTubes: bool = False
-        possibleEmptyTubeMoves: list[Tube] = []
-        for source in self.__tubes:
-            if source.isEmpty:
-                hasAnyEmptyTubes = True
-            else:
-                sourcePeek = source.peek()
-                if any(t for t in self.__tubes if t is not source and (not t.isEmpty) and t.canAddBallGroup(sourcePeek)):
-                    yield source
-                elif source.hasMoreThanOneColor:
-                    possibleEmptyTubeMoves.append(source)
-        if hasAnyEmptyTubes:
-            for source in possibleEmptyTubeMoves:
-                yield source
-    
+        """
+        The first tube, in order, that can take all of the balls on top of the source, or failing that, the
+        first empty tube.
+        """
+        group = source.peek()
+        for t in self.__index.targetsFor(group.color, group.count):
+            if t != source.index:
+                return self.__tubes[t]
+        firstEmpty = self.__index.firstEmptyTube
+        return None if firstEmpty is None else self.__tubes[firstEmpty]
+
+    def __getUsefulMoves(self) -> Iterable[Move]:
+        # The same moves as Solver.usefulMoves, but only trying the targets the index says can take them
+        board = self.__board
+        firstEmpty = self.__index.firstEmptyTube
+        for source in range(board.numTubes):
+            if board.isEmpty(source):
+                continue
+            isSingleColor = not board.hasMoreThanOneColor(source)
+            if isSingleColor and board.height(source) == board.depth:
+                continue
+            for target in sorted(self.__index.tubesWithTopColor(board.topColor(source))):
+                count = 0 if target == source else board.moveCount(source, target)
+                if count:
+                    yield source, target, count
+            if firstEmpty is not None and not isSingleColor:
+                yield source, firstEmpty, board.topCount(source)
+
+    @property
+    def rankedMoves(self) -> list[MoveRecord]:
+        """
+        Every useful move from the current position, best first by Solver.rankMoves, except that the next
+        move of a known solution always comes first.  Worked out once for each position and remembered, so
+        going through them again, or coming back to the position with undo, costs nothing.
+        """
+        key = self.__board.zobristHash
+        moves = self.__rankedMoves.get(key)
+        if moves is None:
+            if len(self.__rankedMoves) >= TubeSet.__maxRankedPositions:
+                self.__rankedMoves.clear()
+                self.__unsolvedPositions.clear()
+            moves = [MoveRecord(self.__tubes[s], self.__tubes[t], c) for s, t, c in Solver.rankMoves(self.__board, self.__getUsefulMoves())]
+            self.__rankedMoves[key] = moves
+        position = self.__solutionPositions.get(key)
+        if position is not None:
+            s, t, c = self.__solution[position]
+            if not moves or moves[0].source.index != s or moves[0].target.index != t:
+                moves[:] = [MoveRecord(self.__tubes[s], self.__tubes[t], c)] + \
+                           [m for m in moves if m.source.index != s or m.target.index != t]
+        return moves
+
     def tryFindMove(self, existingMove: Optional[Tube]) -> Optional[Tube]:
-        hitExistingMove = existingMove is None
-        firstValidMove = None
-        for possibleMove in self.__getAllValidMoves():
-            if hitExistingMove:
-                return possibleMove
-            elif possibleMove is existingMove:
-                hitExistingMove = True
-            elif firstValidMove is None:
-                firstValidMove = possibleMove
-        return firstValidMove
+        """
+        The source of the best move in rankedMoves that's from a different tube than existingMove and comes
+        after it, going back around to the start; the best of all if existingMove is None.
+        """
+        sources = list(dict.fromkeys(move.source for move in self.rankedMoves))
+        if existingMove in sources:
+            return sources[(sources.index(existingMove) + 1) % len(sources)]
+        return sources[0] if sources else None
+
+    def findSolution(self) -> Optional[list[MoveRecord]]:
+        """
+        Searches for the complete sequence of moves that wins the game from the current position, taking no
+        more than hintTimeLimit seconds.  Returns None if no solution was found in that time.
+        """
+        solution = self.__tryGetKnownSolution()
+        if solution is None:
+            if self.__board.zobristHash in self.__unsolvedPositions:
+                return None
+            moves = Solver(timeLimit=self.hintTimeLimit).solve(self.__board)
+            if moves is None:
+                self.__unsolvedPositions.add(self.__board.zobristHash)
+                return None
+            self.__rememberSolution(moves)
+            solution = self.__tryGetKnownSolution()
+        return solution
+
+    def __tryGetKnownSolution(self) -> Optional[list[MoveRecord]]:
+        position = self.__solutionPositions.get(self.__board.zobristHash)
+        if position is None:
+            return None
+        return [MoveRecord(self.__tubes[s], self.__tubes[t], c) for s, t, c in self.__solution[position:]]
+
+    def __rememberSolution(self, solution: list[Move]) -> None:
+        # Remember every position along the way so a player that follows the suggestions doesn't
+        # cause another search.
+        self.__solution = solution
+        self.__solutionPositions = {}
+        board = self.__board.copy()
+        for i, move in enumerate(solution):
+            self.__solutionPositions[board.zobristHash] = i
+            board.move(*move)
+
+    def cancelHint(self) -> None:
+        self.__hintWorker.cancel()
+
+    def cancelAnalysis(self) -> None:
+        self.__deadEnds.cancel()
+        self.__analyzedPosition = None
+
+    def __analyzePosition(self) -> None:
+        result = self.__deadEnds.poll()
+        key = self.__board.zobristHash
+        if result is not None and result[0] == key:
+            self.__analysis = result
+        # Waits for any hint to be found first, since that's what the player is waiting for
+        if key != self.__analyzedPosition and not self.__hintWorker.isBusy and self.numTotalTubes <= TubeSet.__maxTubesToProve:
+            self.__analyzedPosition = key
+            self.__analysis = None
+            self.__deadEnds.submit(self.__board, self.__history.recentMoves(TubeSet.__maxUndosToAnalyze))
+
+    @property
+    def isDeadEnd(self) -> bool:
+        """
+        True once the check that runs in the background after every move has found that the game can't be
+        won from here.
+        """
+        return self.__analysis is not None and self.__analysis[0] == self.__board.zobristHash and self.__analysis[1] is False
+
+    @property
+    def undosToRecover(self) -> Optional[int]:
+        """
+        If isDeadEnd, how many undos get back to a position that can be won, if it's known.
+        """
+        return self.__analysis[2] if self.isDeadEnd and self.__analysis is not None else None
+
+    @property
+    def isHintPending(self) -> bool:
+        return self.__hintWorker.isBusy
+
+    def __applyFinishedHint(self) -> None:
+        result = self.__hintWorker.poll()
+        if result is None:
+            return
+        key, moves = result
+        if key != self.__board.zobristHash or self.__pendingMove is not None:
+            return
+        if self.recorder is not None:
+            self.recorder.hint(moves)
+        self.useHint(moves)
+
+    def useHint(self, moves: Optional[list[Move]]) -> None:
+        """
+        Selects the next move from a solution found for the current position, or from any valid move if no
+        solution was found.  Done by update when a hint's search finishes, or by SessionPlayer when playing
+        one back.
+        """
+        if moves is not None:
+            self.__rememberSolution(moves)
+        else:
+            # Searching again would only take as long and fail the same way
+            self.__unsolvedPositions.add(self.__board.zobristHash)
+        self.setPendingMove(None)
+        self.__suggestNext()
 
     def tryFindTubeByPosition(self, position: Tuple[int,int]) -> Optional[Tube]:
-        for t in self.__tubes:
-            if t.rect.collidepoint(position):
-                return t
+        # The tubes are in a grid, so which cell the position is in says which tube it is
+        width, height = self.__cellSize
+        if not self.__rect.collidepoint(position) or width <= 0 or height <= 0:
+            return None
+        column = int((position[0] - self.__rect.left + self.__scroll[0]) // width)
+        row = int((position[1] - self.__rect.top + self.__scroll[1]) // height)
+        # Tube rectangles are rounded to whole pixels, so right at the edge of a cell it can be a neighbor's
+        for r in (row, row - 1, row + 1):
+            for c in (column, column - 1, column + 1):
+                index = r*self.__columns + c
+                if 0 <= c < self.__columns and 0 <= index < len(self.__tubes):
+                    tube = self.__tubes[index]
+                    self.__place(tube)
+                    if tube.rect.collidepoint(position):
+                        return tube
         return None
     
+    @property
+    def board(self) -> Board:
+        """
+        The state of the tubes, shared with (not copied from) this TubeSet.  Use Board.copy before modifying it.
+        """
+        return self.__board
+
+    @property
+    def stateHash(self) -> int:
+        """
+        Board.zobristHash of the current position.
+        """
+        return self.__board.zobristHash
+
     @property
     def numEmptyTubes(self) -> int:
-        return sum(1 for t in self.__tubes if t.isEmpty)
+        return self.__board.numEmptyTubes
 
     @property
     def numTotalTubes(self) -> int:
         return len(self.__tubes)
 
+    @property
+    def seed(self) -> Optional[int]:
+        """
+        The seed the current game was dealt from, or None if it isn't known.
+        """
+        return self.__seed
+
     @property
     def numBallsPerTube(self) -> int:
         return self.__depth
 
     @property
     def isWin(self) -> bool:
-        for t in self.__tubes:
-            if not t.isComplete:
-                return False
-        return True
+        return self.__board.isWin
 
-    @staticmethod
-    def interpolatePosition(start: Tuple[float,float], end: Tuple[float,float], progress: float) -> Tuple[float,float]:
-        return start[0] + (end[0]-start[0])*progress, start[1] + (end[1]-start[1])*progress
-
-    @staticmethod
-    def interpolate(waypoints: list[Tuple[float, float]]) -> Callable[[float], Tuple[float,float]]:
-        totalLength = -1.0
-        lengths: list[float] = list()
-        lastWaypoint = (0.0,0.0)
-        for pair in waypoints:
-            if totalLength < 0:
-                lastWaypoint = pair
-                totalLength = 0
-            else:
-                dx = pair[0] - lastWaypoint[0]
-                dy = pair[1] - lastWaypoint[1]
-                length = math.sqrt(dx*dx+dy*dy)
-                totalLength += length
-                lastWaypoint = pair
-                lengths.append(length)
-        def interpolation(progress: float) -> Tuple[float,float]:
-            index = 0
-            totalLengthSoFar = 0.0
-            while totalLengthSoFar < progress * totalLength:
-                totalLengthSoFar += lengths[index]
-                index += 1
-            # index is the next waypoint - we're between waypoints[index-1] and waypoints[index]
-            priorWaypointDistance = 0.0
-            for i in range(index-1): priorWaypointDistance += lengths[i]
-            progressBetweenPoints = (totalLength*progress - priorWaypointDistance)/lengths[index-1]
-            x = waypoints[index-1][0] + (waypoints[index][0] - waypoints[index-1][0])*progressBetweenPoints
-            y = waypoints[index-1][1] + (waypoints[index][1] - waypoints[index-1][1])*progressBetweenPoints
-            return x,y
-        return interpolation
-    
-    def makeSelectionAnimator(self, selection: Tube, isIncoming: bool) -> Callable[[float], Rect]:
-        selectionGroup = selection.peek()
-        topBallRectHigh = selection.getBallPosition(selection.emptySlots-.5)
-        bottomBallRect = selection.getBallPosition(selection.emptySlots+selectionGroup.count-1)
-        animationArea = topBallRectHigh.union(bottomBallRect)
-        background = Surface(animationArea.size)
-
-        _ = selection.pop(selectionGroup.count)
-        selection.draw(
-            canAddHighlight=False,
-            isSourceHighlight=False,
-            highlightedColor=selectionGroup.color)
-        background.blit(self.__window, (0,0), animationArea)
-        selection.push(selectionGroup)
-        ballImage = selection.getBallImage(selectionGroup.color, isHighlighted=True)
-        def animation(position: float) -> Rect:
-            self.__window.blit(background, animationArea)
-            for ballTubePosition in range(selection.emptySlots, selection.emptySlots+selectionGroup.count):
-                target = selection.getBallPosition(ballTubePosition - .5*(position if isIncoming else 1-position))
-                self.__window.blit(ballImage, target)
-            return animationArea
-        return animation
-    
-    def animateSelection(self, newSelection: Optional[Tube], oldSelection: Optional[Tube]) -> None:
-        newAnimation = self.makeSelectionAnimator(newSelection, True) if newSelection else None
-        oldAnimation = self.makeSelectionAnimator(oldSelection, False) if oldSelection else None
-        startTime = time.time()
-        animationDuration = .1 # seconds
-        progress = 0.0
-        while progress < 1:
-            progress = (time.time() - startTime) / animationDuration
-            if progress >= 1:
-                progress = 1
-            updateAreas: list[Rect] = []
-            if newAnimation:
-                updateAreas.append(newAnimation(progress))
-            if oldAnimation:
-                updateAreas.append(oldAnimation(progress))
-            pygame.display.update(updateAreas)  # type: ignore   Looks like a pylance bug
-            pygame.event.pump()
-            time.sleep(.01)
-
-    def animateMove(self, source: Tube, target: Tube, moving: BallGroup, sourceIsSelected: bool) -> None:
-        self.__pendingMove = None
-        self.draw()
-        background = Surface(self.__rect.size)
-        background.blit(self.__window, (0,0), self.__rect)
-        interpolatorFunctions: list[Callable[[float], Tuple[float,float]]] = []
-        ballImage = source.getBallImage(moving.color, isHighlighted=False)
-
-        topOfSourceTube: Tuple[float,float] = source.getBallPosition(-1).topleft
-        topOfTargetTube: Tuple[float,float] = target.getBallPosition(-1).topleft
-        for i in range(moving.count):
-            start: Tuple[float,float] = source.getBallPosition(source.emptySlots - moving.count + i - (.5 if sourceIsSelected else 0)).topleft
-            end: Tuple[float,float] = target.getBallPosition(target.emptySlots - 1 - i).topleft
-            interpolatorFunctions.append( \
-                TubeSet.interpolate( [start,topOfSourceTube,topOfTargetTube,end] ))
-
-        startTime = time.time()
-        animationDuration = .25 # seconds
-        progress = 0
-        while progress < 1:
-            progress = (time.time() - startTime) / animationDuration
-            if progress >= 1:
-                progress = 1
-            self.__window.blit(background, self.__rect.topleft)
-            for f in interpolatorFunctions:
-                topLeft = f(progress)
-                self.__window.blit(ballImage, topLeft)
-            pygame.display.update(self.__rect)
-            pygame.event.pump()
-            time.sleep(.01)
-
-
-    def animateNewGame(self, balls: list[int]) -> None:
-        self.__window.fill(GameColors.WindowBackground, self.__rect)
-        self.draw()
-        screenSize = self.__window.get_size()
-        background = Surface(screenSize)
-        background.blit(self.__window, (0,0), self.__window.get_rect())
-
-        startTime = time.time()
-
-        timeSpentInTube = .5
-        verticalSpeedInTube = (self.__tubes[0].getBallPosition(self.numBallsPerTube-1).top - self.__tubes[0].getBallPosition(-1).top) / timeSpentInTube
-        def getArrivalTime(depth: int) -> float:
-            return startTime + .25 + ((1 + self.numBallsPerTube - depth)/self.numBallsPerTube)*timeSpentInTube
-
-        # What we want to animate is a condition where the balls arrive at the top of the tube
-        # sequentially and thus don't overlap as they go down.
-        class BallPlot:
-            color: int
-            startX: float
-            startY: float
-            topOfTubeX: float
-            topOfTubeY: float
-            finalX: float
-            finalY: float
-            arrivalTimeAtTopOfTube: float
-
-            def getPositionAtTime(self, startTime: float, now: float) -> Tuple[float, float]:
-                if now <= self.arrivalTimeAtTopOfTube:
-                    transitPercentage = (now - startTime)/(self.arrivalTimeAtTopOfTube - startTime)
-                    x = self.startX + (self.topOfTubeX - self.startX) * transitPercentage
-                    y = self.startY + (self.topOfTubeY - self.startY) * transitPercentage
-                    return x,y
-                else:
-                    y = self.topOfTubeY + verticalSpeedInTube * (now - self.arrivalTimeAtTopOfTube)
-                    return self.topOfTubeX, min(y, self.finalY)
-
-        plots: list[BallPlot] = []
-        tube: int = 0
-        depth: int = self.numBallsPerTube-1
-        ballSize = self.__tubes[0].getBallImage(0,False).get_size()
-        tubeArrivalTime = randrange(0,20)/10
-        for color in balls:
-            plot = BallPlot()
-            plot.color = color
-            startEdge = randint(0,3)
-            if startEdge == 0:
-                plot.startX = -ballSize[0]
-                plot.startY = randint(-ballSize[1], screenSize[1])
-            elif startEdge == 1:
-                plot.startX = screenSize[0]
-                plot.startY = randint(-ballSize[1], screenSize[1])
-            elif startEdge == 2:
-                plot.startX = randint(-ballSize[0], screenSize[0])
-                plot.startY = -ballSize[1]
-            else:
-                plot.startX = randint(-ballSize[0], screenSize[0])
-                plot.startY = screenSize[1]
-            tubeTop = self.__tubes[tube].getBallPosition(-1)
-            plot.topOfTubeX = tubeTop[0]
-            plot.topOfTubeY = tubeTop[1]
-            plot.arrivalTimeAtTopOfTube = getArrivalTime(depth) + tubeArrivalTime
-            finalPosition = self.__tubes[tube].getBallPosition(depth)
-            plot.finalX = finalPosition[0]
-            plot.finalY = finalPosition[1]
-            plots.append(plot)
-            if depth == 0:
-                depth = self.numBallsPerTube-1
-                tubeArrivalTime = randrange(0,20)/10
-                tube += 1
-            else:
-                depth -= 1
-
-        numArrived = 0
-        while numArrived < len(plots):
-            self.__window.blit(background, (0,0))
-            now = time.time()
-            numArrived = 0
-            for plot in plots:
-                ballImage = self.__tubes[0].getBallImage(plot.color, isHighlighted=False)
-                topLeft = plot.getPositionAtTime(startTime, now)
-                self.__window.blit(ballImage, topLeft)
-                if topLeft[0] == plot.finalX and topLeft[1] == plot.finalY:
-                    numArrived += 1
-            pygame.display.update()
-            pygame.event.pump()
-            time.sleep(.01)
-
-
-    def animateEraseGame(self, balls: list[int]) -> None:
-        self.__window.fill(GameColors.WindowBackground, self.__rect)
-        self.draw()
-        screenSize = self.__window.get_size()
-        background = Surface(screenSize)
-        background.blit(self.__window, (0,0), self.__window.get_rect())
-
-        startTime = time.time()
-
-        escapeMultiplier = 12
-
-        # What we want to animate is a condition where the balls arrive at the top of the tube
-        # sequentially and thus don't overlap as they go down.
-        class BallPlot:
-            color: int
-            startX: float
-            startY: float
-            jiggleDuration: float
-            dX: float
-            dY: float
-
-            def getPositionAtTime(self, startTime: float, now: float) -> Tuple[float, float]:
-                elapsedTime = now - startTime
-                if elapsedTime > self.jiggleDuration:
-                    elapsedSinceJiggle = elapsedTime-self.jiggleDuration
-                    return self.startX + self.dX * elapsedSinceJiggle * escapeMultiplier, self.startY + self.dY * elapsedSinceJiggle * escapeMultiplier
-                else:
-                    amplitude = math.sin(math.pi*6*elapsedTime/self.jiggleDuration)*elapsedTime/self.jiggleDuration
-                    return self.startX + self.dX * amplitude, self.startY + self.dY * amplitude
-
-        plots: list[BallPlot] = []
-        tube: int = 0
-        depth: int = 0
-        ballSize = self.__tubes[0].getBallImage(0,False).get_size()
-        for color in balls:
-            if color >= 0:
-                plot = BallPlot()
-                plot.color = color
-                startPosition = self.__tubes[tube].getBallPosition(depth)
-                plot.startX = startPosition[0]
-                plot.startY = startPosition[1]
-                plot.dX = ballSize[0] * randrange(50,100)/100 * (randint(0,1)*2-1)
-                plot.dY = ballSize[1] * randrange(50,100)/100 * (randint(0,1)*2-1)
-                plot.jiggleDuration = .75 * randrange(50,100)/100
-                plots.append(plot)
-            depth += 1
-            if depth == self.numBallsPerTube:
-                depth = 0
-                tube += 1
-        
-        def isOffScreen(x: float, y: float) -> bool:
-            return x < -ballSize[0] or x > screenSize[0] or y < -ballSize[0] or y > screenSize[1]
-
-        numArrived = 0
-        while numArrived < len(plots):
-            self.__window.blit(background, (0,0))
-            now = time.time()
-            numArrived = 0
-            for plot in plots:
-                ballImage = self.__tubes[0].getBallImage(plot.color, isHighlighted=False)
-                topLeft = plot.getPositionAtTime(startTime, now)
-                if isOffScreen(*topLeft):
-                    numArrived += 1
-                else:
-                    self.__window.blit(ballImage, topLeft)
-            pygame.event.pump()
-            pygame.display.update()
-            time.sleep(.01)
+    def __liftOf(self, tube: Tube) -> float:
+        animation = self.__liftAnimations.get(tube)
+        if animation is not None and not animation.isFinished:
+            return animation.lift
+        return 1 if tube is self.__pendingMove else 0
 
     def setPendingMove(self, selectedTube: Optional[Tube]) -> None:
+        self.__suggestion = None
         if selectedTube is not self.__pendingMove:
-            self.animateSelection(selectedTube, self.__pendingMove)
+            for tube, toLift in ((self.__pendingMove, 0), (selectedTube, 1)):
+                if tube is None or tube.isEmpty:
+                    continue
+                fromLift = self.__liftOf(tube)
+                previous = self.__liftAnimations.pop(tube, None)
+                if previous is not None:
+                    self.__timeline.remove(previous)
+                animation = SelectionAnimation(tube, fromLift, toLift)
+                self.__liftAnimations[tube] = animation
+                self.__timeline.add(animation)
             self.__pendingMove = selectedTube
 
+    def __animateMove(self, source: Tube, target: Tube, count: int, sourceIsSelected: bool) -> None:
+        """
+        Moves the balls in the model right away and starts the animation of them flying over.
+        """
+        self.__place(source)
+        self.__place(target)
+        moving = source.pop(count)
+        animation = MoveAnimation(source, target, moving, sourceIsSelected)
+        target.push(moving)
+        self.__index.update(source.index)
+        self.__index.update(target.index)
+        self.__timeline.add(animation)
+
+    def __makeMove(self, source: Tube, target: Tube, count: int) -> None:
+        self.__hintWorker.cancel()
+        self.__liftAnimations.pop(source, None)
+        self.__animateMove(source, target, count, source is self.__pendingMove)
+        self.__pendingMove = None
+        self.__history.push((source.index, target.index, count), self.numEmptyTubes)
+        if self.journal is not None:
+            self.journal.append(Journal.MOVE, source.index, target.index, count)
+
     def doMove(self, selectedTube: Tube):
         def actuallyDoMove(source: Tube, target: Tube) -> None:
-            self.__redoStack.clear()
-            moving = source.pop(min(target.emptySlots, source.peek().count))
-            self.animateMove(source, target, moving, True)
-            target.push(moving)
-            self.__pendingMove = None
-            self.__undoStack.append(MoveRecord(source, target, moving.count))
+            self.__makeMove(source, target, min(target.emptySlots, source.peek().count))
 
         if self.__pendingMove and self.__pendingMove is selectedTube:
-            target = self.tryGetAutoMove(self.__pendingMove)
+            target = self.__getAutoTarget(self.__pendingMove)
             if target:
                 actuallyDoMove(self.__pendingMove, target)
             else:
@@ -507,59 +732,204 @@ class TubeSet:
 
     def undo(self):
         self.setPendingMove(None)
-        if not self.__undoStack:
+        moveToUndo = self.__history.undo()
+        if moveToUndo is None:
             return
-        moveToUndo = self.__undoStack.pop()
-        moving = BallGroup(color = moveToUndo.target.peek().color, count = moveToUndo.count)
-        moveToUndo.target.removeBalls(moveToUndo.count)
-        self.animateMove(moveToUndo.target, moveToUndo.source, moving, False)
-        moveToUndo.source.push(moving)
-        self.__redoStack.append(moveToUndo)
+        self.__hintWorker.cancel()
+        source, target, count = moveToUndo
+        self.__animateMove(self.__tubes[target], self.__tubes[source], count, False)
+        if self.journal is not None:
+            self.journal.append(Journal.UNDO)
 
     def redo(self):
         self.setPendingMove(None)
-        if not self.__redoStack:
+        moveToRedo = self.__history.redo()
+        if moveToRedo is None:
             return
-        moveToRedo = self.__redoStack.pop()
-        moving = BallGroup(color = moveToRedo.source.peek().color, count = moveToRedo.count)
-        moveToRedo.source.removeBalls(moveToRedo.count)
-        self.animateMove(moveToRedo.source, moveToRedo.target, moving, False)
-        moveToRedo.target.push(moving)
-        self.__undoStack.append(moveToRedo)
+        self.__hintWorker.cancel()
+        source, target, count = moveToRedo
+        self.__animateMove(self.__tubes[source], self.__tubes[target], count, False)
+        if self.journal is not None:
+            self.journal.append(Journal.REDO)
 
     def undoToCheckpoint(self):
+        """
+        Undoes moves back to the last time there were more empty tubes than there are now (or to the start),
+        all at once, with the balls flying straight to where they end up.
+        """
         self.setPendingMove(None)
-        oldEmptyCount = self.numEmptyTubes
-        while any(self.__undoStack) and self.numEmptyTubes <= oldEmptyCount:
-            self.undo()
+        undone = self.__history.rewind(self.__history.checkpoint)
+        if not undone:
+            return
+        self.__hintWorker.cancel()
+        before = [t.serialize() for t in self.__tubes]
+        for source, target, count in undone:
+            self.__tubes[source].push(self.__tubes[target].pop(count))
+            self.__index.update(source)
+            self.__index.update(target)
+        self.__placeAll()
+        self.__timeline.add(RearrangeAnimation(self.__tubes, before))
+        if self.journal is not None:
+            for _ in undone:
+                self.journal.append(Journal.UNDO)
+
+    def replay(self, records: Iterable[Record]) -> None:
+        """
+        Makes the moves, undos and redos read back from a Journal, without animating them or recording them
+        in the journal again.
+        """
+        journal, self.journal = self.journal, None
+        for operation, source, target, count in records:
+            if operation == Journal.MOVE:
+                self.__makeMove(self.__tubes[source], self.__tubes[target], count)
+            elif operation == Journal.UNDO:
+                self.undo()
+            elif operation == Journal.REDO:
+                self.redo()
+        self.finishAnimations()
+        self.journal = journal
 
     def suggest(self):
-        self.setPendingMove(self.tryFindMove(self.__pendingMove))
+        """
+        Selects the source of the next move in the solution and shows where it goes.  If there is no solution
+        on hand, the search runs in the background and the selection is made by update once it finishes.
+        Suggesting again goes on to the next best move in rankedMoves, as does suggesting in a position where
+        the search already failed.  Boards too big to prove solvable are too big to search, so their hints
+        always come straight from rankedMoves.
+        """
+        key = self.__board.zobristHash
+        canSearch = self.numTotalTubes <= TubeSet.__maxTubesToProve and key not in self.__unsolvedPositions
+        if self.__pendingMove is None and key not in self.__solutionPositions and canSearch and not self.__board.isWin:
+            if not self.__hintWorker.isBusy:
+                self.__hintWorker.submit(self.__board, self.hintTimeLimit)
+            return
+        self.__suggestNext()
 
+    def __suggestNext(self) -> None:
+        moves = self.rankedMoves
+        if not moves:
+            self.setPendingMove(None)
+            return
+        suggestion = self.__getSuggestion()
+        index = (moves.index(suggestion) + 1) % len(moves) if suggestion in moves else 0
+        self.setPendingMove(moves[index].source)
+        self.__suggestion = (self.__board.zobristHash, moves[index])
+
+    def __getSuggestion(self) -> Optional[MoveRecord]:
+        # Only while the position and selection are still the ones it was suggested for
+        if self.__suggestion is None:
+            return None
+        position, move = self.__suggestion
+        if position != self.__board.zobristHash or move.source is not self.__pendingMove:
+            return None
+        return move
+
+    def __getAutoTarget(self, source: Tube) -> Optional[Tube]:
+        # Where the selected balls go when they're selected again: to the suggestion if there is one
+        suggestion = self.__getSuggestion()
+        return suggestion.target if suggestion is not None else self.tryGetAutoMove(source)
 
-    def update(self, events: list[Event]) -> None:
-        for event in events:
-            if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
-                self.setPendingMove(None)
-            elif event.type == pygame.KEYDOWN and event.key == pygame.K_TAB:
-                self.suggest()
-            elif event.type == pygame.KEYDOWN and event.key == pygame.K_z and event.mod & pygame.KMOD_CTRL and event.mod & pygame.KMOD_SHIFT:
-                self.undoToCheckpoint()
-            elif event.type == pygame.KEYDOWN and event.key == pygame.K_z and event.mod & pygame.KMOD_CTRL:
-                self.undo()
-            elif event.type == pygame.KEYDOWN and event.key == pygame.K_y and event.mod & pygame.KMOD_CTRL:
-                self.redo()
-            elif event.type == pygame.KEYDOWN and (self.isTubeKeyboardShortcut(event.key) or event.key == pygame.K_SPACE):
-                if event.key == pygame.K_SPACE:
-                    selectedTube = None if self.__pendingMove is None else self.tryGetAutoMove(self.__pendingMove)
-                else:
-                    selectedTube = self.getTubeForKeyStroke(event.key)
-
-                if selectedTube is not None:
-                    self.doMove(selectedTube)
-            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                (x,y) = event.pos
-                selectedTube: Optional[Tube] = self.tryFindTubeByPosition((x,y))
-                if selectedTube is not None:
-                    self.doMove(selectedTube)
-        self.draw()
+    @property
+    def isAnimating(self) -> bool:
+        return self.__timeline.isAnimating
+
+    def finishAnimations(self) -> None:
+        """
+        Skips every animation that's playing, and any that are queued up behind them, straight to its end.
+        """
+        self.__timeline.finishAll()
+
+    @property
+    def hasPendingInput(self) -> bool:
+        """
+        True if there is input that's waiting for an animation to finish before it can be handled.
+        """
+        return len(self.__inputQueue) > 0
+
+    def post(self, action: Callable[[], None]) -> None:
+        """
+        Runs the action in turn with the rest of the input, so that, for example, a button press that happens
+        while a move is being animated waits for the move to land.
+        """
+        self.__inputQueue.append(action)
+
+    def update(self, events: list[Event], draw: bool = True) -> list[Rect]:
+        """
+        Handles the input events and redraws whatever changed as a result, returning the changed areas.
+        Input that arrives while a move is being animated is held until the animation is done.  With draw
+        False, the input is only handled:  nothing is painted and the position isn't checked for dead ends,
+        which is how SessionPlayer gets through a recording as fast as it can.
+        """
+        profiler = self.profiler
+        self.__applyFinishedHint()
+        self.__inputQueue.extend(events)
+        self.__timeline.update(time.time())
+        if profiler is not None:
+            profiler.lap('tubes.animate')
+        while self.__inputQueue and not self.__timeline.blocksInput:
+            item = self.__inputQueue.popleft()
+            if isinstance(item, Event):
+                if item.type == pygame.MOUSEWHEEL and not hasattr(item, 'mod'):
+                    # What a wheel event does depends on the keyboard and the mouse, so make it say what
+                    # they were, for when it's played back
+                    item = Event(pygame.MOUSEWHEEL, {**item.dict, 'mod': pygame.key.get_mods(), 'pos': pygame.mouse.get_pos()})
+                if self.recorder is not None:
+                    self.recorder.event(item)
+                self.__handleEvent(item)
+            else:
+                # Methods of this class can be played back by name; other actions only matter through
+                # what they call, like newGame
+                if self.recorder is not None and getattr(item, '__self__', None) is self:
+                    self.recorder.action(item.__name__)
+                item()
+        if profiler is not None:
+            profiler.lap('tubes.input')
+        if not draw:
+            return []
+        updated = self.draw()
+        if profiler is not None:
+            profiler.lap('tubes.draw')
+        # Once the frame is drawn, so the search doesn't hold it up
+        self.__analyzePosition()
+        if profiler is not None:
+            profiler.lap('tubes.analyze')
+        return updated
+
+    def __handleEvent(self, event: Event) -> None:
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+            self.setPendingMove(None)
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_TAB:
+            self.suggest()
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_z and event.mod & pygame.KMOD_CTRL and event.mod & pygame.KMOD_SHIFT:
+            self.undoToCheckpoint()
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_z and event.mod & pygame.KMOD_CTRL:
+            self.undo()
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_y and event.mod & pygame.KMOD_CTRL:
+            self.redo()
+        elif event.type == pygame.KEYDOWN and (self.isTubeKeyboardShortcut(event.key) or event.key == pygame.K_SPACE):
+            if event.key == pygame.K_SPACE:
+                selectedTube = None if self.__pendingMove is None else self.__getAutoTarget(self.__pendingMove)
+            else:
+                selectedTube = self.getTubeForKeyStroke(event.key)
+
+            if selectedTube is not None:
+                self.doMove(selectedTube)
+        elif event.type == pygame.MOUSEWHEEL and event.mod & pygame.KMOD_CTRL:
+            self.setZoom(self.__zoom * 1.25**event.y, event.pos)
+        elif event.type == pygame.MOUSEWHEEL:
+            # A third of a tube per notch; shift turns vertical scrolling into horizontal
+            dx, dy = -event.x*self.__cellSize[0]/3, -event.y*self.__cellSize[1]/3
+            if event.mod & pygame.KMOD_SHIFT:
+                dx, dy = dy, dx
+            self.scrollBy(dx, dy)
+        elif event.type == pygame.KEYDOWN and event.key in (pygame.K_EQUALS, pygame.K_PLUS, pygame.K_KP_PLUS):
+            self.setZoom(self.__zoom * 1.25)
+        elif event.type == pygame.KEYDOWN and event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+            self.setZoom(self.__zoom / 1.25)
+        elif event.type == pygame.KEYDOWN and event.key in (pygame.K_PAGEUP, pygame.K_PAGEDOWN):
+            self.scrollBy(0, self.__rect.height*(-.9 if event.key == pygame.K_PAGEUP else .9))
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            (x,y) = event.pos
+            selectedTube: Optional[Tube] = self.tryFindTubeByPosition((x,y))
+            if selectedTube is not None:
+                self.doMove(selectedTube)
@@ -1,22 +1,35 @@
-import os
 import time
-from typing import Any, Literal, Optional, Tuple
+# Where --profile-startup measures from; importing pygame is part of starting up
+startupStarted = time.perf_counter()
+import argparse
+import os
+import sys
+import tempfile
+from typing import TYPE_CHECKING, Any, Callable, Literal, Optional, Tuple
 import pygame
 from pygame.rect import Rect
 from pygame.event import Event
-import pygame_widgets
-from pygame_widgets.button import Button
+from pygame.surface import Surface
+from Board import Board
+from Fonts import Fonts
+from FrameProfiler import FrameProfiler
 from GameColors import GameColors
+from History import History
+from Journal import Journal
+from PuzzleLibrary import PuzzleLibrary
+from SessionRecorder import SessionRecorder
 from TubeSet import TubeSet
-import json
+if TYPE_CHECKING:
+    # Imported for real once the first frame is up, see __finishStartup
+    from pygame_widgets.button import Button
 
 # To install requirements:
 #  py -m pip uninstall pygame
 #  py -m pip install pygame_widgets
+#  py -m pip install numpy
 
 # TODO:
 # Better like-colors highlight
-# Detect Win and Loss
 
 GameSizes = Literal['big', 'small', 'medium']
 
@@ -27,8 +40,21 @@ class BallSortGame:
     __ButtonRackWidth = __ButtonWidth + 2*__ButtonMargins
     __ButtonHeight = 20
 
-    __buttons: list[Button] = []
+    __buttons: list['Button'] = []
     __lastSize: GameSizes = 'medium'
+    # (tubes, colors, balls per tube) of each of the new game buttons
+    __gameSizes: dict[str, Tuple[int,int,int]] = {'big': (16, 13, 8), 'medium': (12, 10, 5), 'small': (8, 6, 4)}
+    # Redraws are capped at this rate, both in the main loop and during animations
+    __DefaultMaxFps = 60
+    # How many moves can be undone; older ones are forgotten
+    __MaxHistory = 100000
+    # How many of the moves to undo and redo go in each snapshot of the saved game, so saving takes as long
+    # in a long game as in a short one.  The moves made since the snapshot come back from the journal.
+    __SavedHistory = 1000
+    # Dragging the window's edge sends a stream of resizes; the layout is redone once they stop for this long
+    __ResizeSettleTime = .15
+    # How often the profiling summary is redrawn, in seconds
+    __HudInterval = .25
 
     @staticmethod
     def getTubesPosition(screenSize: Tuple[float,float]) -> Rect:
@@ -38,45 +64,90 @@ class BallSortGame:
     @staticmethod
     def getButtonColumnPosition(screenSize: Tuple[float,float]) -> Rect:
         w,h = screenSize
-        return Rect(w - BallSortGame.__ButtonRackWidth, h*.05, BallSortGame.__ButtonRackWidth, h*.95)
+        return Rect(w - BallSortGame.__ButtonRackWidth, 0, BallSortGame.__ButtonRackWidth, h)
 
     @staticmethod
     def getUndoButtonPosition(screenSize: Tuple[float,float]) -> Rect:
         w,_ = screenSize
         return Rect(w + BallSortGame.__ButtonMargins - BallSortGame.__ButtonRackWidth, BallSortGame.__ButtonMargins, BallSortGame.__ButtonWidth, BallSortGame.__ButtonHeight)
         
-    __stateFileName = os.path.join(os.environ['TEMP'], "pyballsort.json")
+    __stateFileName = os.path.join(os.environ.get('TEMP', tempfile.gettempdir()), "pyballsort.json")
 
-    @staticmethod
-    def __load() -> Optional[dict[str,Any]]:
-        try:
-            with open(BallSortGame.__stateFileName, 'r') as stateFile:
-                return json.load(stateFile)
-        except:
-            return None
-    
-    def __save(self) -> None:
-        d = self.__tubes.serialize()
+    def __captureState(self) -> dict[str,Any]:
+        d = self.__tubes.serialize(BallSortGame.__SavedHistory)
         r = self.__window.get_rect()
         d['width'] = r.width
         d['height'] = r.height
         d['size'] = self.__lastSize
-        
-        with open(BallSortGame.__stateFileName, 'w') as stateFile:
-            stateFile.write(json.dumps(d, indent=True))
-        return None
+        return d
 
-    def __init__(self):
-        settings = BallSortGame.__load()
+    def __init__(self, maxFps: int = __DefaultMaxFps, newGame: Optional[Tuple[int,int,int]] = None, recordPath: Optional[str] = None,
+                 showProfile: bool = False, tracePath: Optional[str] = None, startupSteps: Optional[list[Tuple[str, float]]] = None):
+        """
+        newGame, if given, is the (tubes, colors, balls per tube) of a game to start instead of picking up the
+        saved one.  If recordPath is given, the session is recorded there, for SessionPlayer, when the game
+        closes.  showProfile starts the game with the frame time summary showing (F3 toggles it), and if
+        tracePath is given, the time spent on each frame is written there, as a Chrome trace, at the end.
+        startupSteps, if given, are the steps of starting up so far, as (step, when it finished); the rest are
+        added to them, and main prints how long each one took and quits instead of playing.
+        """
+        self.__startupSteps = startupSteps
+        self.__maxFps = maxFps
+        self.__recordPath = recordPath
+        self.__tracePath = tracePath
+        # Only there while something wants the frames timed
+        self.__profiler: Optional[FrameProfiler] = None
+        self.__showProfile = False
+        self.__hudUpdated = 0.0
+        # The dead end message that's on the screen, or None if there isn't one
+        self.__shownDeadEnd: Optional[str] = None
+        # Puzzles for the new game buttons that are ready to go, rather than having to be proven solvable
+        self.__library = PuzzleLibrary.open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "puzzles.lib"))
+        self.__clock = pygame.time.Clock()
+        # The game is saved as it's played, so whatever happens to the process, it picks up where it left off
+        self.__journal = Journal(BallSortGame.__stateFileName, self.__captureState)
+        recovered = self.__journal.recover()
+        settings = recovered[0] if recovered else None
         screenSize = (settings['width'], settings['height']) if settings else (800,600)
         self.__window = pygame.display.set_mode(screenSize, pygame.RESIZABLE, display=0)
-        self.__tubes = TubeSet(self.__window, BallSortGame.getTubesPosition(screenSize))
+        self.__tubes = TubeSet(self.__window, BallSortGame.getTubesPosition(screenSize), BallSortGame.__MaxHistory)
         self.__lastSize = settings['size'] if settings else 'medium'
-        if settings:
-            self.__tubes.loadGame(settings)
+        self.__needsFullUpdate = True
+        # A copy of what's on the screen, shown stretched to fit while the window is being resized
+        self.__frame: Optional[Surface] = None
+        # When to lay things out for the window's new size, if it's being resized, and the input that
+        # arrived in the meantime
+        self.__resizeDeadline: Optional[float] = None
+        self.__heldEvents: list[Event] = []
+        # pygame_widgets.update, once the buttons have been created
+        self.__updateWidgets: Optional[Callable[[list[Event]], None]] = None
+        if newGame is not None:
+            self.__tubes.newGame(*newGame)
+        elif recovered:
+            self.__tubes.loadGame(recovered[0])
+            self.__tubes.replay(recovered[1])
         else:
             self.__tubes.newGame(19, 16, 8)
-        r = BallSortGame.getUndoButtonPosition(screenSize)
+        self.__tubes.journal = self.__journal
+        self.__journal.startGame()
+        if recordPath is not None:
+            self.__tubes.recorder = SessionRecorder(self.__tubes.serialize(), BallSortGame.getTubesPosition(screenSize))
+        if showProfile or tracePath is not None:
+            self.__setProfiler(FrameProfiler(1/maxFps))
+        self.__showProfile = showProfile
+        self.__markStartup('game')
+
+    def __markStartup(self, step: str) -> None:
+        if self.__startupSteps is not None:
+            self.__startupSteps.append((step, time.perf_counter()))
+
+    def __finishStartup(self) -> None:
+        # Whatever isn't needed to show the board, left until it's up.  Creating the first button is what
+        # has pygame look through the system's fonts.
+        pygame.display.set_icon(pygame.image.load(os.path.join(os.path.dirname(os.path.abspath(__file__)), "icon.png")))
+        import pygame_widgets
+        from pygame_widgets.button import Button
+        r = BallSortGame.getUndoButtonPosition(self.__window.get_size())
         for t in [("undo", self.__tubes.undo),
                   ("UNDO", self.__tubes.undoToCheckpoint),
                   ("redo", self.__tubes.redo),
@@ -85,45 +156,160 @@ class BallSortGame:
                   ("new M", lambda: self.__restart('medium')),
                   ("new S", lambda: self.__restart('small'))]:
             text, action = t
+            # Button actions wait their turn behind any input that's held up by an animation
             self.__buttons.append(
-                Button(self.__window, r.left, r.top, r.width, r.height, **{"text": text, "onClick": action})
+                Button(self.__window, r.left, r.top, r.width, r.height, **{"text": text, "onClick": self.__tubes.post, "onClickParams": (action,)})
             )
             r = r.move(0, r.height + BallSortGame.__ButtonMargins)
+        self.__updateWidgets = pygame_widgets.update
+        self.__needsFullUpdate = True
+        self.__markStartup('widgets')
+
+    @staticmethod
+    def __printStartupProfile(steps: list[Tuple[str, float]]) -> None:
+        previous = startupStarted
+        for step, end in steps:
+            print(f'{step:<14} {(end - previous)*1000:7.1f} ms', file=sys.stderr)
+            previous = end
+        firstFrame = next(end for step, end in steps if step == 'first frame')
+        print(f'{"to first frame":<14} {(firstFrame - startupStarted)*1000:7.1f} ms', file=sys.stderr)
+        print(f'{"total":<14} {(steps[-1][1] - startupStarted)*1000:7.1f} ms', file=sys.stderr)
 
-    def __setButtonPos(self, b: Button, r: Rect) -> None:
+    def __setButtonPos(self, b: 'Button', r: Rect) -> None:
         b.setX(r.left) # type: ignore
         b.setY(r.top) # type: ignore
         b.setWidth(r.width) # type: ignore
         b.setHeight(r.height) # type: ignore
 
+    def __previewResize(self) -> None:
+        self.__resizeDeadline = time.time() + BallSortGame.__ResizeSettleTime
+        # The tubes aren't laid out again until the resize settles, but their balls can be rendered meanwhile
+        self.__tubes.warmBallImages(BallSortGame.getTubesPosition(self.__window.get_size()))
+        if self.__frame is not None:
+            pygame.transform.scale(self.__frame, self.__window.get_size(), self.__window)
+        else:
+            self.__window.fill(GameColors.WindowBackground)
+        self.__needsFullUpdate = True
+
+    def __keepFrame(self, updatedAreas: list[Rect]) -> None:
+        if self.__frame is None or self.__frame.get_size() != self.__window.get_size():
+            self.__frame = self.__window.copy()
+        else:
+            self.__frame.blits([(self.__window, r, r) for r in updatedAreas], doreturn=False) # type: ignore
+
     def __onResize(self):
         screenSize = self.__window.get_rect()
+        self.__window.fill(GameColors.WindowBackground)
+        self.__tubes.invalidate()
+        self.__needsFullUpdate = True
         self.__tubes.reposition(BallSortGame.getTubesPosition(screenSize.size)) # type: ignore  Rect rect.Rect
         r = BallSortGame.getUndoButtonPosition(screenSize.size)
         for b in self.__buttons:
             self.__setButtonPos(b, r)
             r = r.move(0, r.height + BallSortGame.__ButtonMargins)
 
+    def __setProfiler(self, profiler: Optional[FrameProfiler]) -> None:
+        self.__profiler = profiler
+        self.__tubes.profiler = profiler
+
+    @staticmethod
+    def getProfileSummaryPosition(screenSize: Tuple[float,float]) -> Rect:
+        w,h = screenSize
+        return Rect(0, h - 18, (w - BallSortGame.__ButtonRackWidth)/2, 18)
+
+    @staticmethod
+    def getStatusPosition(screenSize: Tuple[float,float]) -> Rect:
+        w,h = screenSize
+        return Rect((w - BallSortGame.__ButtonRackWidth)/2, h - 18, (w - BallSortGame.__ButtonRackWidth)/2, 18)
+
+    def __drawStatus(self) -> Optional[Rect]:
+        message = None
+        if self.__tubes.isDeadEnd:
+            undos = self.__tubes.undosToRecover
+            message = "No way to win from here" if undos is None else \
+                f"No way to win from here; undo {undos} move{'s' if undos > 1 else ''} to get back on track"
+        if message == self.__shownDeadEnd and not self.__needsFullUpdate:
+            return None
+        self.__shownDeadEnd = message
+        area = BallSortGame.getStatusPosition(self.__window.get_size())
+        self.__window.fill(GameColors.WindowBackground, area)
+        if message is not None:
+            image = Fonts.get(14).render(message, True, GameColors.KeyboardHintNormal)
+            self.__window.blit(image, (area.right - image.get_width() - 4, area.top + 1))
+        return area
+
+    def __toggleProfileSummary(self) -> None:
+        self.__showProfile = not self.__showProfile
+        if self.__showProfile and self.__profiler is None:
+            self.__setProfiler(FrameProfiler(1/self.__maxFps))
+        elif not self.__showProfile:
+            area = BallSortGame.getProfileSummaryPosition(self.__window.get_size())
+            self.__window.fill(GameColors.WindowBackground, area)
+            pygame.display.update(area)
+            if self.__tracePath is None and self.__profiler is not None and not self.__profiler.isCapturing:
+                self.__setProfiler(None)
+
+    def __toggleCapture(self) -> None:
+        if self.__profiler is None:
+            self.__setProfiler(FrameProfiler(1/self.__maxFps))
+        assert self.__profiler is not None
+        path = os.path.join(os.path.dirname(BallSortGame.__stateFileName), f'pyballsort-{time.strftime("%Y%m%d-%H%M%S")}.prof')
+        if not self.__profiler.toggleCapture(path):
+            print(f'cProfile results written to {path}', file=sys.stderr)
+            if self.__tracePath is None and not self.__showProfile:
+                self.__setProfiler(None)
+
+    def __drawProfileSummary(self, profiler: FrameProfiler) -> Optional[Rect]:
+        now = time.time()
+        if now - self.__hudUpdated < BallSortGame.__HudInterval:
+            return None
+        self.__hudUpdated = now
+        area = BallSortGame.getProfileSummaryPosition(self.__window.get_size())
+        self.__window.fill(GameColors.WindowBackground, area)
+        self.__window.blit(Fonts.get(14).render(profiler.summary, True, GameColors.KeyboardHintNormal), area.move(4, 1))
+        return area
+
     def __restart(self, size: GameSizes) -> None:
-        if size == 'big':
-            self.__tubes.newGame(16, 13, 8)
-        elif size == 'small':
-            self.__tubes.newGame(8, 6, 4)
-        else:
-            self.__tubes.newGame(12, 10, 5)
+        # Set first, so it's in the snapshot that newGame has the journal take
         self.__lastSize = size
+        numTubes, numColors, ballsPerTube = BallSortGame.__gameSizes.get(size, BallSortGame.__gameSizes['medium'])
+        puzzle = self.__library.pick(numTubes, numColors, ballsPerTube) if self.__library is not None else None
+        if puzzle is not None:
+            self.__tubes.playPuzzle(puzzle)
+        else:
+            self.__tubes.newGame(numTubes, numColors, ballsPerTube)
 
     def main(self) -> None:
         pygame.display.set_caption("Ball Sort")
-        pygame.display.set_icon(pygame.image.load("icon.png"))
-        pygame.display.update()
         timeoutInterval = 5 * 60 # After five minutes of inactivity, shut down.
 
+        # The board goes up first, then everything else is loaded
+        self.__window.fill(GameColors.WindowBackground)
+        self.__tubes.update([])
+        pygame.display.update()
+        self.__markStartup('first frame')
+        self.__finishStartup()
+
         closing = False
+        if self.__startupSteps is not None:
+            BallSortGame.__printStartupProfile(self.__startupSteps)
+            closing = True
         timeout = time.time() + timeoutInterval
         while not closing:
             unhandledEvents: list[Event] = []
-            for event in pygame.event.get():
+            if self.__tubes.isAnimating or self.__tubes.hasPendingInput:
+                events = pygame.event.get()
+            else:
+                # Nothing changes on screen except in response to an event, so sleep until one arrives or
+                # it's time to shut down.
+                wakeUp = timeout if self.__resizeDeadline is None else min(timeout, self.__resizeDeadline)
+                firstEvent = pygame.event.wait(max(1, int((wakeUp - time.time())*1000)))
+                events = [] if firstEvent.type == pygame.NOEVENT else [firstEvent] + pygame.event.get()
+            # Checked for None at each step rather than timing nothing, so that not profiling costs nothing
+            profiler = self.__profiler
+            if profiler is not None:
+                profiler.startFrame()
+            for event in events:
                 if event.type == pygame.KEYDOWN or event.type == pygame.MOUSEBUTTONDOWN:
                     timeout = time.time() + timeoutInterval
     
@@ -131,24 +317,119 @@ class BallSortGame:
                     closing = True
                 elif event.type == pygame.KEYDOWN and event.key == pygame.K_F5:
                     self.__restart(self.__lastSize)
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    self.__toggleProfileSummary()
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+                    self.__toggleCapture()
                 elif event.type == pygame.VIDEORESIZE:
-                    self.__onResize()
+                    self.__previewResize()
                 else:
                     unhandledEvents.append(event)
 
             if time.time() > timeout:
                 closing = True
 
-            self.__window.fill(GameColors.WindowBackground)
-            self.__tubes.update(unhandledEvents)
-            if self.__tubes.isWin:
+            if self.__resizeDeadline is not None:
+                if time.time() < self.__resizeDeadline:
+                    # Still being dragged around; just show the preview, and hold on to the input until the
+                    # tubes are where they're going to be.
+                    self.__heldEvents += unhandledEvents
+                    if self.__needsFullUpdate:
+                        pygame.display.update()
+                        self.__needsFullUpdate = False
+                    self.__clock.tick(self.__maxFps)
+                    continue
+                self.__resizeDeadline = None
+                self.__onResize()
+                unhandledEvents = self.__heldEvents + unhandledEvents
+                self.__heldEvents = []
+            # The hot keys may have turned it on or off
+            if profiler is not self.__profiler:
+                profiler = None
+            if profiler is not None:
+                profiler.lap('events')
+
+            updatedAreas = self.__tubes.update(unhandledEvents)
+            if self.__tubes.isWin and not self.__tubes.isAnimating:
                 self.__restart(self.__lastSize)
 
-            time.sleep(.01)
-            pygame_widgets.update(unhandledEvents) # type: ignore   <-- looks like a pylance bug
-            pygame.display.update()
-        self.__save()
+            if self.__updateWidgets is not None:
+                self.__updateWidgets(unhandledEvents)
+            statusArea = self.__drawStatus()
+            if statusArea is not None:
+                updatedAreas.append(statusArea)
+            if profiler is not None:
+                profiler.lap('widgets')
+                if self.__showProfile:
+                    area = self.__drawProfileSummary(profiler)
+                    if area is not None:
+                        updatedAreas.append(area)
+                    profiler.lap('profile summary')
+            if self.__needsFullUpdate:
+                pygame.display.update()
+                self.__needsFullUpdate = False
+                self.__frame = None
+            else:
+                # The buttons only change appearance in response to the mouse
+                if unhandledEvents:
+                    updatedAreas.append(BallSortGame.getButtonColumnPosition(self.__window.get_size()))
+                if updatedAreas:
+                    pygame.display.update(updatedAreas) # type: ignore   Looks like a pylance bug
+            self.__keepFrame(updatedAreas)
+            if profiler is not None:
+                profiler.lap('display')
+                profiler.endFrame()
+            # Keeps animations and floods of events, like mouse movement, from redrawing faster than the cap
+            self.__clock.tick(self.__maxFps)
+        self.__tubes.cancelHint()
+        self.__tubes.cancelAnalysis()
+        self.__journal.close()
+        if self.__library is not None:
+            self.__library.close()
+        if self.__profiler is not None and self.__tracePath is not None:
+            self.__profiler.writeTrace(self.__tracePath)
+        if self.__tubes.recorder is not None and self.__recordPath is not None:
+            self.__tubes.recorder.save(self.__recordPath, self.__tubes.serialize())
+
+
+def initPygame(headless: bool = False) -> None:
+    """
+    Starts up pygame.  In headless mode SDL's dummy video driver is used, so nothing is shown and no display
+    is needed; everything is still drawn, just to memory.  This has to be called before the first window
+    is created.
+    """
+    if headless:
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        os.environ['SDL_AUDIODRIVER'] = 'dummy'
+    pygame.init()
+    pygame.font.init()
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Ball sort puzzle.')
+    parser.add_argument('--headless', action='store_true', help="run without showing a window, using SDL's dummy video driver")
+    parser.add_argument('--new', type=int, nargs=3, metavar=('TUBES', 'COLORS', 'DEPTH'),
+                        help='start a new game of this size, which can be much bigger than the built-in ones (up to 4096 tubes, and 255 colors and balls per tube)')
+    parser.add_argument('--record', metavar='PATH', help='record the session to this file, to be played back with SessionPlayer.py')
+    parser.add_argument('--profile', action='store_true', help='show frame rate and frame times (F3 toggles this while playing, F4 runs cProfile)')
+    parser.add_argument('--trace', metavar='PATH', help="write how long each part of each frame took to this file, for Chrome's trace viewer")
+    parser.add_argument('--profile-startup', action='store_true', help='print how long it took to get the first frame on the screen, and quit')
+    args = parser.parse_args(argv)
+    if args.new:
+        numTubes, numColors, depth = args.new
+        if numTubes > History.maxTubes:
+            parser.error(f'--new: there can be at most {History.maxTubes} tubes')
+        if not 0 < numColors <= min(numTubes, Board.maxColors):
+            parser.error(f'--new: there has to be at least one color, no more colors than tubes, and at most {Board.maxColors} colors')
+        if not 0 < depth <= Board.maxDepth:
+            parser.error(f'--new: tubes have to hold at least one ball and at most {Board.maxDepth}')
+    startupSteps = [('imports', time.perf_counter())] if args.profile_startup else None
+    initPygame(args.headless)
+    if startupSteps is not None:
+        startupSteps.append(('pygame.init', time.perf_counter()))
+    BallSortGame(newGame=tuple(args.new) if args.new else None, recordPath=args.record, showProfile=args.profile, tracePath=args.trace,
+                 startupSteps=startupSteps).main()
+
 
-pygame.init()
-pygame.font.init()
-BallSortGame().main()
+if __name__ == '__main__':
+    main()
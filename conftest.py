@@ -0,0 +1,13 @@
+import os
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import pygame
+import pytest
+from ballsort import initPygame
+
+
+@pytest.fixture(scope='session')
+def window():
+    initPygame(headless=True)
+    yield pygame.display.set_mode((800, 600))
+    pygame.quit()
@@ -0,0 +1,40 @@
+from Board import Board
+
+
+def test_move_and_back_restores_board_and_hashes():
+    board = Board.fromTubes([[0, 1, 1], [0], [], [1]], 3)
+    before = board.copy()
+    assert board.move(0, 3) == 2
+    assert board.tubeContents(0) == [0]
+    assert board.tubeContents(3) == [1, 1, 1]
+    assert board.zobristHash != before.zobristHash
+    board.move(3, 0, 2)
+    assert board == before
+    assert board.zobristHash == before.zobristHash
+    assert board.unorderedHash == before.unorderedHash
+
+
+def test_hashes_match_a_board_built_from_scratch():
+    board = Board.fromTubes([[0, 1], [1, 0], []], 2)
+    board.move(0, 2)
+    board.move(1, 0)
+    rebuilt = Board.fromTubes([[0, 0], [1], [1]], 2)
+    assert board == rebuilt
+    assert board.zobristHash == rebuilt.zobristHash
+    assert board.unorderedHash == rebuilt.unorderedHash
+
+
+def test_unordered_hash_ignores_tube_order():
+    a = Board.fromTubes([[0, 1], [1, 0], []], 2)
+    b = Board.fromTubes([[], [1, 0], [0, 1]], 2)
+    assert a.unorderedHash == b.unorderedHash
+    assert a.zobristHash != b.zobristHash
+
+
+def test_win():
+    board = Board.fromTubes([[0, 1], [1, 0], []], 2)
+    for move in [(0, 2), (1, 0)]:
+        board.move(*move)
+        assert not board.isWin
+    board.move(2, 1)
+    assert board.isWin
@@ -0,0 +1,73 @@
+from History import History
+
+
+def test_undo_redo_round_trip():
+    history = History()
+    history.reset(2)
+    moves = [(0, 1, 1), (4095, 7, 255), (3, 2, 4)]
+    for move in moves:
+        history.push(move, 1)
+    assert history.undoMoves() == moves
+    assert history.undo() == moves[2]
+    assert history.undo() == moves[1]
+    assert history.undoMoves() == moves[:1]
+    assert history.redoMoves() == moves[1:]
+    assert history.redo() == moves[1]
+    assert history.position == 2
+    assert history.canUndo and history.canRedo
+
+
+def test_push_forgets_the_moves_to_redo():
+    history = History()
+    history.push((0, 1, 1), 0)
+    history.push((1, 2, 1), 0)
+    history.undo()
+    history.push((2, 3, 1), 0)
+    assert history.undoMoves() == [(0, 1, 1), (2, 3, 1)]
+    assert not history.canRedo
+    assert history.redo() is None
+
+
+def test_rewind_returns_undone_moves_most_recent_first():
+    history = History()
+    moves = [(i, i + 1, 1) for i in range(5)]
+    for move in moves:
+        history.push(move, 0)
+    assert history.rewind(2) == [moves[4], moves[3], moves[2]]
+    assert history.position == 2
+    assert history.redoMoves() == moves[2:]
+    # Rewinding forward doesn't do anything, and rewinding too far stops at the start
+    assert history.rewind(4) == []
+    assert history.rewind(-3) == [moves[1], moves[0]]
+    assert history.position == 0
+    assert history.undo() is None
+
+
+def test_checkpoint_is_the_last_position_with_more_empty_tubes():
+    history = History()
+    history.reset(2)
+    for emptyTubes in [1, 2, 1, 0, 1]:
+        history.push((0, 1, 1), emptyTubes)
+    # Positions 0 to 5 had 2, 1, 2, 1, 0, 1 empty tubes
+    assert history.checkpoint == 2
+    history.rewind(4)
+    assert history.checkpoint == 3
+    history.rewind(3)
+    assert history.checkpoint == 2
+    # Nothing before position 2 had more than 2, so it goes back to the start
+    history.rewind(2)
+    assert history.checkpoint == 0
+
+
+def test_max_moves_forgets_the_oldest():
+    history = History(maxMoves=8)
+    moves = [(i, i + 1, 1) for i in range(20)]
+    for move in moves:
+        history.push(move, 0)
+    remembered = history.undoMoves()
+    assert len(remembered) <= 8
+    assert remembered == moves[-len(remembered):]
+    assert history.position == 20
+    history.rewind(0)
+    assert history.position == 20 - len(remembered)
+    assert history.checkpoint == history.position
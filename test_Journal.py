@@ -0,0 +1,59 @@
+from Journal import Journal
+
+
+def journal(tmp_path, state: dict, snapshotInterval: int = 4) -> Journal:
+    return Journal(str(tmp_path / 'game.json'), lambda: dict(state), snapshotInterval)
+
+
+def test_recovers_snapshot_and_records_after_it(tmp_path):
+    state = {'moves': 0}
+    j = journal(tmp_path, state)
+    j.startGame()
+    for i in range(6):
+        state['moves'] += 1
+        j.append(Journal.MOVE, i, i + 1, 1)
+    j.append(Journal.UNDO)
+    # Abandoned rather than closed, as if the game went down; the snapshot after the fourth move is on disk
+    j.snapshot().result()
+    j.append(Journal.REDO)
+
+    recovered = journal(tmp_path, {}).recover()
+    assert recovered is not None
+    snapshot, records = recovered
+    assert snapshot == {'moves': 6}
+    assert records == [(Journal.REDO, 0, 0, 0)]
+
+
+def test_drops_partly_written_record(tmp_path):
+    j = journal(tmp_path, {}, snapshotInterval=100)
+    j.startGame()
+    j.snapshot().result()
+    j.append(Journal.MOVE, 1, 2, 3)
+    j.append(Journal.MOVE, 2, 1, 3)
+    # The first game's journal is the second of the two files
+    with open(tmp_path / 'game.journal2', 'r+b') as f:
+        f.truncate(f.seek(0, 2) - 1)
+
+    recovered = journal(tmp_path, {}).recover()
+    assert recovered == ({}, [(Journal.MOVE, 1, 2, 3)])
+
+
+def test_new_game_keeps_old_journal_until_its_snapshot_is_written(tmp_path):
+    state = {'game': 1}
+    j = journal(tmp_path, state, snapshotInterval=100)
+    j.startGame()
+    j.append(Journal.MOVE, 1, 2, 1)
+    j.close()
+
+    # The second game's journal goes in the other file, so the first game's snapshot can still find its own
+    j = journal(tmp_path, {'game': 2}, snapshotInterval=100)
+    assert j.recover() == ({'game': 1}, [])
+    j.startGame()
+    j.append(Journal.MOVE, 3, 4, 2)
+    j.close()
+    assert (tmp_path / 'game.journal').exists() and (tmp_path / 'game.journal2').exists()
+    assert journal(tmp_path, {}).recover() == ({'game': 2}, [])
+
+
+def test_no_snapshot(tmp_path):
+    assert journal(tmp_path, {}).recover() is None
@@ -0,0 +1,12 @@
+import time
+
+from PuzzleGenerator import PuzzleGenerator
+
+
+def test_generate_stays_within_total_time_limit():
+    # Big enough that proving a deal solvable usually runs out of time, so every attempt would use it all
+    generator = PuzzleGenerator(timeLimit=.5)
+    start = time.perf_counter()
+    generator.generate(40, 37, 8, seed=1, totalTimeLimit=.5)
+    assert time.perf_counter() - start < .5 + .25
+
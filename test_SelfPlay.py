@@ -0,0 +1,23 @@
+from Board import Board
+from PuzzleGenerator import PuzzleGenerator
+from SelfPlay import SelfPlay, heuristicMoves
+
+
+def firstMoves(board: Board):
+    return board.validMoves()
+
+
+def test_plugged_in_policy(monkeypatch):
+    monkeypatch.setitem(SelfPlay.policies, 'first', firstMoves)
+    report = SelfPlay(maxMoves=200, workers=1).run(['small'], ['first', 'heuristic'], range(4))
+    assert [r['policy'] for r in report] == ['first', 'heuristic']
+    assert all(r['games'] == 4 for r in report)
+
+
+def test_play_is_repeatable_and_leaves_the_board_alone():
+    board = PuzzleGenerator.dealToBoard(PuzzleGenerator.deal(6, 4, 1), 8, 6, 4)
+    before = board.copy()
+    first = SelfPlay.play(heuristicMoves, board, 1000)
+    assert board == before
+    assert first[1] > 0
+    assert SelfPlay.play(heuristicMoves, board, 1000) == first
@@ -0,0 +1,69 @@
+import time
+
+import pygame
+import pytest
+from SessionPlayer import SessionPlayer
+from SessionRecorder import SessionRecorder
+from TubeSet import TubeSet
+from pygame.event import Event
+from pygame.rect import Rect
+
+
+def record(window) -> dict:
+    # A new game, then a hint and the move it suggests, as fast as the input can be handled.  Played back in
+    # real time, the hint and the input come while the new game is still flying in.
+    rect = Rect(0, 0, 700, 560)
+    tubes = TubeSet(window, rect)
+    tubes.newGame(8, 6, 4, seed=1)
+    tubes.finishAnimations()
+    tubes.recorder = SessionRecorder(tubes.serialize(), rect)
+    tubes.newGame(8, 6, 4, seed=2)
+    tubes.finishAnimations()
+    tubes.update([Event(pygame.KEYDOWN, key=pygame.K_TAB, mod=0)])
+    while tubes.isHintPending:
+        tubes.update([])
+    tubes.update([])
+    tubes.update([Event(pygame.KEYDOWN, key=pygame.K_SPACE, mod=0)])
+    tubes.finishAnimations()
+    tubes.cancelAnalysis()
+    session = tubes.recorder.session(tubes.serialize())
+    assert session['final']['undoStack']
+    return session
+
+
+@pytest.mark.parametrize('realTime', [False, True])
+def test_playback_matches(window, realTime):
+    session = record(window)
+    player = SessionPlayer(window, session)
+    player.play(realTime=realTime)
+    player.tubes.cancelAnalysis()
+    assert player.matches
+
+
+def test_playback_throughput(window):
+    # The game's solution clicked through, then undone and redone a few times over
+    rect = Rect(0, 0, 700, 560)
+    tubes = TubeSet(window, rect)
+    tubes.newGame(8, 6, 4, seed=3)
+    tubes.finishAnimations()
+    tubes.recorder = SessionRecorder(tubes.serialize(), rect)
+    solution = tubes.findSolution()
+    assert solution
+    for record in solution:
+        for tube in (record.source, record.target):
+            tubes.update([Event(pygame.MOUSEBUTTONDOWN, button=1, pos=tube.rect.center)], draw=False)
+            tubes.finishAnimations()
+    for _ in range(10):
+        for key in (pygame.K_z, pygame.K_y):
+            for _ in solution:
+                tubes.update([Event(pygame.KEYDOWN, key=key, mod=pygame.KMOD_CTRL)], draw=False)
+                tubes.finishAnimations()
+    tubes.cancelAnalysis()
+    session = tubes.recorder.session(tubes.serialize())
+
+    player = SessionPlayer(window, session)
+    start = time.perf_counter()
+    player.play()
+    elapsed = time.perf_counter() - start
+    assert player.matches
+    assert len(session['entries']) / elapsed > 1000
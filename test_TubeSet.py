@@ -0,0 +1,40 @@
+import time
+
+from TubeSet import TubeSet
+from pygame.rect import Rect
+
+
+def test_newGame_stays_within_hint_time_limit(window):
+    # Big enough that proving a deal solvable usually runs out of time, but not so big that it isn't tried
+    tubes = TubeSet(window, Rect(0, 0, 700, 560))
+    tubes.hintTimeLimit = .5
+    start = time.perf_counter()
+    tubes.newGame(40, 37, 8, seed=1)
+    elapsed = time.perf_counter() - start
+    tubes.finishAnimations()
+    tubes.cancelAnalysis()
+    assert elapsed < tubes.hintTimeLimit + .5
+    assert tubes.numTotalTubes == 40
+
+
+def test_serialize_keeps_only_recent_history(window):
+    tubes = TubeSet(window, Rect(0, 0, 700, 560))
+    tubes.newGame(8, 6, 4, seed=1)
+    tubes.finishAnimations()
+    solution = tubes.findSolution()
+    assert solution and len(solution) > 3
+    for record in solution:
+        tubes.doMove(record.source)
+        tubes.doMove(record.target)
+        tubes.finishAnimations()
+    tubes.undo()
+    tubes.finishAnimations()
+    full = tubes.serialize()
+    state = tubes.serialize(maxHistory=2)
+    assert state['undoStack'] == full['undoStack'][-2:]
+    assert state['redoStack'] == full['redoStack']
+
+    tubes.loadGame(state)
+    tubes.finishAnimations()
+    assert tubes.serialize() == state
+    tubes.cancelAnalysis()